@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Сравнение проверки целостности afick -k с обычным приоритетом (прежний запуск
+службы afick) и с пониженным приоритетом процессора и ввода-вывода, как в
+afick.service (nice 19, ionice idle), на синтетическом дереве файлов: время
+проверки и влияние на параллельно запускаемые службы (как при загрузке).
+Влияние оценивается задержкой эталонной нагрузки (хэширование в памяти
+и чтение файлов), повторяемой во время проверки, относительно ее задержки
+без проверки. Перед замерами база создается (afick -i), что заодно заполняет
+страничный кэш, чтобы обе проверки выполнялись в одинаковых условиях
+
+python benchmarks/afick_scan.py [--files 10000] [--afick /usr/bin/afick]
+"""
+
+from __future__ import print_function
+
+import argparse
+import hashlib
+import multiprocessing
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+# Приоритеты службы afick (Nice=19, IOSchedulingClass=idle в afick.service)
+LOWERED = ["nice", "-n", "19", "ionice", "-c", "3"]
+
+timer = getattr(time, "perf_counter", time.time)
+
+
+def make_tree(root, count):
+    random.seed(1)
+    for i in range(count):
+        directory = os.path.join(root, "d%02d" % (i % 40), "s%02d" % (i % 13))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        # Большинство файлов небольшие, каждый сотый - около мегабайта
+        size = random.randint(1, 1024) * 1024 if i % 100 == 0 else random.randint(100, 16384)
+        with open(os.path.join(directory, "f%06d" % i), "wb") as stream:
+            stream.write(os.urandom(size))
+
+
+def write_config(workdir, tree):
+    path = os.path.join(workdir, "afick.conf")
+    with open(path, "w") as config:
+        config.write("history := %s\n" % os.path.join(workdir, "history"))
+        config.write("archive := %s\n" % os.path.join(workdir, "archive"))
+        config.write("database := %s\n" % os.path.join(workdir, "afick"))
+        config.write("exclude_suffix := log tmp\n")
+        config.write("ETC = p+d+i+n+u+g+s+b+md5+m\n")
+        config.write("%s ETC\n" % tree)
+    return path
+
+
+def probe(stop, latencies):
+    # Эталонная нагрузка запускаемой службы
+    data = os.urandom(1024 * 1024)
+    while not stop.is_set():
+        started = timer()
+        for _ in range(8):
+            hashlib.sha256(data).digest()
+        latencies.append(timer() - started)
+        time.sleep(0.05)
+
+
+def measure(command):
+    manager = multiprocessing.Manager()
+    latencies = manager.list()
+    stop = multiprocessing.Event()
+    prober = multiprocessing.Process(target=probe, args=(stop, latencies))
+    prober.start()
+    started = timer()
+    if command:
+        # afick возвращает ненулевой код при обнаружении изменений
+        subprocess.call(command, stdout=open(os.devnull, "w"))
+    else:
+        time.sleep(3)
+    elapsed = timer() - started
+    stop.set()
+    prober.join()
+    values = sorted(latencies)
+    return elapsed, values[len(values) // 2] * 1000, values[len(values) * 95 // 100] * 1000
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Время проверки целостности и влияние на параллельные службы")
+    arg_parser.add_argument("--files", type=int, default=10000)
+    arg_parser.add_argument("--afick", default="afick", help="путь к исполняемому файлу afick")
+    args = arg_parser.parse_args()
+
+    try:
+        subprocess.check_call([args.afick, "--version"], stdout=open(os.devnull, "w"))
+    except (OSError, subprocess.CalledProcessError):
+        print("afick is not found, use --afick", file=sys.stderr)
+        sys.exit(2)
+
+    workdir = tempfile.mkdtemp(prefix="afick-")
+    try:
+        tree = os.path.join(workdir, "tree")
+        make_tree(tree, args.files)
+        config = write_config(workdir, tree)
+        # Создание базы, заодно заполняющее страничный кэш
+        subprocess.check_call([args.afick, "-c", config, "-i"], stdout=open(os.devnull, "w"))
+
+        compare = [args.afick, "-c", config, "-k"]
+        runs = [("idle (no scan)", None),
+                ("afick -k", compare),
+                ("nice/ionice", LOWERED + compare)]
+        print("%-16s %9s %14s %14s" % ("run", "wall, s", "probe p50, ms", "probe p95, ms"))
+        for name, command in runs:
+            print("%-16s %9.2f %14.1f %14.1f" % ((name,) + measure(command)))
+        with open(os.path.join(workdir, "history")) as history:
+            print(history.read().splitlines()[-1])
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
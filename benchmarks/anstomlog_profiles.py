@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+Затраты callback-плагина anstomlog на одно событие в каждом профиле вывода
+(tiny, normal, verbose) на синтетическом прогоне: N хостов x M задач,
+для каждой пары задача-хост вызываются v2_runner_on_start и v2_runner_on_ok
+или v2_runner_on_skipped. Вывод плагина направляется в /dev/null
+
+python benchmarks/anstomlog_profiles.py [--hosts 1000] [--tasks 50] [--profile-tasks]
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+import time
+
+from ansible.executor.task_result import TaskResult
+from ansible.inventory.host import Host
+from ansible.playbook.task import Task
+from ansible.plugins.loader import callback_loader
+
+CALLBACKS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "callbacks")
+PROFILES = ("tiny", "normal", "verbose")
+
+timer = getattr(time, "perf_counter", time.time)
+
+
+def make_tasks(count):
+    tasks = []
+    for i in range(count):
+        task = Task()
+        task.name = "task %d" % i
+        task.action = "command"
+        tasks.append(task)
+    return tasks
+
+
+def make_result(host, task, i):
+    # Каждый десятый результат - пропущенная задача, каждый пятый - измененный
+    # с выводом команды, остальные - успешные без изменений
+    if i % 10 == 0:
+        return "skipped", TaskResult(host, task, {"skipped": True, "changed": False}, {})
+    data = {"changed": i % 5 == 0, "rc": 0, "cmd": ["true"], "stdout": "", "stdout_lines": []}
+    if data["changed"]:
+        data["stdout"] = "\n".join("line %d" % n for n in range(20))
+        data["stdout_lines"] = data["stdout"].splitlines()
+    return "ok", TaskResult(host, task, data, {})
+
+
+def run(profile, hosts, tasks, profile_tasks):
+    callback = callback_loader.get("anstomlog")
+    callback.set_options(direct={"output_profile": profile, "profile_tasks": profile_tasks})
+    events = 0
+    started = timer()
+    for task in tasks:
+        callback.v2_playbook_on_task_start(task, False)
+        for i, host in enumerate(hosts):
+            status, result = make_result(host, task, i)
+            callback.v2_runner_on_start(host, task)
+            if status == "skipped":
+                callback.v2_runner_on_skipped(result)
+            else:
+                callback.v2_runner_on_ok(result)
+            events += 1
+    elapsed = timer() - started
+    return events, elapsed
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Затраты anstomlog на событие в каждом профиле вывода")
+    arg_parser.add_argument("--hosts", type=int, default=1000)
+    arg_parser.add_argument("--tasks", type=int, default=50)
+    arg_parser.add_argument("--profile-tasks", action="store_true",
+                            help="собирать длительность задач (profile_tasks)")
+    args = arg_parser.parse_args()
+
+    callback_loader.add_directory(CALLBACKS)
+    hosts = [Host("host-%04d" % i) for i in range(args.hosts)]
+    tasks = make_tasks(args.tasks)
+
+    # Результаты создаются и в пустом прогоне, чтобы вычесть их стоимость
+    started = timer()
+    for task in tasks:
+        for i, host in enumerate(hosts):
+            make_result(host, task, i)
+    baseline = timer() - started
+
+    stdout = sys.stdout
+    timings = []
+    for profile in PROFILES:
+        sys.stdout = open(os.devnull, "w")
+        try:
+            timings.append((profile,) + run(profile, hosts, tasks, args.profile_tasks))
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+
+    print("%d hosts x %d tasks" % (args.hosts, args.tasks))
+    for profile, events, elapsed in timings:
+        print("%-8s %8.2f s %8.1f us/event" % (profile, elapsed, (elapsed - baseline) / events * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+Зависимость затрат на отбор строк audit.log по ключам правил аудита
+от числа ключей: цепочка отдельных регулярных выражений (как было
+в f_all_critical_events), одно регулярное выражение с альтернативами
+(как формируется из astra-custom.rules) и поиск значения key= в множестве
+
+python benchmarks/audit_keys.py [--lines N]
+"""
+
+from __future__ import print_function
+
+import argparse
+import random
+import re
+import time
+
+timer = getattr(time, "perf_counter", time.time)
+
+KEY_COUNTS = (7, 25, 100, 400)
+
+LINE = ('type=SYSCALL msg=audit(1755000675.%03d:%d): arch=c000003e syscall=59 success=yes exit=0'
+        ' a0=55d a1=55d a2=55d a3=0 items=2 ppid=1200 pid=1300 auid=1000 uid=0 gid=0 euid=0 suid=0'
+        ' fsuid=0 egid=0 sgid=0 fsgid=0 tty=pts0 ses=3 comm="useradd" exe="/usr/sbin/useradd" key="%s"')
+
+
+def chained(keys):
+    patterns = [re.compile(key) for key in keys]
+    return lambda line: any(pattern.search(line) for pattern in patterns)
+
+
+def alternation(keys):
+    pattern = re.compile('key="(%s)"' % "|".join(keys))
+    return lambda line: pattern.search(line) is not None
+
+
+def key_set(keys):
+    keys = frozenset(keys)
+
+    def match(line):
+        start = line.rfind(' key="')
+        return start >= 0 and line[start + 6:line.find('"', start + 6)] in keys
+    return match
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Замер затрат на фильтрацию audit.log по ключам")
+    arg_parser.add_argument("--lines", type=int, default=20000)
+    args = arg_parser.parse_args()
+
+    print("%6s %14s %14s %14s" % ("keys", "chained,us", "alternation,us", "key set,us"))
+    for count in KEY_COUNTS:
+        keys = ["rule_%03d_modification" % i for i in range(count)]
+        # Половина строк с ключами из правил, половина с посторонними ключами
+        lines = [LINE % (i % 1000, i, random.choice(keys) if i % 2 else "(null)") for i in range(args.lines)]
+        costs = []
+        for build in (chained, alternation, key_set):
+            match = build(keys)
+            started = timer()
+            matched = sum(1 for line in lines if match(line))
+            costs.append((timer() - started) / len(lines) * 1e6)
+            assert matched == args.lines // 2
+        print("%6d %14.2f %14.2f %14.2f" % ((count,) + tuple(costs)))
+
+
+if __name__ == "__main__":
+    main()
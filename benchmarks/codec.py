@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+Сравнение затрат на формирование и разбор уведомления в формате JSON
+(notification_codec) и в прежнем формате с полями, разделенными символом ;
+
+python benchmarks/codec.py [--count N]
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "roles", "syslog-ng", "files"))
+
+import notification_codec
+
+timer = getattr(time, "perf_counter", time.time)
+
+PRIORITY = "critical"
+TITLE = "Угроза вредоносного ПО"
+TIME = "2025-08-12 14:31:15"
+HOST = "arm-o-1"
+LINES = ['Обнаружена угроза: "/home/astra-admin/Загрузки/archive.zip/dir1/eicar.com"',
+         " - infected with EICAR Test File (NOT a Virus!)"]
+
+
+def legacy_encode():
+    return ";".join((PRIORITY, TITLE, ";".join([TIME, HOST] + LINES)))
+
+
+def legacy_decode(line):
+    # Так уведомление разбиралось в CustomDbusService.send
+    priority, title = line.split(";")[:2]
+    return priority, title, "\n".join(line.split(";")[2:])
+
+
+def json_encode():
+    return notification_codec.encode(PRIORITY, TITLE, TIME, HOST, LINES)
+
+
+def json_decode(line):
+    notification = notification_codec.decode(line)
+    return notification.priority, notification.title, notification.text()
+
+
+def size(line):
+    if not isinstance(line, bytes):
+        line = line.encode("utf-8")
+    return len(line)
+
+
+def measure(name, func, count, *args):
+    started = timer()
+    for _ in range(count):
+        func(*args)
+    elapsed = timer() - started
+    print("%-16s %8.2f us/op" % (name, elapsed / count * 1e6))
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Замер затрат на кодирование уведомлений")
+    arg_parser.add_argument("--count", type=int, default=100000)
+    args = arg_parser.parse_args()
+
+    legacy_line = legacy_encode()
+    json_line = json_encode()
+    print("size: legacy %d bytes, json %d bytes" % (size(legacy_line), size(json_line)))
+    measure("legacy encode", legacy_encode, args.count)
+    measure("json encode", json_encode, args.count)
+    measure("legacy decode", legacy_decode, args.count, legacy_line)
+    measure("json decode", json_decode, args.count, json_line)
+
+
+if __name__ == "__main__":
+    main()
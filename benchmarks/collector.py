@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+Нагрузочная проверка сборщика уведомлений АРМ-АБИ: заданное число хостов
+одновременно передает уведомления нескольких источников по TCP (RFC 6587),
+сборщик передает их в приемник, заменяющий syslog-ng. Проверяется,
+что все уведомления доставлены без потерь и без повторов, выводятся
+пропускная способность и статистика сборщика по источникам
+
+python3 benchmarks/collector.py [--hosts 300] [--count 200] [--workers 2]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+FILES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "roles", "syslog-ng", "files")
+sys.path.insert(0, FILES)
+sys.path.insert(0, os.path.join(FILES, "collector"))
+
+import notification_codec
+import notification_collector
+from octet_framing import FrameDecoder, encode_frames
+
+TITLES = ("Угроза вредоносного ПО", "Нарушение целостности", "Событие аудита", "Ребус-СОВ")
+# Число уведомлений в одной записи хоста (flush-lines в syslog-ng)
+BATCH_SIZE = 100
+
+
+async def sink(received, reader, writer):
+    decoder = FrameDecoder()
+    try:
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            for frame in decoder.feed(data):
+                notification = notification_codec.decode(frame.decode("utf-8"))
+                received.append((notification.host, notification.lines[0]))
+    finally:
+        writer.close()
+
+
+async def host(index, port, count):
+    _, writer = await asyncio.open_connection("127.0.0.1", port)
+    name = "arm-o-%d" % index
+    batch = []
+    for number in range(count):
+        batch.append(notification_codec.encode("critical", TITLES[number % len(TITLES)],
+                                               time.strftime(notification_codec.TIME_FORMAT), name,
+                                               [str(number), 'Обнаружена угроза: "/tmp/eicar"']))
+        if len(batch) == BATCH_SIZE or number == count - 1:
+            writer.write(encode_frames(batch))
+            await writer.drain()
+            batch = []
+    writer.close()
+
+
+async def run(args):
+    received = []
+    # Задачи приемника сохраняются, чтобы завершить их до остановки цикла событий
+    sinks = []
+    sink_server = await asyncio.start_server(
+        lambda r, w: sinks.append(asyncio.ensure_future(sink(received, r, w))), "127.0.0.1", 0)
+    sink_port = sink_server.sockets[0].getsockname()[1]
+
+    options = argparse.Namespace(forward="127.0.0.1:%d" % sink_port, workers=args.workers,
+                                 queue_size=args.queue_size, dedup_window=5, stats_interval=3600,
+                                 stats_file=None)
+    collector = notification_collector.Collector(options)
+    server = await asyncio.start_server(
+        lambda r, w: notification_collector.handle_tcp(collector, r, w), "127.0.0.1", 0,
+        backlog=notification_collector.BACKLOG)
+    port = server.sockets[0].getsockname()[1]
+    forwarder = asyncio.ensure_future(collector.forwarder())
+
+    total = args.hosts * args.count
+    started = time.time()
+    await asyncio.gather(*[host(index, port, args.count) for index in range(args.hosts)])
+    while len(received) < total and time.time() - started < args.timeout:
+        await asyncio.sleep(0.05)
+    elapsed = time.time() - started
+    stats = collector.stats()
+    tasks = [forwarder] + [task for source in collector.sources.values() for task in source.tasks] + sinks
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    server.close()
+    sink_server.close()
+    await server.wait_closed()
+    await sink_server.wait_closed()
+    return total, received, elapsed, stats
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Нагрузочная проверка сборщика уведомлений")
+    arg_parser.add_argument("--hosts", type=int, default=300)
+    arg_parser.add_argument("--count", type=int, default=200, help="уведомлений от каждого хоста")
+    arg_parser.add_argument("--workers", type=int, default=notification_collector.WORKERS)
+    arg_parser.add_argument("--queue-size", type=int, default=1000)
+    arg_parser.add_argument("--timeout", type=float, default=120)
+    args = arg_parser.parse_args()
+
+    total, received, elapsed, stats = asyncio.run(run(args))
+    unique = len(set(received))
+    for name, source in sorted(stats["sources"].items()):
+        print("%-24s %s" % (name, ", ".join("%s=%s" % item for item in sorted(source.items())
+                                            if item[0] != "rate")))
+    print("hosts %d, sent %d, received %d, lost %d, duplicated %d, %.0f msg/s"
+          % (args.hosts, total, len(received), total - unique, len(received) - unique, len(received) / elapsed))
+    sys.exit(0 if unique == total == len(received) else 1)
+
+
+if __name__ == "__main__":
+    main()
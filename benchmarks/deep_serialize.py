@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Сравнение скорости прежней и текущей реализации deep_serialize
+из callback-плагина anstomlog на результатах задач размером в несколько МБ
+(длинный stdout, stdout_lines и результаты задач с циклом).
+Выводы обеих реализаций сравниваются побайтно
+
+python benchmarks/deep_serialize.py [--lines N]
+"""
+
+from __future__ import print_function
+
+import argparse
+import copy
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "callbacks"))
+
+from anstomlog import deep_serialize, PREFERED_FIELDS, DELETABLE_FIELDS
+
+timer = getattr(time, "perf_counter", time.time)
+
+
+def legacy_deep_serialize(data, indent=0):
+    # Прежняя реализация, сохраненная для сравнения
+    padding = " " * indent * 2
+    if isinstance(data, list):
+        if data == []:
+            return "[]"
+        output = "[ "
+        if len(data) == 1:
+            output = output + \
+                ("\n" +
+                 padding).join(legacy_deep_serialize(data[0], 0).splitlines()) + " ]"
+        else:
+            list_padding = " " * (indent + 1) * 2
+
+            for item in data:
+                output = output + "\n" + list_padding + "- " + \
+                    legacy_deep_serialize(item, indent)
+            output = output + "\n" + padding + " ]"
+    elif isinstance(data, dict):
+        if "_ansible_no_log" in data and data["_ansible_no_log"]:
+            data = {"censored":
+                    "the output has been hidden due to the fact that"
+                    " 'no_log: true' was specified for this result"}
+        list_padding = " " * (indent + 1) * 2
+        output = "{\n"
+
+        for key in PREFERED_FIELDS:
+            if key in data.keys():
+                value = data[key]
+                prefix = list_padding + "- %s: " % key
+                output = output + prefix + "%s\n" % \
+                    "\n".join([" " * len(prefix) + line
+                               for line in legacy_deep_serialize(value, indent)
+                               .splitlines()]).strip()
+
+        for key in DELETABLE_FIELDS:
+            if key in data.keys():
+                del data[key]
+
+        for key, value in data.items():
+            output = output + list_padding + \
+                "- %s: %s\n" % (key, legacy_deep_serialize(value, indent + 1))
+
+        output = output + padding + "}"
+    else:
+        string_form = str(data)
+        if len(string_form) == 0:
+            return "\"\""
+
+        return string_form
+    return output
+
+
+def command_result(lines):
+    stdout = "\n".join("line %d: %s" % (i, "x" * random.randint(0, 80)) for i in range(lines))
+    return {"cmd": ["cat", "/var/log/syslog"], "rc": 0, "stdout": stdout, "stderr": "",
+            "stdout_lines": stdout.splitlines(), "changed": True, "delta": "0:00:00.105046",
+            "start": "2025-08-12 14:31:15.146545", "end": "2025-08-12 14:31:15.251591",
+            "invocation": {"module_args": {"_raw_params": "cat /var/log/syslog", "chdir": None}}}
+
+
+def loop_result(items):
+    return {"changed": True, "msg": "All items completed",
+            "results": [dict(command_result(20), item="host-%d" % i, ansible_loop_var="item")
+                        for i in range(items)]}
+
+
+def measure(name, func, result):
+    started = timer()
+    output = func(copy.deepcopy(result))
+    elapsed = timer() - started
+    print("%-22s %8.3f s" % (name, elapsed))
+    return output
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Замер скорости deep_serialize")
+    arg_parser.add_argument("--lines", type=int, default=50000, help="строк в stdout задачи")
+    arg_parser.add_argument("--items", type=int, default=5000, help="элементов цикла")
+    args = arg_parser.parse_args()
+
+    for name, result in (("command", command_result(args.lines)), ("loop", loop_result(args.items))):
+        print("%s result:" % name)
+        legacy = measure("  legacy deep_serialize", legacy_deep_serialize, result)
+        current = measure("  deep_serialize", deep_serialize, result)
+        assert legacy == current, "outputs differ"
+        print("  output %.1f MB, identical" % (len(current) / 1048576.0))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+Скорость записи уведомлений в хранилище АРМ-АБИ и время выборок по индексам.
+Синтетические уведомления сотен хостов за несколько суток записываются
+потоком EventStore пачками в сегменты по суткам, после чего выполняются
+типичные выборки, например все критические уведомления хоста за сутки
+
+python benchmarks/event_store.py [--count 2000000] [--hosts 300] [--days 3]
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "roles", "syslog-ng", "files"))
+
+import notification_codec
+import event_store
+
+SOURCES = ("Угроза вредоносного ПО", "Нарушение целостности", "Событие аудита", "Ребус-СОВ")
+# Из 100 уведомлений 2 критических и 18 предупреждений
+PRIORITIES = ["critical"] * 2 + ["normal"] * 18 + ["low"] * 80
+
+
+def fill(directory, count, hosts, days):
+    store = event_store.EventStore(directory, retention_days=0)
+    store.start()
+    now = time.time()
+    step = days * 86400.0 / count
+    for number in range(count):
+        received = now - days * 86400 + number * step
+        notification = notification_codec.Notification(
+            PRIORITIES[number // hosts % len(PRIORITIES)], SOURCES[number % len(SOURCES)],
+            time.strftime(notification_codec.TIME_FORMAT, time.localtime(received)),
+            "arm-o-%d" % (number % hosts), ["Событие %d" % number, 'Объект: "/home/user/file%d"' % number])
+        # Блокирующая постановка в очередь вместо add, чтобы не терять уведомления
+        store.queue.put((notification, received))
+    store.stop(timeout=None)
+    return store.stored
+
+
+def timed(label, function, *args, **kwargs):
+    started = time.time()
+    result = function(*args, **kwargs)
+    elapsed = (time.time() - started) * 1000
+    print("%-48s %9s rows %9.1f ms" % (label, result if isinstance(result, int) else len(result), elapsed))
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Запись и выборка уведомлений в хранилище АРМ-АБИ")
+    arg_parser.add_argument("--count", type=int, default=2000000)
+    arg_parser.add_argument("--hosts", type=int, default=300)
+    arg_parser.add_argument("--days", type=int, default=3)
+    args = arg_parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="event_store.")
+    try:
+        started = time.time()
+        stored = fill(directory, args.count, args.hosts, args.days)
+        elapsed = time.time() - started
+        size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+        print("stored %d events in %d segments, %.1f s (%.0f events/s), %.0f bytes/event"
+              % (stored, len(event_store.segments(directory)), elapsed, stored / elapsed, size / float(stored)))
+
+        day = time.time() - 86400
+        timed("critical from arm-o-2, 24h", event_store.query, directory, since=day,
+              host="arm-o-2", priorities=["critical"], limit=None)
+        timed("critical from arm-o-2, 24h (count)", event_store.count, directory, since=day,
+              host="arm-o-2", priorities=["critical"])
+        timed("last 100 events", event_store.query, directory, limit=100)
+        timed("last 100 from source, 24h", event_store.query, directory, since=day,
+              source=SOURCES[1], limit=100)
+        timed("critical, last hour", event_store.query, directory, since=time.time() - 3600,
+              priorities=["critical"], limit=None)
+        timed("all events from arm-o-7 (count)", event_store.count, directory, host="arm-o-7")
+    finally:
+        shutil.rmtree(directory)
+    sys.exit(0 if stored == args.count else 1)
+
+
+if __name__ == "__main__":
+    main()
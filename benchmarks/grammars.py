@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+Правила разбора строк источников (GRAMMARS в events_parser.py):
+1. скорость разбора типичной строки каждого источника в сравнении
+   с прежними регулярными выражениями парсеров;
+2. проверка линейности времени разбора на патологических строках
+   (очень длинные пути в кавычках, незакрытые кавычки, множество двоеточий)
+   для каждого правила и прежних выражений Dr.Web и afick;
+3. случайные строки из служебных символов форматов, разбор которых
+   не должен завершаться исключением
+
+python benchmarks/grammars.py [--iterations 100000] [--max-length 65536]
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "roles", "syslog-ng", "files"))
+
+from events_parser import GRAMMARS
+
+timer = getattr(time, "perf_counter", time.time)
+
+AFICK_LINE = ("2025/08/12 14:31:15 new : 1; delete : 0; changed : 3; dangling : 0; exclude_re : 0;"
+              " masked : 0; compare : 48213")
+DRWEB_LINE = ('2025-Aug-12 14:31:15 [FC-1733] Notice: Threats: LinuxSpider-1548:'
+              ' "/home/astra-admin/Загрузки/archive.zip/dir1/eicar.com" - infected with EICAR Test File (NOT a Virus!)')
+REBUS_LINE = ("2025-08-12 14:31:15 CEF:0|Rebus|SOV|3.0|100|Обнаружена сетевая атака|5|"
+              "sourceServiceName=Агент СОВ src=192.168.56.129 dst=192.168.56.128 dpt=1024 proto=TCP")
+ASTRA_LINE = json.dumps({"PRIORITY": "info", "ISODATE": "2025-08-12T14:31:15+03:00",
+                         "MSG": {"kernel": {"text": "usb 1-1: new high-speed USB device " * 4}}})
+
+
+def legacy_afick(line):
+    return dict((match.group(1), int(match.group(3)))
+                for match in re.finditer(r'([a-z_]*)(\s:\s)(\d*)', line))
+
+
+def legacy_drweb(line):
+    result = re.search(r'(.*:\s*)(".*")(.*)', line)
+    return result and (result.group(2), result.group(3))
+
+
+def legacy_rebus(line):
+    return line.split('|')[5:8]
+
+
+def legacy_astra(line):
+    return "astra-audit" in json.loads(line)["MSG"]
+
+
+def current_afick(line):
+    return dict((key, int(value)) for key, value in GRAMMARS["afick.counts"].findall(line))
+
+
+def current_drweb(line):
+    fields = GRAMMARS["drweb.line"].match(line)
+    return fields and GRAMMARS["drweb.threat"].match(fields.group("text"))
+
+
+def current_rebus(line):
+    return GRAMMARS["rebus.cef"].match(line)
+
+
+def current_astra(line):
+    return GRAMMARS["astra"].accepts(line) and "astra-audit" in json.loads(line)["MSG"]
+
+
+SOURCES = [("afick", AFICK_LINE, legacy_afick, current_afick),
+           ("astra", ASTRA_LINE, legacy_astra, current_astra),
+           ("drweb", DRWEB_LINE, legacy_drweb, current_drweb),
+           ("rebus", REBUS_LINE, legacy_rebus, current_rebus)]
+
+# Патологические строки длины n для каждого источника
+PATHOLOGICAL = {
+    # длинный путь в кавычках, без закрывающей кавычки и с множеством двоеточий
+    "drweb": [lambda n: '2025-Aug-12 14:31:15 [FC-1733] Notice: Threats: X: "/%s" - infected with Y' % ("a" * n),
+              lambda n: '2025-Aug-12 14:31:15 [FC-1733] Notice: Threats: X: "/%s' % ("a" * n),
+              lambda n: '2025-Aug-12 14:31:15 [FC-1733] Notice: Threats: X: %s' % (": " * (n // 2))],
+    # длинные слова без значения и множество пустых пар
+    "afick": [lambda n: "2025/08/12 14:31:15 %s : x" % ("a" * n),
+              lambda n: "2025/08/12 14:31:15 " + " : ;" * (n // 4)],
+    "rebus": [lambda n: "2025-08-12 14:31:15 CEF:0|" + "|" * n,
+              lambda n: "2025-08-12 14:31:15 CEF:0|a|b|c|d|" + "x" * n],
+}
+
+
+def timed(function, line, repeat):
+    started = timer()
+    for _ in range(repeat):
+        try:
+            function(line)
+        except ValueError:
+            # прежний разбор afick не проверял значения
+            pass
+    return (timer() - started) / repeat
+
+
+def micro_benchmark(iterations):
+    print("%-8s %14s %14s %8s" % ("source", "legacy, us", "current, us", "speedup"))
+    for name, line, legacy, current in SOURCES:
+        old = timed(legacy, line, iterations) * 1e6
+        new = timed(current, line, iterations) * 1e6
+        print("%-8s %14.2f %14.2f %7.1fx" % (name, old, new, old / new))
+
+
+def linearity(max_length):
+    """
+    Время разбора строк длины n и 8n, отношение для линейного разбора около 8,
+    для квадратичного - около 64
+    """
+    ok = True
+    small, large = max_length // 8, max_length
+    print("\n%-8s %-10s %12s %12s %8s" % ("source", "parser", "n, us", "8n, us", "ratio"))
+    for name, makers in sorted(PATHOLOGICAL.items()):
+        current = dict((source[0], source[3]) for source in SOURCES)[name]
+        legacy = dict((source[0], source[2]) for source in SOURCES)[name]
+        for i, make in enumerate(makers):
+            for label, function, limit in (("current", current, large), ("legacy", legacy, large // 8)):
+                n = min(small, limit // 8)
+                first = timed(function, make(n), 3)
+                second = timed(function, make(n * 8), 3)
+                ratio = second / first
+                print("%-8s %-10s %12.0f %12.0f %8.1f" % ("%s #%d" % (name, i + 1), label,
+                                                          first * 1e6, second * 1e6, ratio))
+                if label == "current" and ratio > 20:
+                    ok = False
+    return ok
+
+
+def fuzz(count):
+    alphabet = ' "|=:;[]-\\/FCabc019' + "Ж"
+    random.seed(2)
+    failures = 0
+    for _ in range(count):
+        line = "".join(random.choice(alphabet) for _ in range(random.randint(0, 200)))
+        for name, grammar in GRAMMARS.items():
+            try:
+                if grammar.regex is None:
+                    grammar.accepts(line)
+                else:
+                    grammar.match(line)
+                    grammar.findall(line)
+            except Exception as e:
+                failures += 1
+                print("%s failed on %r: %s" % (name, line, e))
+    print("\nfuzz: %d random lines, %d failures" % (count, failures))
+    return failures == 0
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Скорость и линейность правил разбора строк источников")
+    arg_parser.add_argument("--iterations", type=int, default=100000)
+    arg_parser.add_argument("--max-length", type=int, default=65536)
+    arg_parser.add_argument("--fuzz", type=int, default=20000, help="число случайных строк")
+    args = arg_parser.parse_args()
+
+    micro_benchmark(args.iterations)
+    ok = linearity(args.max_length)
+    ok = fuzz(args.fuzz) and ok
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
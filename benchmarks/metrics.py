@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Затраты на сбор метрик парсеров на пути обработки сообщения: каждый парсер
+обрабатывает корпус с метриками и с метриками-заглушкой, выводится разница
+времени на сообщение. Проверяется, что счетчики парсера сходятся с числом
+сообщений, и что метрики отдаются по HTTP в текстовом формате Prometheus
+
+python benchmarks/metrics.py [--parser drweb] [--count 20000] [--repeat 5]
+"""
+
+from __future__ import print_function
+
+import argparse
+import importlib
+import os
+import sys
+import threading
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from replay import FakeMessage, PARSERS, load_corpus, timer
+
+import metrics
+
+try:
+    from urllib2 import urlopen
+except ImportError:
+    from urllib.request import urlopen
+
+OPTIONS = {"keys": "passwd_modification,group_modification,user_modification", "metrics-file": ""}
+
+
+class NullMetrics(object):
+    def record(self, result, seconds):
+        pass
+
+
+def run(parser, messages):
+    parse = parser.parse
+    started = timer()
+    for message in messages:
+        parse(FakeMessage(MESSAGE=message))
+    return timer() - started
+
+
+def measure(name, count, repeat):
+    module_name, class_name, corpus, line_filter = PARSERS[name]
+    parser = getattr(importlib.import_module(module_name), class_name)()
+    lines = load_corpus(name, count)
+    with_metrics = without_metrics = float("inf")
+    real_metrics = None
+    for _ in range(repeat):
+        # Состояние парсера (окна подавления повторов, корреляция) сбрасывается
+        # перед каждым прогоном, прогоны с метриками и без них чередуются
+        parser.init(dict(OPTIONS))
+        parser.metrics = NullMetrics()
+        parser.record_metrics = parser.metrics.record
+        without_metrics = min(without_metrics, run(parser, lines))
+        parser.init(dict(OPTIONS))
+        real_metrics = parser.metrics
+        with_metrics = min(with_metrics, run(parser, lines))
+    parsed, filtered, failed = real_metrics.results()
+    consistent = parsed + filtered + failed == len(lines) * repeat
+    overhead = (with_metrics - without_metrics) / len(lines) * 1e9
+    print("%-8s %7d messages  %8.2f us/msg  metrics %+6.0f ns/msg (%+5.1f%%)  parsed %d filtered %d failed %d  %s"
+          % (name, len(lines), with_metrics / len(lines) * 1e6, overhead,
+             (with_metrics - without_metrics) / without_metrics * 100, parsed, filtered, failed,
+             "ok" if consistent else "MISMATCH"))
+    return consistent
+
+
+def record_cost(number=200000):
+    """
+    Возвращает затраты (нс) на обновление метрик одного сообщения сверх вызова
+    пустого метода, включая два обращения к часам: замер на уровне корпуса
+    сильнее зависит от помех, чем эта величина
+    """
+    real, null = metrics.ParserMetrics("benchmark"), NullMetrics()
+    timer = metrics.timer
+
+    def measure_with(target):
+        def call():
+            started = timer()
+            target.record(metrics.PARSED, timer() - started)
+        return min(timeit.repeat(call, number=number, repeat=5)) / number
+
+    return (measure_with(real) - measure_with(null)) * 1e9 + 2 * min(timeit.repeat(timer, number=number, repeat=5)) \
+        / number * 1e9
+
+
+def check_endpoint():
+    server = metrics.HTTPServer(("127.0.0.1", 0), metrics.MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    try:
+        body = urlopen("http://127.0.0.1:%d/metrics" % server.server_address[1]).read().decode("utf-8")
+    finally:
+        server.shutdown()
+    samples = [line for line in body.splitlines() if line and not line.startswith("#")]
+    valid = all(len(line.rsplit(" ", 1)) == 2 for line in samples) and "events_parser_parse_seconds_bucket" in body
+    print("endpoint: %d samples, %s" % (len(samples), "ok" if valid else "INVALID"))
+    return valid
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Затраты на сбор метрик парсеров событий")
+    arg_parser.add_argument("--parser", choices=sorted(PARSERS), action="append",
+                            help="парсер для замера (по умолчанию все)")
+    arg_parser.add_argument("--count", type=int, default=20000, help="число событий в синтетическом корпусе")
+    arg_parser.add_argument("--repeat", type=int, default=5)
+    args = arg_parser.parse_args()
+
+    ok = all([measure(name, args.count, args.repeat) for name in args.parser or sorted(PARSERS)])
+    print("metrics per message: %.0f ns" % record_cost())
+    ok = check_endpoint() and ok
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+Сравнение прежнего (re.finditer, срезы, split и запись в globals())
+и текущего (однопроходный разбор скомпилированным выражением) разбора
+полей расширения в сообщениях ПК "Ребус-СОВ". Результаты разбора сравниваются
+для каждого сообщения. Затем полный парсер пропускает весь поток сообщений,
+и через равные промежутки выводится текущий объем памяти процесса (RSS),
+который не должен расти
+
+python benchmarks/rebus.py [--log /var/rebus/rebus_sov_audit.log] [--count 2000000]
+"""
+
+from __future__ import print_function
+
+import argparse
+import itertools
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "roles", "syslog-ng", "files"))
+
+from replay import FakeMessage, rebus_corpus
+from rebus_events_parser import RebusEventsParser, parse_extension
+
+timer = getattr(time, "perf_counter", time.time)
+
+# Число сообщений для сравнения скорости разбора полей
+COMPARE_COUNT = 100000
+# Число строк между замерами объема памяти
+RSS_INTERVAL = 200000
+
+
+def legacy_parse_extension(message):
+    # Прежний разбор из RebusEventsParser.parse, сохраненный для сравнения
+    event, _, params = message.split('|')[5:8]
+    indexes = [match.start() for match in re.finditer(r'([a-zA-Z0-9_]*)=', params)]
+    indexes.append(len(params))
+    for i in range(len(indexes)-1):
+        key, value = params[indexes[i]:indexes[i+1]-1].split("=")
+        globals()[key] = value
+    return event
+
+
+def current_parse_extension(message):
+    event, _, params = message.split('|', 7)[5:8]
+    return event, parse_extension(params)
+
+
+def read_log(path, count):
+    # Сохраненный лог повторяется по кругу до набора нужного числа строк
+    def lines():
+        while True:
+            with open(path) as log:
+                for line in log:
+                    yield line.rstrip("\n")
+    return itertools.islice(lines(), count)
+
+
+def current_rss():
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024.0 / 1024.0
+
+
+def compare(lines):
+    started = timer()
+    for line in lines:
+        legacy_parse_extension(line)
+    legacy = timer() - started
+
+    started = timer()
+    for line in lines:
+        current_parse_extension(line)
+    current = timer() - started
+
+    # Прежний разбор оставляет поля последнего сообщения в globals()
+    # и отбрасывает последний символ значения последнего поля, поэтому
+    # для сравнения к сообщению добавляется пробел
+    for line in lines:
+        legacy_parse_extension(line + " ")
+        fields = current_parse_extension(line)[1]
+        mismatched = [key for key, value in fields.items() if globals().get(key) != value]
+        if mismatched:
+            raise AssertionError("fields %s differ for %r" % (mismatched, line))
+    return legacy, current
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Разбор сообщений Ребус-СОВ: скорость и объем памяти")
+    arg_parser.add_argument("--log", help="сохраненный rebus_sov_audit.log вместо синтетического корпуса")
+    arg_parser.add_argument("--count", type=int, default=2000000, help="число сообщений для замера памяти")
+    args = arg_parser.parse_args()
+
+    def source(count):
+        return read_log(args.log, count) if args.log else rebus_corpus(count)
+
+    lines = list(source(COMPARE_COUNT))
+    legacy, current = compare(lines)
+    print("fields of %d messages: legacy %.2f s, current %.2f s, speedup %.1fx"
+          % (len(lines), legacy, current, legacy / current))
+
+    parser = RebusEventsParser()
+    parser.init({})
+    started = timer()
+    for i, line in enumerate(source(args.count), 1):
+        parser.parse(FakeMessage(MESSAGE=line))
+        if i % RSS_INTERVAL == 0:
+            print("%9d messages, %8.0f msg/s, RSS %.1f MB" % (i, i / (timer() - started), current_rss()))
+    parser.deinit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+Стенд для замера производительности парсеров событий syslog-ng
+
+Сообщения из сохраненного лога или синтетического корпуса проходят тот же
+жизненный цикл, что и в syslog-ng (init, parse на каждое сообщение, deinit),
+с заменой объекта сообщения syslog-ng словарем. Каждый парсер запускается
+в отдельном процессе, чтобы пиковый объем памяти (RSS) замерялся независимо
+
+Примеры запуска:
+python benchmarks/replay.py                               # все парсеры, синтетические корпуса
+python benchmarks/replay.py --parser drweb --count 5000   # проверка Dr.Web, находящего 5000 угроз
+python benchmarks/replay.py --parser audit --corpus /var/log/audit/audit.log
+"""
+
+from __future__ import print_function
+
+import argparse
+import importlib
+import json
+import multiprocessing
+import os
+import random
+import re
+import resource
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "roles", "syslog-ng", "files"))
+
+timer = getattr(time, "perf_counter", time.time)
+
+# Начало синтетических корпусов и число сообщений, приходящихся на одну секунду
+START = datetime(2025, 8, 12, 14, 31, 15)
+LINES_PER_SECOND = 200
+
+AUDIT_KEYS = ("passwd_modification", "group_modification", "user_modification")
+
+
+class FakeMessage(dict):
+    """
+    Замена объекта сообщения syslog-ng, поддерживающая чтение
+    и запись полей по ключу (msg["MESSAGE"], msg["notification"])
+    """
+
+
+def timestamps(count):
+    for i in range(count):
+        yield START + timedelta(seconds=i // LINES_PER_SECOND)
+
+
+def afick_corpus(count):
+    for i, dt in enumerate(timestamps(count)):
+        yield "%s new : %d; delete : 0; changed : %d; dangling : 0; exclude_re : 0; masked : 0; compare : 48213"\
+            % (dt.strftime("%Y/%m/%d %H:%M:%S"), i % 3, i % 2)
+
+
+def astra_corpus(count):
+    message_ids = ["ad6f2a6f%02d" % i for i in range(8)]
+    for i, dt in enumerate(timestamps(count)):
+        record = {"PRIORITY": random.choice(("info", "warning", "error")),
+                  "ISODATE": dt.strftime("%Y-%m-%dT%H:%M:%S+03:00"),
+                  "MSG": {"astra-audit": {"type_ru": "Безопасность",
+                                          "name_ru": "Неудачная попытка входа в систему",
+                                          "message_id": message_ids[i % len(message_ids)]}}}
+        yield json.dumps(record)
+
+
+def audit_corpus(count):
+    # Массовое создание пользователей: каждое событие состоит из записей
+    # SYSCALL, EXECVE, PATH и EOE, между которыми попадают посторонние записи
+    for i, dt in enumerate(timestamps(count // 5)):
+        header = "msg=audit(%d.%03d:%d):" % (time.mktime(dt.timetuple()), i % 1000, 1000 + i)
+        key = AUDIT_KEYS[i % len(AUDIT_KEYS)]
+        yield ('type=SYSCALL %s arch=c000003e syscall=59 success=yes exit=0 a0=55d a1=55d a2=55d a3=0 items=2'
+               ' ppid=1200 pid=%d auid=1000 uid=0 gid=0 euid=0 suid=0 fsuid=0 egid=0 sgid=0 fsgid=0 tty=pts0'
+               ' ses=3 comm="useradd" exe="/usr/sbin/useradd" key="%s"' % (header, 1300 + i, key))
+        yield 'type=EXECVE %s argc=3 a0="useradd" a1="-m" a2="user%d"' % (header, i)
+        yield 'type=CWD %s cwd="/root"' % header
+        yield 'type=PATH %s item=0 name="/usr/sbin/useradd" inode=1048 dev=08:01 mode=0100755 nametype=NORMAL' % header
+        yield 'type=EOE %s' % header
+
+
+def drweb_corpus(count):
+    # Проверка архива, в котором Dr.Web находит count угроз
+    for i, dt in enumerate(timestamps(count)):
+        prefix = "%s [FC-1733]" % dt.strftime("%Y-%b-%d %H:%M:%S")
+        path = "/home/astra-admin/Загрузки/archive.zip/dir%d/eicar%d.com" % (i % 50, i)
+        yield '%s Notice: Threats: LinuxSpider-1548: "%s" - infected with EICAR Test File (NOT a Virus!)' % (prefix, path)
+        yield '%s Error: Cure failed: Cannot be cured: "%s"' % (prefix, path)
+        yield '%s Notice: Quarantined: "%s"' % (prefix, path)
+
+
+def rebus_corpus(count):
+    for i, dt in enumerate(timestamps(count)):
+        service = "Сервер СОВ" if i % 10 == 0 else "Агент СОВ"
+        yield ("%s CEF:0|Rebus|SOV|3.0|%d|Обнаружена сетевая атака|5|sourceServiceName=%s"
+               " src=192.168.56.%d dst=192.168.56.128 dpt=%d proto=TCP"
+               % (dt.strftime("%Y-%m-%d %H:%M:%S"), 100 + i % 7, service, 129 + i % 3, 1024 + i))
+
+
+# Фильтры, повторяющие фильтры из *.conf, которые syslog-ng применяет до парсера
+def audit_filter(line):
+    if line.startswith("type=SYSCALL"):
+        return any(key in line for key in AUDIT_KEYS)
+    return line.startswith(("type=EXECVE ", "type=PATH ", "type=EOE "))
+
+
+PARSERS = {
+    "afick": ("afick_events_parser", "AfickEventsParser", afick_corpus, None),
+    "astra": ("astra_events_parser", "AstraEventsParser", astra_corpus, None),
+    "audit": ("audit_events_parser", "AuditEventsParser", audit_corpus, audit_filter),
+    "drweb": ("drweb_events_parser", "DrwebEventsParser", drweb_corpus,
+              lambda line: re.search(r'\] [A-Za-z]+: (Threats|Cure failed|Cured|Quarantined|Deleted): ', line)),
+    "rebus": ("rebus_events_parser", "RebusEventsParser", rebus_corpus,
+              lambda line: "sourceServiceName=Сервер СОВ" not in line),
+}
+
+
+def load_corpus(name, count, path=None):
+    module_name, class_name, corpus, line_filter = PARSERS[name]
+    if path:
+        with open(path) as log:
+            lines = log.read().splitlines()
+    else:
+        lines = list(corpus(count))
+    if line_filter is not None:
+        lines = [line for line in lines if line_filter(line)]
+    return lines
+
+
+def replay(name, lines):
+    """
+    Пропускает строки через парсер, возвращает статистику обработки
+    """
+    module_name, class_name, corpus, line_filter = PARSERS[name]
+    parser = getattr(importlib.import_module(module_name), class_name)()
+    parser.init({})
+    latencies = []
+    notifications = 0
+    started = timer()
+    for line in lines:
+        msg = FakeMessage(MESSAGE=line)
+        before = timer()
+        if parser.parse(msg):
+            notifications += 1
+        latencies.append(timer() - before)
+    elapsed = timer() - started
+    parser.deinit()
+
+    latencies.sort()
+    count = len(latencies) or 1
+    return {"parser": name,
+            "messages": len(lines),
+            "notifications": notifications,
+            "rate": len(lines) / elapsed if elapsed else 0.0,
+            "p50": latencies[count // 2] * 1e6 if latencies else 0.0,
+            "p99": latencies[min(count - 1, count * 99 // 100)] * 1e6 if latencies else 0.0,
+            # В Linux ru_maxrss измеряется в килобайтах
+            "rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0}
+
+
+def worker(name, count, path, results):
+    results.put(replay(name, load_corpus(name, count, path)))
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Замер производительности парсеров событий syslog-ng")
+    arg_parser.add_argument("--parser", choices=sorted(PARSERS), action="append",
+                            help="парсер для замера (по умолчанию все)")
+    arg_parser.add_argument("--count", type=int, default=20000,
+                            help="число событий в синтетическом корпусе")
+    arg_parser.add_argument("--corpus", help="сохраненный лог вместо синтетического корпуса")
+    args = arg_parser.parse_args()
+
+    names = args.parser or sorted(PARSERS)
+    if args.corpus and len(names) != 1:
+        arg_parser.error("--corpus requires exactly one --parser")
+
+    print("%-8s %9s %9s %11s %9s %9s %9s" % ("parser", "messages", "notified", "msg/s", "p50,us", "p99,us", "RSS,MB"))
+    results = multiprocessing.Queue()
+    for name in names:
+        process = multiprocessing.Process(target=worker, args=(name, args.count, args.corpus, results))
+        process.start()
+        stats = results.get()
+        process.join()
+        print("%(parser)-8s %(messages)9d %(notifications)9d %(rate)11.0f %(p50)9.1f %(p99)9.1f %(rss)9.1f" % stats)
+
+
+if __name__ == "__main__":
+    main()
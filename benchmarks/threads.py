@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Проверка отсутствия взаимного влияния сообщений при вызове одного экземпляра
+парсера из многих потоков, как это делает syslog-ng с многопоточными
+источниками. Уведомление, сформированное для каждого сообщения в многопоточном
+прогоне, сравнивается с уведомлением, полученным для того же сообщения
+при однопоточной обработке. Подавление повторов и сводки Dr.Web отключаются,
+а окно ожидания действий Dr.Web увеличивается, так как их результат зависит
+от порядка сообщений. Записи одного события
+аудита или Dr.Web передаются одним потоком, а события разных потоков перемежаются
+
+python benchmarks/threads.py [--parser astra] [--threads 32] [--count 20000]
+"""
+
+from __future__ import print_function
+
+import argparse
+import importlib
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from replay import FakeMessage, PARSERS, load_corpus
+
+OPTIONS = {"dedup-keys": "", "keys": "passwd_modification,group_modification,user_modification",
+           "scan-burst": "0", "incident-window": "86400"}
+# Последняя запись события, все записи которого передаются одним потоком
+EVENT_END = {"audit": "type=EOE ", "drweb": "] Notice: Quarantined: "}
+
+
+def make_parser(name):
+    module_name, class_name, corpus, line_filter = PARSERS[name]
+    parser = getattr(importlib.import_module(module_name), class_name)()
+    parser.init(dict(OPTIONS))
+    return parser
+
+
+def notifications(parser, lines):
+    results = []
+    for line in lines:
+        msg = FakeMessage(MESSAGE=line)
+        results.append(msg.get("notification") if parser.parse(msg) else None)
+    return results
+
+
+def chunks(name, lines, size):
+    # Сообщения делятся на части, обрабатываемые одним потоком,
+    # для аудита и Dr.Web - по границам событий
+    end = EVENT_END.get(name)
+    parts = [[]]
+    for line in lines:
+        parts[-1].append(line)
+        if len(parts[-1]) >= size and (end is None or end in line):
+            parts.append([])
+    return [part for part in parts if part]
+
+
+def check(name, thread_count, count):
+    lines = load_corpus(name, count)
+    expected = notifications(make_parser(name), lines)
+
+    parser = make_parser(name)
+    parts = chunks(name, lines, 50)
+    results = [None] * len(parts)
+    lock = threading.Lock()
+    queue = list(range(len(parts)))
+
+    def worker():
+        while True:
+            with lock:
+                if not queue:
+                    return
+                index = queue.pop()
+            results[index] = notifications(parser, parts[index])
+
+    threads = [threading.Thread(target=worker) for _ in range(thread_count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    parser.deinit()
+
+    actual = [notification for part in results for notification in part]
+    if name in EVENT_END:
+        # Событие отправляется с последней записью, порядок событий
+        # разных потоков не определен, поэтому сравниваются множества
+        expected = sorted(filter(None, expected))
+        actual = sorted(filter(None, actual))
+    mismatched = sum(1 for a, b in zip(expected, actual) if a != b) + abs(len(expected) - len(actual))
+    print("%-8s %9d messages %4d threads  mismatched: %d" % (name, len(lines), thread_count, mismatched))
+    return mismatched == 0
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Проверка парсеров событий при вызове из многих потоков")
+    arg_parser.add_argument("--parser", choices=sorted(PARSERS), action="append",
+                            help="парсер для проверки (по умолчанию все)")
+    arg_parser.add_argument("--threads", type=int, default=32)
+    arg_parser.add_argument("--count", type=int, default=20000, help="число событий в синтетическом корпусе")
+    args = arg_parser.parse_args()
+
+    # Частое переключение потоков, чтобы разбор сообщений перемежался
+    if hasattr(sys, "setswitchinterval"):
+        sys.setswitchinterval(1e-6)
+    else:
+        sys.setcheckinterval(1)
+
+    ok = all([check(name, args.threads, args.count) for name in args.parser or sorted(PARSERS)])
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+Сравнение скорости разбора даты и времени сообщений dateutil.parser
+(как парсеры делали раньше) и общим декодером TimestampDecoder
+
+Запуск на сохраненном логе Dr.Web или на синтетической пачке сообщений:
+python benchmarks/timestamps.py [/var/log/drweb.log]
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "roles", "syslog-ng", "files"))
+
+from dateutil import parser
+
+from drweb_events_parser import DrwebEventsParser
+
+# Число сообщений в синтетической пачке и число сообщений с одинаковым временем
+BURST_SIZE = 20000
+LINES_PER_SECOND = 200
+
+
+def synthetic_lines():
+    start = datetime(2025, 8, 12, 14, 31, 15)
+    for i in range(BURST_SIZE):
+        dt = start + timedelta(seconds=i // LINES_PER_SECOND)
+        yield '%s [FC-1733] Notice: Threats: LinuxSpider-1548: "/tmp/eicar%d" - infected with EICAR Test File (NOT a Virus!)'\
+            % (dt.strftime("%Y-%b-%d %H:%M:%S"), i)
+
+
+def measure(name, decode, lines):
+    started = time.time()
+    for line in lines:
+        decode(line)
+    elapsed = time.time() - started
+    print("%-24s %8.0f msg/s" % (name, len(lines) / elapsed))
+    return elapsed
+
+
+def main():
+    if len(sys.argv) > 1:
+        with open(sys.argv[1]) as log:
+            lines = log.read().splitlines()
+    else:
+        lines = list(synthetic_lines())
+
+    decoder = DrwebEventsParser.timestamp
+    old = measure("dateutil.parser (fuzzy)", lambda line: parser.parse(line[:22], fuzzy=True), lines)
+    new = measure("TimestampDecoder", decoder.decode, lines)
+    print("speedup: %.1fx on %d lines" % (old / new, len(lines)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+Проверка доставки уведомлений через syslog-ng по TCP с буфером на диске
+на петлевом интерфейсе. Запускаются два экземпляра syslog-ng: отправитель
+с точкой назначения d_arm_abi (syslog() с disk-buffer, как в astra-custom.j2
+при notification_transport=tcp) и получатель с источником s_tcp_syslog,
+записывающий уведомления в файл. Уведомления передаются отправителю
+с заданной интенсивностью, при --outage получатель останавливается
+на заданное время в середине передачи (уведомления накапливаются в буфере).
+Проверяется, что все уведомления получены без потерь и в исходном порядке
+
+python benchmarks/transport.py [--rate 10000] [--seconds 5] [--outage 2] [--syslog-ng /usr/sbin/syslog-ng]
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "roles", "syslog-ng", "files"))
+
+import notification_codec
+
+# Параметры точки назначения по умолчанию из roles/syslog-ng/defaults/main.yml
+FLUSH_LINES = 100
+DISK_BUFFER_SIZE = 104857600
+MEM_BUFFER_SIZE = 10485760
+# Интервал (сек) между отправками пачек уведомлений
+BATCH_INTERVAL = 0.01
+
+SENDER_CONFIG = """@version: 3.13
+options { stats-freq(0); };
+source s_input { unix-stream("%(directory)s/input.sock" flags(no-parse)); };
+destination d_arm_abi {
+    syslog(
+        "127.0.0.1"
+        transport("tcp")
+        port(%(port)d)
+        template("$MESSAGE")
+        flush-lines(%(flush_lines)d)
+        disk-buffer(
+            reliable(yes)
+            dir("%(directory)s")
+            disk-buf-size(%(disk_buffer_size)d)
+            mem-buf-size(%(mem_buffer_size)d)
+        )
+    );
+};
+log { source(s_input); destination(d_arm_abi); };
+"""
+
+RECEIVER_CONFIG = """@version: 3.13
+options { stats-freq(0); };
+source s_tcp_syslog { syslog(transport("tcp") ip("127.0.0.1") port(%(port)d) flags(no-parse)); };
+destination d_output { file("%(directory)s/output.log" template("$MESSAGE\\n")); };
+log { source(s_tcp_syslog); destination(d_output); };
+"""
+
+
+def find_syslog_ng(path):
+    for candidate in [path] if path else ["/usr/sbin/syslog-ng", "/sbin/syslog-ng", "/usr/local/sbin/syslog-ng"]:
+        if candidate and os.access(candidate, os.X_OK):
+            return candidate
+    return None
+
+
+def free_port():
+    probe = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    probe.bind(("127.0.0.1", 0))
+    port = probe.getsockname()[1]
+    probe.close()
+    return port
+
+
+class Instance(object):
+    """
+    Экземпляр syslog-ng с собственными конфигурацией, каталогом состояния и pid-файлом
+    """
+    def __init__(self, binary, directory, name, config):
+        self.binary = binary
+        self.directory = os.path.join(directory, name)
+        os.makedirs(self.directory)
+        self.config = os.path.join(self.directory, "syslog-ng.conf")
+        with open(self.config, "w") as config_file:
+            config_file.write(config)
+        self.process = None
+
+    def start(self):
+        self.process = subprocess.Popen([self.binary, "-F", "--no-caps", "-f", self.config,
+                                         "-R", os.path.join(self.directory, "syslog-ng.persist"),
+                                         "-p", os.path.join(self.directory, "syslog-ng.pid"),
+                                         "-c", os.path.join(self.directory, "syslog-ng.ctl")])
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait()
+            self.process = None
+
+
+def wait_for(condition, timeout):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            return False
+        time.sleep(0.05)
+    return True
+
+
+def received_lines(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, "rb") as output:
+        return [line.decode("utf-8") for line in output.read().splitlines() if line]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Проверка доставки уведомлений через syslog-ng по TCP")
+    arg_parser.add_argument("--rate", type=int, default=10000, help="уведомлений в секунду")
+    arg_parser.add_argument("--seconds", type=float, default=5)
+    arg_parser.add_argument("--outage", type=float, default=2,
+                            help="время (сек) недоступности получателя, 0 - без остановки")
+    arg_parser.add_argument("--syslog-ng", dest="syslog_ng", help="путь к исполняемому файлу syslog-ng")
+    arg_parser.add_argument("--timeout", type=float, default=60)
+    args = arg_parser.parse_args()
+
+    binary = find_syslog_ng(args.syslog_ng)
+    if binary is None:
+        print("syslog-ng is not found, use --syslog-ng", file=sys.stderr)
+        sys.exit(2)
+
+    directory = tempfile.mkdtemp(prefix="transport.")
+    settings = {"directory": directory, "port": free_port(), "flush_lines": FLUSH_LINES,
+                "disk_buffer_size": DISK_BUFFER_SIZE, "mem_buffer_size": MEM_BUFFER_SIZE}
+    sender = Instance(binary, directory, "sender", SENDER_CONFIG % dict(settings, directory=directory + "/sender"))
+    receiver = Instance(binary, directory, "receiver",
+                        RECEIVER_CONFIG % dict(settings, directory=directory + "/receiver"))
+    output_path = os.path.join(receiver.directory, "output.log")
+    input_path = os.path.join(sender.directory, "input.sock")
+    try:
+        receiver.start()
+        sender.start()
+        if not wait_for(lambda: os.path.exists(input_path), 10):
+            print("sender did not start", file=sys.stderr)
+            sys.exit(2)
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client.connect(input_path)
+
+        total = int(args.rate * args.seconds)
+        batch_size = max(1, int(args.rate * BATCH_INTERVAL))
+        outage_at = total // 3 if args.outage else None
+        started = time.time()
+        outage_started = None
+        sent = 0
+        while sent < total:
+            count = min(batch_size, total - sent)
+            batch = [notification_codec.encode("critical", "Угроза вредоносного ПО", "2025-08-12 14:31:15",
+                                               "arm-o-1", [str(sent + i), 'Обнаружена угроза: "/tmp/eicar;%d"' % i])
+                     for i in range(count)]
+            data = "\n".join(batch) + "\n"
+            client.sendall(data if isinstance(data, bytes) else data.encode("utf-8"))
+            sent += count
+            if outage_at is not None and sent >= outage_at and outage_started is None:
+                receiver.stop()
+                outage_started = time.time()
+            if outage_started is not None and receiver.process is None \
+                    and time.time() - outage_started >= args.outage:
+                receiver.start()
+            # Выдержать заданную интенсивность отправки
+            delay = started + sent / float(args.rate) - time.time()
+            if delay > 0:
+                time.sleep(delay)
+        client.close()
+        if receiver.process is None:
+            time.sleep(max(0, outage_started + args.outage - time.time()))
+            receiver.start()
+
+        wait_for(lambda: len(set(received_lines(output_path))) >= total, args.timeout)
+        elapsed = time.time() - started
+        received = [int(notification_codec.decode(line).lines[0]) for line in received_lines(output_path)]
+    finally:
+        sender.stop()
+        receiver.stop()
+        shutil.rmtree(directory)
+
+    # При переподключении надежный буфер может повторить последние уведомления,
+    # порядок проверяется по первому получению каждого уведомления
+    seen = set()
+    first = [number for number in received if not (number in seen or seen.add(number))]
+    unique = len(first)
+    in_order = first == sorted(first)
+    print("sent %d, received %d, lost %d, duplicated %d, in order: %s, outage %.1f s, %.0f msg/s"
+          % (total, len(received), total - unique, len(received) - unique, in_order, args.outage,
+             len(received) / elapsed))
+    sys.exit(0 if unique == total and in_order else 1)
+
+
+if __name__ == "__main__":
+    main()
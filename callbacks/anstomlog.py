@@ -3,11 +3,25 @@
 from __future__ import (absolute_import, division, print_function)
 __metaclass__ = type
 
+import atexit
+import csv
+import functools
+import io
+import json
 import sys
 import os
+import threading
 from datetime import datetime
-
-from ansible.utils.color import colorize, hostcolor, ANSIBLE_COLOR
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+try:
+    from collections.abc import Mapping, Sequence
+except ImportError:
+    from collections import Mapping, Sequence
+
+from ansible.utils.color import colorize, hostcolor, parsecolor, ANSIBLE_COLOR
 from ansible.plugins.callback import CallbackBase
 from ansible import constants as C
 from ansible.vars.clean import strip_internal_keys, module_response_deepcopy
@@ -47,6 +61,65 @@ options:
         ini:
             - key: dump_loop_items
               section: defaults
+    output_profile:
+        name: Output profile
+        description: "How much of the task results to print: tiny prints only failures, unreachable hosts and the recap, verbose prints every result as with -v"
+        type: str
+        default: normal
+        choices: ['tiny', 'normal', 'verbose']
+        env:
+            - name: ANSIBLE_ANSTOMLOG_OUTPUT_PROFILE
+        ini:
+            - key: output_profile
+              section: callback_anstomlog
+    plain_output:
+        name: Plain output
+        description: "Write output without ANSI colors and cursor control, e.g. when it is redirected to a file (colors are already off when stdout is not a terminal)"
+        type: bool
+        default: no
+        env:
+            - name: ANSIBLE_ANSTOMLOG_PLAIN_OUTPUT
+        ini:
+            - key: plain_output
+              section: callback_anstomlog
+    profile_tasks:
+        name: Profile tasks
+        description: "Print the slowest tasks and roles and the time spent by each host in the play recap"
+        type: bool
+        default: no
+        env:
+            - name: ANSIBLE_ANSTOMLOG_PROFILE_TASKS
+        ini:
+            - key: profile_tasks
+              section: callback_anstomlog
+    profile_top:
+        name: Number of slowest tasks
+        description: "How many of the slowest tasks and roles to print when profile_tasks is enabled"
+        type: int
+        default: 10
+        env:
+            - name: ANSIBLE_ANSTOMLOG_PROFILE_TOP
+        ini:
+            - key: profile_top
+              section: callback_anstomlog
+    profile_file:
+        name: Task profile file
+        description: "Write per task and host timings to this file, as JSON if it ends with .json, as CSV otherwise"
+        type: path
+        env:
+            - name: ANSIBLE_ANSTOMLOG_PROFILE_FILE
+        ini:
+            - key: profile_file
+              section: callback_anstomlog
+    event_log:
+        name: Event log file
+        description: "Append one JSON record per task result (task, host, status, duration, rc, changed) to this file"
+        type: path
+        env:
+            - name: ANSIBLE_ANSTOMLOG_EVENT_LOG
+        ini:
+            - key: event_log
+              section: callback_anstomlog
 '''
 
 
@@ -60,58 +133,307 @@ DELETABLE_FIELDS = [
     '_ansible_item_label']
 
 
+def flushed(method):
+    """
+    Write the lines emitted by a callback method in one go once it returns
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self._flush()
+    return wrapper
+
+
+def format_duration(seconds):
+    if seconds >= 60:
+        seconds_remaining = seconds % 60
+        minutes = (seconds - seconds_remaining) / 60
+        duration = "{0:.0f}m{1:.0f}s".format(minutes, seconds_remaining)
+    elif seconds >= 1:
+        duration = "{0:.2f}s".format(seconds)
+    else:
+        duration = "{0:.0f}ms".format(seconds * 1000)
+    return duration
+
+
+class TaskProfiler(object):
+    """
+    Start and end times of every (task, host) pair, keyed by task UUID and
+    host name, so that results of parallel hosts get their own durations.
+    Records are kept only when something reads them (the profile summary,
+    the profile file), otherwise only the durations are returned.
+    """
+
+    FIELDS = ['task', 'role', 'host', 'status', 'start', 'end', 'duration']
+
+    def __init__(self, keep_records=True):
+        self.started = {}
+        self.records = []
+        self.keep_records = keep_records
+
+    def start(self, task, host_name):
+        self.started[(task._uuid, host_name)] = datetime.now()
+
+    def discard(self, task, host_name):
+        self.started.pop((task._uuid, host_name), None)
+
+    def finish(self, task, host_name, status):
+        """
+        Record the end of the task on the host, return its duration in seconds
+        or None if the start was not seen (e.g. results of handlers on older
+        Ansible versions without v2_runner_on_start)
+        """
+        start = self.started.pop((task._uuid, host_name), None)
+        if start is None:
+            return None
+        end = datetime.now()
+        seconds = (end - start).total_seconds()
+        if not self.keep_records:
+            return seconds
+        self.records.append({
+            'task': task.get_name().strip(),
+            'role': task._role.get_name() if task._role else '',
+            'host': host_name,
+            'status': status,
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'duration': seconds})
+        return seconds
+
+    def slowest_tasks(self, top):
+        return sorted(self.records, key=lambda record: record['duration'], reverse=True)[:top]
+
+    def slowest(self, key, top):
+        totals = {}
+        for record in self.records:
+            name = key(record)
+            totals[name] = totals.get(name, 0) + record['duration']
+        return sorted(totals.items(), key=lambda item: item[1], reverse=True)[:top]
+
+    def host_totals(self):
+        """
+        Time spent by every host and its slowest task, slowest host first:
+        the first host is the critical path of the run
+        """
+        hosts = {}
+        for record in self.records:
+            total, slowest = hosts.get(record['host'], (0, None))
+            if slowest is None or record['duration'] > slowest['duration']:
+                slowest = record
+            hosts[record['host']] = (total + record['duration'], slowest)
+        return sorted(((host, total, slowest) for host, (total, slowest) in hosts.items()),
+                      key=lambda item: item[1], reverse=True)
+
+    def write(self, path):
+        with open(path, 'w') as profile:
+            if path.endswith('.json'):
+                json.dump(self.records, profile, indent=1)
+            else:
+                writer = csv.DictWriter(profile, fieldnames=self.FIELDS)
+                writer.writeheader()
+                writer.writerows(self.records)
+
+
+class EventLog(object):
+    """
+    NDJSON sink for task results. Records are queued by the callback and
+    serialized and appended to the file by a background thread in batches,
+    so the controller never waits for the disk.
+    """
+
+    BATCH = 512
+
+    def __init__(self, path, playbook=None):
+        self.run = "%s-%d" % (datetime.now().strftime("%Y%m%dT%H%M%S"), os.getpid())
+        self.playbook = playbook
+        # opened here, so that a wrong path fails the callback load
+        self._file = io.open(path, 'a', encoding='utf-8')
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='anstomlog-event-log')
+        self._thread.daemon = True
+        self._thread.start()
+        self._closed = False
+
+    def write(self, result, status, seconds):
+        task = result._task
+        self._queue.put({
+            'ts': datetime.now().isoformat(),
+            'run': self.run,
+            'playbook': self.playbook,
+            'task': task.get_name().strip(),
+            'role': task._role.get_name() if task._role else '',
+            'host': result._host.get_name(),
+            'status': status,
+            'duration': round(seconds, 3),
+            'rc': result._result.get('rc'),
+            'changed': bool(result._result.get('changed', False))})
+
+    def _run(self):
+        stop = False
+        while not stop:
+            records = [self._queue.get()]
+            try:
+                while len(records) < self.BATCH:
+                    records.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            if None in records:
+                stop = True
+                records = [record for record in records if record is not None]
+            lines = [json.dumps(record, ensure_ascii=False, separators=(',', ':'))
+                     for record in records]
+            if lines:
+                self._file.write(u"\n".join(lines) + u"\n")
+                self._file.flush()
+        self._file.close()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+
+
+class ResultView(Mapping):
+    """
+    Read-only view of a result dict hiding internal (_ansible_*) keys, like
+    strip_internal_keys does, and the given top level keys, without copying
+    the result. Nested dicts and lists are wrapped on access.
+    """
+
+    __slots__ = ('_data', '_hidden')
+
+    def __init__(self, data, hidden=()):
+        self._data = data
+        self._hidden = frozenset(hidden)
+
+    def _is_hidden(self, key):
+        return key in self._hidden or \
+            (isinstance(key, str) and key.startswith('_ansible_'))
+
+    def __getitem__(self, key):
+        if self._is_hidden(key):
+            raise KeyError(key)
+        return _view(self._data[key])
+
+    def __contains__(self, key):
+        return key in self._data and not self._is_hidden(key)
+
+    def __iter__(self):
+        return (key for key in self._data if not self._is_hidden(key))
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return repr(_materialize(self))
+
+
+class ResultListView(Sequence):
+    """
+    Read-only view of a list nested in a result, see ResultView.
+    """
+
+    __slots__ = ('_data',)
+
+    def __init__(self, data):
+        self._data = data
+
+    def __getitem__(self, index):
+        return _view(self._data[index])
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return repr(_materialize(self))
+
+
+def _view(value):
+    if isinstance(value, dict):
+        return ResultView(value)
+    if isinstance(value, list):
+        return ResultListView(value)
+    return value
+
+
+def _materialize(value):
+    # Plain dict/list copy of a view, used only when a view has to be printed
+    # with repr()
+    if isinstance(value, ResultView):
+        return dict((key, _materialize(item)) for key, item in value.items())
+    if isinstance(value, ResultListView):
+        return [_materialize(item) for item in value]
+    return value
+
+
 def deep_serialize(data, indent=0):
+    chunks = []
+    _serialize(data, indent, chunks)
+    return "".join(chunks)
+
+
+def _serialize(data, indent, out):
     # pylint: disable=I0011,E0602,R0912,W0631
+    # Output is collected as a list of chunks joined once in deep_serialize,
+    # only values that have to be re-indented line by line (single item lists
+    # and prefered fields) are rendered to an intermediate string.
 
     padding = " " * indent * 2
-    if isinstance(data, list):
-        if data == []:
-            return "[]"
-        output = "[ "
+    if isinstance(data, (list, ResultListView)):
+        if len(data) == 0:
+            out.append("[]")
+            return
+        out.append("[ ")
         if len(data) == 1:
-            output = output + \
-                ("\n" +
-                 padding).join(deep_serialize(data[0], 0).splitlines()) + " ]"
+            out.append(("\n" + padding).join(
+                deep_serialize(data[0], 0).splitlines()))
+            out.append(" ]")
         else:
             list_padding = " " * (indent + 1) * 2
 
             for item in data:
-                output = output + "\n" + list_padding + "- " + \
-                    deep_serialize(item, indent)
-            output = output + "\n" + padding + " ]"
-    elif isinstance(data, dict):
+                out.append("\n" + list_padding + "- ")
+                _serialize(item, indent, out)
+            out.append("\n" + padding + " ]")
+    elif isinstance(data, (dict, ResultView)):
         if "_ansible_no_log" in data and data["_ansible_no_log"]:
             data = {"censored":
                     "the output has been hidden due to the fact that"
                     " 'no_log: true' was specified for this result"}
         list_padding = " " * (indent + 1) * 2
-        output = "{\n"
+        out.append("{\n")
 
         for key in PREFERED_FIELDS:
-            if key in data.keys():
+            if key in data:
                 value = data[key]
                 prefix = list_padding + "- %s: " % key
-                output = output + prefix + "%s\n" % \
-                    "\n".join([" " * len(prefix) + line
-                               for line in deep_serialize(value, indent)
-                               .splitlines()]).strip()
-
-        for key in DELETABLE_FIELDS:
-            if key in data.keys():
-                del data[key]
-
+                value_padding = " " * len(prefix)
+                out.append(prefix)
+                out.append("\n".join([value_padding + line
+                                      for line in deep_serialize(value, indent)
+                                      .splitlines()]).strip())
+                out.append("\n")
+
+        # Deletable fields are skipped rather than deleted, so the serialized
+        # result is left untouched
         for key, value in data.items():
-            output = output + list_padding + \
-                "- %s: %s\n" % (key, deep_serialize(value, indent + 1))
+            if key in DELETABLE_FIELDS:
+                continue
+            out.append(list_padding + "- %s: " % (key,))
+            _serialize(value, indent + 1, out)
+            out.append("\n")
 
-        output = output + padding + "}"
+        out.append(padding + "}")
     else:
         string_form = str(data)
         if len(string_form) == 0:
-            return "\"\""
-
-        return string_form
-    return output
+            out.append("\"\"")
+        else:
+            out.append(string_form)
 
 
 class TestStringMethods(unittest.TestCase):
@@ -204,6 +526,30 @@ class TestStringMethods(unittest.TestCase):
         # print(expected_result)
         self.assertEqual(deep_serialize(hs), expected_result)
 
+    def test_nested_prefered_fields(self):
+        # pylint: disable=I0011,C0303
+        hs = {"results": [{"rc": 0, "msg": "one\ntwo", "item": "a"}, "b"]}
+        expected_result = """{
+  - results: [ 
+    - {
+    - rc: 0
+    - msg: one
+           two
+    - item: a
+  }
+    - b
+   ]
+}"""
+        self.assertEqual(deep_serialize(hs), expected_result)
+
+    def test_result_view(self):
+        hs = {"cmd": "toto", "rc": 12, "changed": True, "_ansible_no_log": False,
+              "results": [{"_ansible_item_label": "a", "item": "a"}]}
+        expected_result = "{\n  - rc: 12\n  - cmd: toto\n  - results: [ {\n    - item: a\n  } ]\n}"
+        self.assertEqual(deep_serialize(ResultView(hs, ['changed'])), expected_result)
+        self.assertEqual(hs["rc"], 12)
+        self.assertEqual(hs["results"][0]["_ansible_item_label"], "a")
+
     def test_hidden_fields(self):
         hs = {"_ansible_verbose_always": True}
         expected_result = """{
@@ -213,6 +559,64 @@ class TestStringMethods(unittest.TestCase):
         self.assertEqual(deep_serialize(hs), expected_result)
 
 
+class TestTaskProfiler(unittest.TestCase):
+
+    def test_records_kept_only_when_needed(self):
+        task = FakeObject(_uuid='1', _role=None, get_name=lambda: 'task')
+        for keep_records, count in ((True, 1), (False, 0)):
+            profiler = TaskProfiler(keep_records=keep_records)
+            profiler.start(task, 'arm-o-1')
+            self.assertTrue(profiler.finish(task, 'arm-o-1', 'ok') >= 0)
+            self.assertEqual(len(profiler.records), count)
+            self.assertEqual(profiler.started, {})
+
+
+class FakeDisplay(object):
+    verbosity = 0
+
+    def __init__(self):
+        self.lines = []
+
+    def display(self, msg, screen_only=False, log_only=False, **kwargs):
+        if not log_only:
+            self.lines.extend(msg.splitlines())
+
+
+class FakeObject(object):
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+class TestCallbackOutput(unittest.TestCase):
+
+    @staticmethod
+    def callback():
+        class WarningCallback(CallbackModule):
+            # the base class shows the warnings with its own display calls,
+            # whatever the Ansible version does internally
+            def _handle_warnings(self, res):
+                for warning in res.pop('warnings', []):
+                    self._display.display("[WARNING]: %s" % warning)
+
+        callback = WarningCallback(display=FakeDisplay())
+        callback._colored = False
+        return callback
+
+    @staticmethod
+    def result(fields):
+        task = FakeObject(_uuid='1', loop=None, action='command', _role=None,
+                          get_name=lambda: 'task')
+        return FakeObject(_result=fields, _task=task,
+                          _host=FakeObject(get_name=lambda: 'arm-o-1'))
+
+    def test_warnings_after_result_line(self):
+        callback = self.callback()
+        callback.v2_runner_on_ok(self.result({'changed': True, 'warnings': ['check this']}))
+        lines = callback._display.lines
+        self.assertTrue(lines[-2].startswith(u"↳  arm-o-1 | CHANGED | "), lines)
+        self.assertEqual(lines[-1], "[WARNING]: check this")
+
+
 class CallbackModule(CallbackBase):
 
     '''
@@ -224,19 +628,21 @@ class CallbackModule(CallbackBase):
     CALLBACK_TYPE = 'stdout'
     CALLBACK_NAME = 'anstomlog'
 
-    def _get_duration(self):
-        end = datetime.now()
-        total_duration = (end - self.task_started)
-        seconds = total_duration.total_seconds()
-        if seconds >= 60:
-            seconds_remaining = seconds % 60
-            minutes = (seconds - seconds_remaining) / 60
-            duration = "{0:.0f}m{1:.0f}s".format(minutes, seconds_remaining)
-        elif seconds >= 1:
-            duration = "{0:.2f}s".format(seconds)
+    def _finish(self, result, status):
+        seconds = self._profiler.finish(
+            result._task, result._host.get_name(), status)
+        if seconds is None:
+            seconds = (datetime.now() - self.task_started).total_seconds()
+        if self._event_log is not None:
+            self._event_log.write(result, status, seconds)
+        return seconds
+
+    def _get_duration(self, result=None, status=None):
+        if result is None:
+            seconds = (datetime.now() - self.task_started).total_seconds()
         else:
-            duration = "{0:.0f}ms".format(seconds * 1000)
-        return duration
+            seconds = self._finish(result, status)
+        return format_duration(seconds)
 
     def _command_generic_msg(self, hostname, result, caption):
         duration = self._get_duration()
@@ -258,6 +664,7 @@ class CallbackModule(CallbackBase):
 
         return "%s | %s | %s | rc=%s" % (hostname, caption, duration, result.get('rc', 0))
 
+    @flushed
     def v2_playbook_on_task_start(self, task, is_conditional):
         parentTask = task.get_first_parent_include()
         if parentTask is not None:
@@ -280,13 +687,22 @@ class CallbackModule(CallbackBase):
             if path:
                 self._emit_line("[{}]: {}".format(ts, path))
         self.task_start_preamble = "[{}]{} {}\n".format(ts, prefix, section_name)
-        sys.stdout.write(self.task_start_preamble)
+        self._pending.append((self.task_start_preamble, None))
 
+    def v2_playbook_on_start(self, playbook):
+        if self._event_log is not None:
+            self._event_log.playbook = os.path.basename(playbook._file_name)
+
+    def v2_runner_on_start(self, host, task):
+        self._profiler.start(task, host.get_name())
+
+    @flushed
     def v2_playbook_on_handler_task_start(self, task):
         self._emit_line("triggering handler | %s " % task.get_name().strip())
 
+    @flushed
     def v2_runner_on_failed(self, result, ignore_errors=False):
-        duration = self._get_duration()
+        duration = self._get_duration(result, 'failed')
         host_string = self._host_string(result)
 
         if 'exception' in result._result:
@@ -308,6 +724,7 @@ class CallbackModule(CallbackBase):
                          duration), color=C.COLOR_ERROR)
         self._emit_line(deep_serialize(result._result), color=C.COLOR_ERROR)
 
+    @flushed
     def v2_on_file_diff(self, result):
 
         if result._task.loop and 'results' in result._result:
@@ -336,62 +753,51 @@ class CallbackModule(CallbackBase):
 
         return host_string
 
+    @flushed
     def v2_runner_on_ok(self, result):
-        duration = self._get_duration()
+        duration = self._get_duration(
+            result, 'changed' if result._result.get('changed', False) else 'ok')
         host_string = self._host_string(result)
-        display_ok = self.get_option("display_ok_hosts")
         msg, color = self._changed_or_not(result._result, host_string)
 
-        if not display_ok:
-            return
-
-        verbose = '_ansible_verbose_always' in result._result
+        verbose = self._show_results or '_ansible_verbose_always' in result._result
         no_verbose_override = '_ansible_verbose_override' not in result._result
 
-        abridged_result = strip_internal_keys(module_response_deepcopy(result._result))
-        if self._display.verbosity < 3 and 'invocation' in abridged_result:
-            del abridged_result['invocation']
+        # remove exception, and invocation and diff information unless
+        # specifically wanting it, from screen output
+        hidden = ['exception']
+        if self._display.verbosity < 3:
+            hidden.extend(['invocation', 'diff'])
 
-        # remove diff information from screen output
-        if self._display.verbosity < 3 and 'diff' in abridged_result:
-            del abridged_result['diff']
-
-        # remove exception from screen output
-        if 'exception' in abridged_result:
-            del abridged_result['exception']
-
-        if (self.get_option("dump_loop_items") or \
-                self._display.verbosity > 0) \
+        if self._dump_loop_items \
                 and result._task.loop \
                 and 'results' in result._result:
-            # remove invocation unless specifically wanting it
-            for item in abridged_result['results']:
+            for item in result._result['results']:
                 msg, color = self._changed_or_not(item, host_string)
-                del item['ansible_loop_var']
-                del item['failed']
-                del item['changed']
+                # only loop items are printed as a dict, so only they are copied
+                item = strip_internal_keys(module_response_deepcopy(item))
+                for key in ['ansible_loop_var', 'failed', 'changed']:
+                    item.pop(key, None)
                 item_msg = "%s - item=%s" % (msg, item)
                 self._emit_line("%s | %s" %
                                 (item_msg, duration), color=color)
         else:
-            for key in ['failed', 'changed']:
-                if key in abridged_result:
-                    del abridged_result[key]
-
             self._emit_line("↳  %s | %s" %
                             (msg, duration), color=color)
-            if ((self._display.verbosity > 0
-                    or verbose)
-                    and no_verbose_override):
+            if verbose and no_verbose_override:
+                abridged_result = ResultView(
+                    result._result, hidden + ['failed', 'changed'])
                 self._emit_line(deep_serialize(abridged_result), color=color)
 
         self._clean_results(result._result, result._task.action)
+        # the result lines are written before the warnings shown by the base class
+        self._flush()
         self._handle_warnings(result._result)
 
         result._preamble = self.task_start_preamble
 
     def eat(self, count=4):
-        if ANSIBLE_COLOR:
+        if self._colored:
             sys.stdout.write(count*"\b")
 
     @staticmethod
@@ -415,10 +821,42 @@ class CallbackModule(CallbackBase):
             self.stdout.write(" | ")
             self.task_start_preamble = " "
 
-        for line in lines.splitlines():
-            self._display.display(line, color=color)
+        self._pending.append((lines, color))
+
+    def _color_format(self, color):
+        # Escape sequences are computed once per color, the same way as
+        # ansible.utils.color.stringc does for every call
+        if not self._colored or not color:
+            return None
+        color_format = self._color_formats.get(color)
+        if color_format is None:
+            color_format = u"\033[%sm%%s\033[0m" % parsecolor(color)
+            self._color_formats[color] = color_format
+        return color_format
+
+    def _flush(self):
+        """
+        Write the lines gathered for the current event with a single display
+        call (and a single plain copy for the log file, if one is configured)
+        """
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        screen = []
+        plain = []
+        for lines, color in pending:
+            color_format = self._color_format(color)
+            for line in lines.splitlines():
+                plain.append(line)
+                screen.append(color_format % line if color_format else line)
+        if not plain:
+            return
+        self._display.display(u"\n".join(screen), screen_only=True)
+        self._display.display(u"\n".join(plain), log_only=True)
 
+    @flushed
     def v2_runner_on_unreachable(self, result):
+        self._get_duration(result, 'unreachable')
         line = '{} | UNREACHABLE!: {}'.format(
             self._host_string(result), result._result.get('msg', ''))
 
@@ -428,16 +866,13 @@ class CallbackModule(CallbackBase):
 
         self._emit_line(line, C.COLOR_SKIP)
 
+    @flushed
     def v2_runner_on_skipped(self, result):
-        display_skipped = self.get_option('display_skipped_hosts')
-        if not display_skipped:
-            return
-
-        duration = self._get_duration()
-
+        duration = self._get_duration(result, 'skipped')
         self._emit_line("%s | SKIPPED | %s" %
                         (self._host_string(result), duration), color=C.COLOR_SKIP)
 
+    @flushed
     def v2_playbook_on_include(self, included_file):
         if self.task_start_preamble.endswith(" ..."):
             self.task_start_preamble = " "
@@ -445,30 +880,113 @@ class CallbackModule(CallbackBase):
                 ", ".join([h.name for h in included_file._hosts]),
                 'INCLUDED',
                 os.path.basename(included_file._filename))
-            self._display.display(msg, color=C.COLOR_SKIP)
+            self._emit_line(msg, color=C.COLOR_SKIP)
 
+    @flushed
     def v2_playbook_on_stats(self, stats):
         self._open_section("system")
         self._emit_line("-- Play recap --")
 
+        if self._colored:
+            host_stat, stat = hostcolor, colorize
+        else:
+            # the same layout as hostcolor and colorize produce without colors
+            host_stat = lambda host, t: u"%-26s" % host
+            stat = lambda lead, num, color: u"%s=%-4s" % (lead, str(num))
+
         hosts = sorted(stats.processed.keys())
         for h in hosts:
             t = stats.summarize(h)
 
             self._emit_line(u"%s : %s %s %s %s %s %s %s" % (
-                hostcolor(h, t),
-                colorize(u'ok', t['ok'], C.COLOR_OK),
-                colorize(u'changed', t['changed'], C.COLOR_CHANGED),
-                colorize(u'unreachable', t['unreachable'], C.COLOR_UNREACHABLE),
-                colorize(u'failed', t['failures'], C.COLOR_ERROR),
-                colorize(u'skipped', t['skipped'], C.COLOR_SKIP),
-                colorize(u'rescued', t['rescued'], C.COLOR_OK),
-                colorize(u'ignored', t['ignored'], C.COLOR_WARN)))
+                host_stat(h, t),
+                stat(u'ok', t['ok'], C.COLOR_OK),
+                stat(u'changed', t['changed'], C.COLOR_CHANGED),
+                stat(u'unreachable', t['unreachable'], C.COLOR_UNREACHABLE),
+                stat(u'failed', t['failures'], C.COLOR_ERROR),
+                stat(u'skipped', t['skipped'], C.COLOR_SKIP),
+                stat(u'rescued', t['rescued'], C.COLOR_OK),
+                stat(u'ignored', t['ignored'], C.COLOR_WARN)))
+
+        if self.get_option('profile_tasks'):
+            self._emit_profile(self.get_option('profile_top'))
+
+        profile_file = self.get_option('profile_file')
+        if profile_file:
+            self._profiler.write(profile_file)
+
+        if self._event_log is not None:
+            self._event_log.close()
+
+    def _emit_profile(self, top):
+        self._emit_line("-- Slowest tasks --")
+        for record in self._profiler.slowest_tasks(top):
+            name = record['task']
+            if record['role']:
+                name = "%s : %s" % (record['role'], name)
+            self._emit_line("%10s | %s | %s" % (
+                format_duration(record['duration']), name, record['host']))
+
+        self._emit_line("-- Slowest roles --")
+        for role, seconds in self._profiler.slowest(
+                lambda record: record['role'] or '(play tasks)', top):
+            self._emit_line("%10s | %s" % (format_duration(seconds), role))
+
+        self._emit_line("-- Time per host (critical path first) --")
+        for host, seconds, slowest in self._profiler.host_totals():
+            self._emit_line("%10s | %s | slowest: %s (%s)" % (
+                format_duration(seconds), host, slowest['task'],
+                format_duration(slowest['duration'])))
 
     def __init__(self, *args, **kwargs):
         super(CallbackModule, self).__init__(*args, **kwargs)
         self.task_started = datetime.now()
         self.task_start_preamble = None
+        self._profiler = TaskProfiler()
+        # lines emitted by the current event, as (text, color) pairs
+        self._pending = []
+        self._color_formats = {}
+        self._colored = ANSIBLE_COLOR
+        self._event_log = None
+
+        self._show_results = self._display.verbosity > 0
+        self._dump_loop_items = self._show_results
+
+    def set_options(self, *args, **kwargs):
+        super(CallbackModule, self).set_options(*args, **kwargs)
+        self._colored = ANSIBLE_COLOR and not self.get_option('plain_output')
+        event_log = self.get_option('event_log')
+        if event_log and self._event_log is None:
+            self._event_log = EventLog(event_log)
+            atexit.register(self._event_log.close)
+        self._bind_profile(self.get_option('output_profile'))
+
+    def _bind_profile(self, profile):
+        """
+        Resolve the options consulted for every result once, and replace the
+        handlers of the results that are not printed with ones doing nothing
+        (or only timing the task when the profile or the event log is written)
+        """
+        self._show_results = profile == 'verbose' or self._display.verbosity > 0
+        self._dump_loop_items = self._show_results or self.get_option('dump_loop_items')
+
+        profiling = (self.get_option('profile_tasks') or self.get_option('profile_file')
+                     or self._event_log is not None)
+        # the event log gets the durations directly, only the profile reads the records
+        self._profiler.keep_records = bool(self.get_option('profile_tasks') or self.get_option('profile_file'))
+        if profile == 'tiny' or not self.get_option('display_ok_hosts'):
+            self.v2_runner_on_ok = self._time_ok if profiling else self._discard
+        if profile == 'tiny' or not self.get_option('display_skipped_hosts'):
+            self.v2_runner_on_skipped = self._time_skipped if profiling else self._discard
+
+    def _discard(self, result):
+        self._profiler.discard(result._task, result._host.get_name())
+
+    def _time_ok(self, result):
+        self._finish(result, 'changed' if result._result.get('changed', False) else 'ok')
+
+    def _time_skipped(self, result):
+        self._finish(result, 'skipped')
 
 
 if __name__ == '__main__':
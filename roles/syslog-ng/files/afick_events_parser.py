@@ -1,51 +1,71 @@
 # -*- coding: utf-8 -*-
 
 import logging
-import re
-from dateutil import parser
 
-from events_parser import EventsParser, hostname
+from afick_history import Checkpoint, read_changes, report_path
+from events_parser import EventsParser, TimestampDecoder, GRAMMARS
+
+# Число объектов из отчета afick, перечисляемых в уведомлении
+REPORT_LINES = 20
+
+CHANGE_LABELS = {"new": "Новый", "deleted": "Удален", "changed": "Изменен", "dangling": "Битая ссылка"}
 
 class AfickEventsParser(EventsParser):
-    def parse(self, msg):
-        try:
-            super(AfickEventsParser, self).parse(msg)
-            # Первые 19 символов сообщения это дата и время
-            dt = parser.parse(self.message[:19], fuzzy=True)
-
-            results = {}
-            for match in re.finditer(r'([a-z_]*)(\s:\s)(\d*)', self.message):
-                results[match.group(1)] = int(match.group(3))
-
-            title = "Результаты контроля целостности"
-            if results["new"] != 0:
-                priority = "normal"
-            elif results["delete"] + results["changed"] != 0:
-                priority = "critical"
-            else:
-                priority = "low"
-
-            # Дефолтными настройками задано ежесуточное обновление БД контроля целостности,
-            # после которого вместо ключа "compare" в сводке ключ "update"
-            if "compare" in results:
-                body = "{0};{1};Проверена целостность {2} объектов (новых: {3}, удаленных: {4}, измененных: {5})"\
-                    .format(dt.strftime("%Y-%m-%d %H:%M:%S"),
-                            hostname,
-                            results["compare"],
-                            results["new"],
-                            results["delete"],
-                            results["changed"])
-            else:
-                body = "{0};{1};Обновлены контр. суммы {2} объектов (новых: {3}, удаленных: {4}, измененных: {5})"\
-                    .format(dt.strftime("%Y-%m-%d %H:%M:%S"),
-                            hostname,
-                            results["update"],
-                            results["new"],
-                            results["delete"],
-                            results["changed"])
-
-            msg["notification"] = ";".join((priority, title, body))
-            return True
-        except Exception as e:
-            logging.exception(e)
+    # Первые 19 символов сообщения это дата и время
+    timestamp = TimestampDecoder("%Y/%m/%d %H:%M:%S", 19)
+
+    def init(self, options):
+        if not super(AfickEventsParser, self).init(options):
             return False
+        options = options or {}
+        # Файл с временем последнего обработанного запуска afick, если не задан,
+        # обрабатываются все прочитанные из history сводки
+        self.checkpoint = Checkpoint(options["checkpoint"]) if options.get("checkpoint") else None
+        # Каталог архива afick, если задан, в уведомление добавляются
+        # новые, удаленные и измененные объекты из отчета запуска
+        self.archive = options.get("archive")
+        self.report_lines = int(options.get("report-lines", REPORT_LINES))
+        return True
+
+    def parse_message(self, message):
+        # Запуск отмечается обработанным до разбора сводки: сводка, разбор которой
+        # завершился ошибкой, не будет повторно прочитана после перезапуска
+        run = message[:19]
+        if self.checkpoint is not None and not self.checkpoint.advance(run):
+            logging.debug("%s skiped already processed afick run %s" % (type(self).__name__, run))
+            return None
+        dt = self.timestamp.decode(message)
+
+        results = dict((key, int(value)) for key, value in GRAMMARS["afick.counts"].findall(message))
+
+        title = "Результаты контроля целостности"
+        if results["new"] != 0:
+            priority = "normal"
+        elif results["delete"] + results["changed"] != 0:
+            priority = "critical"
+        else:
+            priority = "low"
+
+        # Дефолтными настройками задано ежесуточное обновление БД контроля целостности,
+        # после которого вместо ключа "compare" в сводке ключ "update"
+        if "compare" in results:
+            body = "Проверена целостность {0} объектов (новых: {1}, удаленных: {2}, измененных: {3})"\
+                .format(results["compare"],
+                        results["new"],
+                        results["delete"],
+                        results["changed"])
+        else:
+            body = "Обновлены контр. суммы {0} объектов (новых: {1}, удаленных: {2}, измененных: {3})"\
+                .format(results["update"],
+                        results["new"],
+                        results["delete"],
+                        results["changed"])
+
+        lines = [body]
+        if self.archive and results["new"] + results["delete"] + results["changed"] != 0:
+            changes, skipped = read_changes(report_path(run, self.archive), self.report_lines)
+            lines.extend("%s: %s" % (CHANGE_LABELS[change], path) for change, kind, path in changes)
+            if skipped:
+                lines.append("и еще объектов: %d" % skipped)
+
+        return priority, title, dt, lines
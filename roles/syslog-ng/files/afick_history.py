@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import os
+import re
+import threading
+
+# Каталог архива afick (параметр archive в afick.conf), в котором отчет
+# каждого запуска сохраняется в файл afick.ГГГГММДДччммсс
+ARCHIVE_DIR = "/var/lib/afick/archive"
+
+# Строка отчета об изменении объекта, например "changed file : /etc/passwd"
+CHANGE_RE = re.compile(r'^(new|deleted|changed|dangling) (\w+(?: \w+)?) : (.+?)\s*$')
+
+# После этой строки в отчете повторяются измененные объекты
+# с изменившимися атрибутами, которые в уведомление не включаются
+DETAILS_MARKER = "# detailed changes"
+
+
+class Checkpoint(object):
+    """
+    Время последнего обработанного запуска afick, сохраняемое в файле,
+    чтобы после перезапуска syslog-ng (или потери его persist-файла) сводки
+    прежних запусков, повторно прочитанные из history, не отправлялись.
+    Время хранится строкой в формате history ("2025/08/12 14:31:15"),
+    поэтому сравнивается как строка
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        try:
+            with open(path) as checkpoint:
+                self.last = checkpoint.read().strip()
+        except (IOError, OSError):
+            self.last = ""
+
+    def advance(self, run):
+        """
+        Запоминает запуск run, возвращает False, если он уже был обработан
+        """
+        with self.lock:
+            if run <= self.last:
+                return False
+            self.last = run
+            # Запись во временный файл и переименование, чтобы при сбое
+            # не остался пустой или недописанный файл
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "w") as checkpoint:
+                checkpoint.write(run + "\n")
+            os.rename(temp_path, self.path)
+            return True
+
+
+def report_path(run, archive=ARCHIVE_DIR):
+    """
+    Возвращает путь к отчету запуска afick по его времени из history
+    """
+    return os.path.join(archive, "afick." + re.sub(r'\D', "", run))
+
+
+def iter_changes(lines):
+    """
+    Возвращает построчно прочитанные из отчета afick изменения объектов
+    кортежами (изменение, тип объекта, путь), не загружая отчет целиком
+    """
+    for line in lines:
+        if line.startswith(DETAILS_MARKER):
+            return
+        match = CHANGE_RE.match(line)
+        if match:
+            yield match.groups()
+
+
+def read_changes(path, limit):
+    """
+    Возвращает не более limit изменений из отчета и число оставшихся,
+    если отчета нет - пустой список и 0
+    """
+    changes = []
+    skipped = 0
+    try:
+        with open(path) as report:
+            for change in iter_changes(report):
+                if len(changes) < limit:
+                    changes.append(change)
+                else:
+                    skipped += 1
+    except (IOError, OSError) as e:
+        logging.warning("afick report %s is not available: %s" % (path, e))
+    return changes, skipped
@@ -2,69 +2,112 @@
 
 import json
 import logging
-from datetime import datetime
-from dateutil import parser, tz
+import unittest
 
-from events_parser import EventsParser, hostname
-
-# Интервал времени (сек) между событиями с одинаковым идентификатором,
-# в течении которого последующие события отбрасываются
-DROP_TIME = 5
+from event_dedup import DEDUP_WINDOW
+from events_parser import EventsParser, IsoTimestampDecoder, GRAMMARS, TICK_MESSAGE, hostname, native_str
+import notification_codec
 
 
 class AstraEventsParser(EventsParser):
-    def init(self, options):
-        super(AstraEventsParser, self).init(options)
-        # Идентификатор и время последнего события
-        self.last_message_id = ""
-        self.last_message_dt = datetime.now(tz=tz.tzlocal())
-        return True
-
-    def parse(self, msg):
-        try:
-            super(AstraEventsParser, self).parse(msg)
-            record = json.loads(self.message)
-            # Установить приоритет сообщения (low, normal, critical)
-            # в зависимости от приоритета события (debug, info, notice, warning, error, critical, alert, emergency)
-            if record["PRIORITY"] in ("debug", "info", "notice"):
-                priority = "low"
-            elif record["PRIORITY"] == "warning":
-                priority = "normal"
-            else:
-                priority = "critical"
-
-            # В Astra Linux 1.7  используется syslog-ng 3.13 с syslog-ng-mod-python 2.7.16,
-            # поэтому вместо datetime.fromisoformat, используем dateutil.parser
-            dt = parser.parse(record["ISODATE"])
-
-            # Если полученное сообщение не типа astra-audit пропустить его
-            if not "astra-audit" in record["MSG"]:
-                logging.debug('%s skiped none astra-audit message' % type(self).__name__)
-                return False
-
-            # Получить из сообщения тип, название и идентификатор системного события
-            for key in ("type_ru", "name_ru", "message_id"):
-                globals()[key] = record["MSG"]["astra-audit"][key]
-
-            # Если за короткий интервал времени подряд
-            # пришло много сообщений с одним идентификатором,
-            # показать первое сообщение и отбросить последующие дубликаты
-            timedelta = (dt - self.last_message_dt).total_seconds()
-            if message_id == self.last_message_id and timedelta < DROP_TIME:
-                logging.debug('%s skiped similar message with id: "%s"' % (type(self).__name__, message_id))
-                return False
-
-            self.last_message_id = message_id
-            self.last_message_dt = dt
-            # Сформировать уведомление одним элементом
-            title = "Системное событие"
-            body = ";".join((dt.strftime("%Y-%m-%d %H:%M:%S"),
-                             hostname,
-                             type_ru,
-                             name_ru))
-
-            msg["notification"] = ";".join((priority, title, body))
-            return True
-        except Exception as e:
-            logging.exception(e)
-            return False
+    # Дата и время события в формате $ISODATE
+    timestamp = IsoTimestampDecoder()
+    # По умолчанию повторами считаются события с одинаковым идентификатором
+    dedup_keys = ("message_id",)
+    dedup_fields = ("message_id", "host", "priority")
+    summary_title = "Системное событие"
+
+    def parse_message(self, message):
+        # Сообщения, в которых нет astra-audit, отбрасываются без разбора JSON
+        if not GRAMMARS["astra"].accepts(message):
+            logging.debug('%s skiped none astra-audit message' % type(self).__name__)
+            return None
+        record = json.loads(message)
+        # Установить приоритет сообщения (low, normal, critical)
+        # в зависимости от приоритета события (debug, info, notice, warning, error, critical, alert, emergency)
+        if record["PRIORITY"] in ("debug", "info", "notice"):
+            priority = "low"
+        elif record["PRIORITY"] == "warning":
+            priority = "normal"
+        else:
+            priority = "critical"
+
+        # В Astra Linux 1.7  используется syslog-ng 3.13 с syslog-ng-mod-python 2.7.16,
+        # поэтому вместо datetime.fromisoformat, используем собственный декодер
+        dt = self.timestamp.decode(record["ISODATE"])
+
+        # Если полученное сообщение не типа astra-audit пропустить его
+        if not "astra-audit" in record["MSG"]:
+            logging.debug('%s skiped none astra-audit message' % type(self).__name__)
+            return None
+
+        # Получить из сообщения тип, название и идентификатор системного события
+        event = record["MSG"]["astra-audit"]
+        type_ru = native_str(event["type_ru"])
+        name_ru = native_str(event["name_ru"])
+        message_id = native_str(event["message_id"])
+
+        # Если за короткий интервал времени пришло много похожих сообщений,
+        # показать первое сообщение и отбросить последующие дубликаты
+        title = self.summary_title
+        fields = {"message_id": message_id, "host": hostname, "priority": priority}
+        if self.is_duplicate(dt, fields):
+            logging.debug('%s skiped similar message with id: "%s"' % (type(self).__name__, message_id))
+            summary = self.suppressed_summary(dt)
+            if not summary:
+                return None
+            # Вместо отброшенного дубликата отправить сводку по закрытым окнам подавления
+            return "low", title, dt, summary
+
+        # Сформировать уведомление одним элементом
+        return priority, title, dt, [type_ru, name_ru] + self.suppressed_summary(dt)
+
+
+class TestAstraEventsParser(unittest.TestCase):
+
+    @staticmethod
+    def message(message_id, isodate="2025-08-12T14:31:15+03:00"):
+        return json.dumps({"PRIORITY": "warning", "ISODATE": isodate,
+                           "MSG": {"astra-audit": {"type_ru": "Аудит", "name_ru": "Вход в систему",
+                                                   "message_id": message_id}}})
+
+    def setUp(self):
+        self.parser = AstraEventsParser()
+        self.assertTrue(self.parser.init({"metrics-file": ""}))
+
+    def notifications(self, message):
+        msg = {"MESSAGE": message}
+        if not self.parser.parse(msg):
+            return []
+        return notification_codec.decode_all(msg["notification"])
+
+    def test_duplicates_summary_flushed_on_expiry(self):
+        self.assertEqual(len(self.notifications(self.message("42"))), 1)
+        self.assertEqual(self.notifications(self.message("42")), [])
+        self.assertEqual(self.notifications(self.message("42")), [])
+        # Окно подавления еще открыто
+        self.assertEqual(self.notifications(TICK_MESSAGE), [])
+        # Новых событий нет, но с последнего события прошло больше окна подавления
+        dt, received = self.parser.dedup.last
+        self.parser.dedup.last = (dt, received - DEDUP_WINDOW)
+        summary = self.notifications(TICK_MESSAGE)
+        self.assertEqual(len(summary), 1)
+        self.assertEqual(summary[0].priority, "low")
+        self.assertEqual(summary[0].lines, ["Подавлено похожих событий: 2 (42)"])
+        self.assertEqual(self.notifications(TICK_MESSAGE), [])
+
+    def test_ticks_not_counted(self):
+        # Счетчики общие для экземпляров парсера, сравниваются приращения
+        before = self.parser.metrics.results()
+        self.notifications(self.message("43"))
+        self.notifications(TICK_MESSAGE)
+        parsed, filtered, failed = [after - value for after, value in zip(self.parser.metrics.results(), before)]
+        self.assertEqual((parsed, filtered, failed), (1, 0, 0))
+
+    def test_unsupported_dedup_keys_rejected(self):
+        self.assertFalse(AstraEventsParser().init({"metrics-file": "", "dedup-keys": "message_id,user"}))
+        self.assertTrue(AstraEventsParser().init({"metrics-file": "", "dedup-keys": "message_id,host"}))
+
+
+if __name__ == "__main__":
+    unittest.main()
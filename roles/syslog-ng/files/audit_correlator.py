@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+
+import pwd
+import unittest
+from collections import deque, OrderedDict
+
+from audit_tokenizer import AuditRecord, tokenize
+
+# Максимальное число незавершенных событий, одновременно хранимых в окне
+MAX_EVENTS = 1024
+# Максимальное время (сек) ожидания завершающей записи EOE,
+# отсчитываемое по времени событий auditd, а не по системным часам
+MAX_EVENT_AGE = 10
+# Значение auid/uid, означающее неустановленный идентификатор (-1)
+UNSET_ID = "4294967295"
+
+
+class AuditEvent(object):
+    """
+    Группа записей auditd с одинаковым msg=audit(timestamp:eid)
+    """
+    __slots__ = ("timestamp", "eid", "syscall", "execve", "paths")
+
+    def __init__(self, timestamp, eid, syscall):
+        self.timestamp = timestamp
+        self.eid = eid
+        # Запись SYSCALL, с которой начинается событие
+        self.syscall = syscall
+        # Запись EXECVE (если событие - запуск программы)
+        self.execve = None
+        # Записи PATH в порядке поступления
+        self.paths = []
+
+
+class AuditCorrelator(object):
+    """
+    Собирает записи audit.log в события по msg=audit(timestamp:eid)
+    в ограниченном окне и возвращает событие после получения записи EOE.
+    Заменяет вызов ausearch на каждое сообщение
+    """
+    def __init__(self, keys=None, max_events=MAX_EVENTS, max_age=MAX_EVENT_AGE):
+        # Ключи правил аудита (-k), события с которыми отслеживаются,
+        # если не заданы, отслеживаются все события с ключом
+        self.keys = frozenset(keys) if keys else None
+        self.max_events = max_events
+        self.max_age = max_age
+        # Незавершенные события в порядке поступления
+        self.events = OrderedDict()
+        # События, вытесненные из окна до получения записи EOE, при переполнении
+        # отбрасываются самые старые
+        self.ready = deque(maxlen=max_events)
+        # Запись, переиспользуемая при разборе каждой строки
+        self.record = AuditRecord()
+
+    def feed(self, line):
+        """
+        Обрабатывает очередную запись audit.log, возвращает
+        завершенное событие или None, если событие еще не завершено
+        """
+        record = tokenize(line, self.record, fields=False)
+        if record is None:
+            return None
+        event_id = (record.timestamp, record.eid)
+
+        if record.type == "EOE":
+            return self.events.pop(event_id, None)
+
+        if record.type == "SYSCALL":
+            tokenize(line, record)
+            key = record.value("key", "(null)")
+            if key == "(null)" or (self.keys is not None and key not in self.keys):
+                return None
+            self.events[event_id] = AuditEvent(record.timestamp, record.eid, record.copy())
+            self._evict(record.timestamp)
+            return None
+
+        event = self.events.get(event_id)
+        if event is None:
+            return None
+        if record.type == "EXECVE":
+            event.execve = tokenize(line, AuditRecord())
+        elif record.type == "PATH":
+            event.paths.append(tokenize(line, AuditRecord()))
+        return None
+
+    def pop_ready(self):
+        """
+        Возвращает все события, вытесненные из окна, начиная с самого старого
+        """
+        ready = []
+        while self.ready:
+            ready.append(self.ready.popleft())
+        return ready
+
+    def _evict(self, timestamp):
+        # Вытеснить самые старые события при переполнении окна или
+        # если запись EOE для них не пришла за max_age секунд
+        while self.events:
+            event_id, event = next(iter(self.events.items()))
+            if len(self.events) <= self.max_events and timestamp - event.timestamp <= self.max_age:
+                break
+            del self.events[event_id]
+            self.ready.append(event)
+
+
+_user_names = {}
+
+
+def user_name(uid):
+    """
+    Возвращает имя учетной записи по uid (результаты кэшируются)
+    """
+    if uid == UNSET_ID:
+        return "unset"
+    name = _user_names.get(uid)
+    if name is None:
+        try:
+            name = pwd.getpwuid(int(uid)).pw_name
+        except (KeyError, ValueError):
+            name = uid
+        _user_names[uid] = name
+    return name
+
+
+def format_event(event):
+    """
+    Возвращает описание события в формате ausearch --format text без даты
+    и времени, которые передаются в уведомлении отдельно:
+    astra-admin, acting as root, successfully executed useradd test
+    """
+    syscall = event.syscall
+    if event.execve is not None:
+        argc = int(event.execve.get("argc", 0))
+        args = [event.execve.value("a%d" % i, "") for i in range(argc)]
+        action = "executed " + " ".join(args)
+    elif event.paths:
+        names = [path.value("name") for path in event.paths if path.get("name") is not None]
+        if not names:
+            return None
+        action = "modified " + names[-1]
+    else:
+        return None
+
+    result = "successfully" if syscall.get("success") == "yes" else "unsuccessfully"
+    return "%s, acting as %s, %s %s" % (user_name(syscall.get("auid", UNSET_ID)),
+                                        user_name(syscall.get("uid", UNSET_ID)),
+                                        result,
+                                        action)
+
+
+class TestAuditCorrelator(unittest.TestCase):
+
+    @staticmethod
+    def event_lines(timestamp, eid, key="user_modification", eoe=True):
+        header = "msg=audit(%d.000:%d):" % (timestamp, eid)
+        lines = ['type=SYSCALL %s arch=c000003e syscall=59 success=yes exit=0 items=2 ppid=1200 pid=1300'
+                 ' auid=0 uid=0 gid=0 comm="useradd" exe="/usr/sbin/useradd" key="%s"' % (header, key),
+                 'type=EXECVE %s argc=3 a0="useradd" a1="-m" a2="user%d"' % (header, eid),
+                 'type=PATH %s item=0 name="/usr/sbin/useradd" inode=1048 nametype=NORMAL' % header]
+        if eoe:
+            lines.append("type=EOE %s" % header)
+        return lines
+
+    def feed(self, correlator, lines):
+        return [event for event in map(correlator.feed, lines) if event is not None]
+
+    def test_event_completed_by_eoe(self):
+        correlator = AuditCorrelator(["user_modification"])
+        events = self.feed(correlator, self.event_lines(1755000000, 1))
+        self.assertEqual([event.eid for event in events], ["1"])
+        self.assertEqual(format_event(events[0]), "root, acting as root, successfully executed useradd -m user1")
+
+    def test_other_keys_ignored(self):
+        correlator = AuditCorrelator(["user_modification"])
+        self.assertEqual(self.feed(correlator, self.event_lines(1755000000, 1, key="other")), [])
+        self.assertEqual(correlator.pop_ready(), [])
+
+    def test_event_without_eoe_evicted_by_age(self):
+        correlator = AuditCorrelator(max_age=10)
+        self.feed(correlator, self.event_lines(1755000000, 1, eoe=False))
+        self.feed(correlator, self.event_lines(1755000005, 2, eoe=False))
+        self.assertEqual(correlator.pop_ready(), [])
+        self.feed(correlator, self.event_lines(1755000020, 3))
+        self.assertEqual([event.eid for event in correlator.pop_ready()], ["1", "2"])
+        self.assertEqual(correlator.pop_ready(), [])
+
+    def test_ready_events_bounded(self):
+        correlator = AuditCorrelator(max_events=4)
+        for eid in range(20):
+            self.feed(correlator, self.event_lines(1755000000, eid, eoe=False))
+        ready = correlator.pop_ready()
+        self.assertEqual(len(ready), 4)
+        self.assertEqual([event.eid for event in ready], ["12", "13", "14", "15"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,46 +1,44 @@
 # -*- coding: utf-8 -*-
 
 import logging
-import re
-import subprocess
-from dateutil import parser
+import threading
+from datetime import datetime
 
-from events_parser import EventsParser, hostname
-
-# Минимальный размер уведомления auditd, чтобы исключать неопознанные (did-unknown) события,
-# например, "At 00:13:33 05.05.2025  did-unknown " (36 символов, включая последний пробел)
-MIN_EVENT_SIZE = 40
+from audit_correlator import AuditCorrelator, format_event
+from events_parser import EventsParser
 
 class AuditEventsParser(EventsParser):
-    def parse(self, msg):
-        try:
-            super(AuditEventsParser, self).parse(msg)
-            # Получить время и идентификатор события в сообщении вида msg=audit(1116360555.329:2401771)
-            match = re.findall('msg=audit\((.*?)\)', self.message)[0]
-            timestamp, eid = match.split(':')
-            # Найти и вывести событие с идентификатором eid, полученное
-            # за последние 10 минут (опция --start recent)
-            process = subprocess.Popen(['ausearch', '-a', eid, '--start', 'recent', '--format', 'text', '--input-logs'], stdout=subprocess.PIPE)
-            stdout, stderr = process.communicate()
-            # если ausearch находит несколько событий с одинаковым eid,
-            # он возвращает multiline string,  которую сплитим в список
-            lines = stdout.splitlines()
+    def init(self, options):
+        if not super(AuditEventsParser, self).init(options):
+            return False
+        # Записи, отобранные фильтрами syslog-ng, собираются в события
+        # в памяти процесса вместо вызова ausearch на каждое сообщение.
+        # Опция keys содержит ключи правил аудита через запятую
+        keys = (options or {}).get("keys", "")
+        self.correlator = AuditCorrelator([key for key in keys.split(",") if key])
+        self.lock = threading.Lock()
+        return True
 
-            logging.debug("Ausearch found event(s) with eid=%s: %s" % (eid, ";".join(lines)))
+    def parse_message(self, message):
+        # Окно корреляции общее для всех потоков, поэтому записи
+        # добавляются в него под блокировкой
+        with self.lock:
+            # Событие считается завершенным после записи EOE, события, вытесненные
+            # из окна корреляции, отправляются все вместе со следующим сообщением
+            event = self.correlator.feed(message)
+            events = self.correlator.pop_ready()
+        if event is not None:
+            events.append(event)
 
-            # Использовать последнее событие, найденное ausearch
-            last_message = lines[-1]
-            if len(last_message) < MIN_EVENT_SIZE:
-                # Если длина сообщения меньше минимальной, значит это did-unknown событие
-                return False
+        notifications = []
+        for event in events:
+            text = format_event(event)
+            logging.debug("Correlator found event with eid=%s: %s" % (event.eid, text))
+            if text is None:
+                # Событие без записей EXECVE и PATH (аналог did-unknown у ausearch)
+                continue
             title = "Аудит событий"
             priority = "low"
-            dt = parser.parse(last_message[3:22], fuzzy=True)
-            body = ";".join((dt.strftime("%Y-%m-%d %H:%M:%S"),
-                             hostname,
-                             last_message[23:]))
-            msg["notification"] = ";".join((priority, title, body))
-            return True
-        except Exception as e:
-            logging.exception(e)
-            return False
+            dt = datetime.fromtimestamp(event.timestamp)
+            notifications.append((priority, title, dt, [text]))
+        return notifications
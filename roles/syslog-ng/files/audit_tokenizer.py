@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+import binascii
+import re
+
+# Заголовок записи вида type=SYSCALL msg=audit(1116360555.329:2401771):
+HEADER_RE = re.compile(r'type=(\w+) msg=audit\((\d+\.\d+):(\d+)\):')
+# Поля записи вида key=value или key="value", в том числе вложенные в msg='...'
+# записей USER_* и поля, добавленные после символа \x1d при log_format = ENRICHED
+FIELD_RE = re.compile(r'(\w+)=("[^"]*"|[^\s\x1d\'"]+)')
+
+# Поля, значения которых auditd кодирует шестнадцатеричной строкой,
+# если они содержат пробелы, кавычки или управляющие символы
+ENCODED_FIELDS = frozenset(("name", "cwd", "exe", "comm", "proctitle", "path",
+                            "cmd", "acct", "key", "data", "old-chardev", "new-chardev"))
+
+# Максимальное число интернированных имен полей, ограничивает рост кэша
+# при разборе поврежденных записей с произвольными именами полей
+MAX_NAMES = 4096
+
+_names = {}
+
+
+def intern_name(name):
+    """
+    Возвращает единственный экземпляр строки с именем поля,
+    что позволяет не хранить копии имен в каждой записи
+    """
+    interned = _names.get(name)
+    if interned is None:
+        if len(_names) >= MAX_NAMES:
+            return name
+        interned = _names.setdefault(name, name)
+    return interned
+
+
+def decode_value(name, value):
+    """
+    Возвращает значение поля без кавычек, значения, закодированные auditd
+    шестнадцатеричной строкой, декодируются (аргументы разделяются пробелами)
+    """
+    if value.startswith('"'):
+        return value[1:-1]
+    if name not in ENCODED_FIELDS and not (name[0] == "a" and name[1:].isdigit()):
+        return value
+    try:
+        decoded = binascii.unhexlify(value)
+    except (TypeError, ValueError):
+        return value
+    decoded = decoded.replace(b"\x00", b" ")
+    # В Python 2.7 результат уже имеет тип str
+    if isinstance(decoded, str):
+        return decoded
+    return decoded.decode("utf-8", "replace")
+
+
+class AuditRecord(object):
+    """
+    Запись audit.log: тип, время, идентификатор события и поля.
+    Имена и значения полей хранятся в двух списках, которые переиспользуются
+    при разборе следующей записи, вместо создания словаря на каждую строку
+    """
+    __slots__ = ("type", "timestamp", "eid", "names", "values")
+
+    def __init__(self):
+        self.type = None
+        self.timestamp = 0.0
+        self.eid = None
+        self.names = []
+        self.values = []
+
+    def get(self, name, default=None):
+        """
+        Возвращает значение поля в том виде, в каком оно записано в логе
+        """
+        try:
+            return self.values[self.names.index(name)]
+        except ValueError:
+            return default
+
+    def value(self, name, default=None):
+        """
+        Возвращает декодированное значение поля
+        """
+        try:
+            return decode_value(name, self.values[self.names.index(name)])
+        except ValueError:
+            return default
+
+    def items(self):
+        return zip(self.names, self.values)
+
+    def copy(self):
+        """
+        Возвращает копию записи, которую можно хранить после разбора следующей строки
+        """
+        record = AuditRecord()
+        record.type = self.type
+        record.timestamp = self.timestamp
+        record.eid = self.eid
+        record.names = self.names[:]
+        record.values = self.values[:]
+        return record
+
+
+def tokenize(line, record=None, fields=True):
+    """
+    Разбирает строку audit.log за один проход, заполняя переданную запись
+    (или новую, если запись не передана). Если fields=False, разбирается только заголовок.
+    Возвращает None, если строка не является записью auditd
+    """
+    match = HEADER_RE.match(line)
+    if match is None:
+        return None
+    if record is None:
+        record = AuditRecord()
+    record.type = intern_name(match.group(1))
+    record.timestamp = float(match.group(2))
+    record.eid = match.group(3)
+    names = record.names
+    values = record.values
+    del names[:]
+    del values[:]
+    if fields:
+        for name, value in FIELD_RE.findall(line, match.end()):
+            names.append(intern_name(name))
+            values.append(value)
+    return record
+
+
+def iter_records(lines):
+    """
+    Последовательно разбирает строки audit.log, возвращая один и тот же
+    экземпляр записи, который нужно скопировать, если он используется позже
+    """
+    record = AuditRecord()
+    for line in lines:
+        if tokenize(line, record) is not None:
+            yield record
@@ -0,0 +1,386 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Сборщик уведомлений на АРМ-АБИ: принимает уведомления от всех хостов
+по UDP и TCP (с разбиением на кадры по RFC 6587), распределяет их
+по очередям источников (по заголовку уведомления: afick, Dr.Web, аудит и т.д.),
+в которых пулы обработчиков дополняют уведомления именем хоста, подавляют
+повторы и передают уведомления пачками в локальный syslog-ng (источник
+s_tcp_syslog), откуда они отправляются в системную шину dbus_sender.
+Очереди источников независимы, поэтому поток событий одного источника
+не задерживает уведомления других. Статистика (число принятых, отправленных,
+подавленных и отброшенных уведомлений, глубина очередей, задержки)
+периодически записывается в журнал и в файл в формате JSON
+
+notification-collector [--udp-port 5514] [--tcp-port 5514] [--forward 127.0.0.1:601]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import sys
+import time
+import unittest
+from datetime import datetime
+
+import notification_codec
+from event_dedup import Deduplicator
+from octet_framing import FrameDecoder, encode_frames
+
+# Порты приема уведомлений (порт 6514 занят syslog по TLS)
+UDP_PORT = 5514
+TCP_PORT = 5514
+# Число обработчиков и максимальная длина очереди каждого источника
+WORKERS = 2
+QUEUE_SIZE = 10000
+# Максимальное число источников с отдельными очередями: заголовок уведомления
+# передается по сети, поэтому уведомления с заголовками сверх этого числа
+# обрабатываются общей очередью OTHER_SOURCE
+MAX_SOURCES = 32
+OTHER_SOURCE = "other"
+# Окно (сек) подавления повторяющихся уведомлений, 0 - не подавлять
+DEDUP_WINDOW = 5
+# Максимальное число уведомлений, передаваемых в syslog-ng одной записью
+BATCH_SIZE = 500
+# Интервал (сек) записи статистики и повторного подключения к syslog-ng
+STATS_INTERVAL = 60
+RECONNECT_DELAY = 2
+STATS_FILE = "/run/notification-collector/stats.json"
+# Максимальное число уведомлений, ожидающих отправки в syslog-ng
+FORWARD_QUEUE_SIZE = 50000
+# Длина очереди входящих соединений TCP: при одновременном подключении
+# сотен хостов (например, после перезапуска сборщика) очередь по умолчанию (100)
+# переполняется и соединения части хостов сбрасываются
+BACKLOG = 1024
+
+logging.basicConfig(format="%(asctime)s %(levelname)s %(message)s",
+                    datefmt="%Y-%m-%d %H:%M:%S",
+                    level=logging.INFO)
+
+
+class SourceStats(object):
+    __slots__ = ("received", "reported", "dispatched", "suppressed", "dropped", "lag", "delay")
+
+    def __init__(self):
+        self.received = 0
+        # Число принятых уведомлений на момент предыдущей записи статистики
+        self.reported = 0
+        self.dispatched = 0
+        self.suppressed = 0
+        self.dropped = 0
+        # Наибольшие с момента предыдущей записи статистики задержки (сек):
+        # от события на хосте до приема и от приема до передачи в syslog-ng
+        self.lag = 0.0
+        self.delay = 0.0
+
+
+class Source(object):
+    """
+    Очередь уведомлений одного источника и пул ее обработчиков
+    """
+    def __init__(self, name, collector, workers, queue_size):
+        self.name = name
+        self.collector = collector
+        self.queue = asyncio.Queue(queue_size)
+        self.stats = SourceStats()
+        self.tasks = [asyncio.ensure_future(self._work()) for _ in range(workers)]
+
+    async def _work(self):
+        while True:
+            received, peer, notification, legacy = await self.queue.get()
+            try:
+                await self.collector.process(self, received, peer, notification, legacy)
+            except Exception as e:
+                logging.exception(e)
+            finally:
+                self.queue.task_done()
+
+
+class Collector(object):
+    def __init__(self, args):
+        self.args = args
+        self.sources = {}
+        self.dedup = Deduplicator(args.dedup_window) if args.dedup_window > 0 else None
+        self.forward_queue = asyncio.Queue(FORWARD_QUEUE_SIZE)
+        # Имена хостов по адресам
+        self.hosts = {}
+        self.started = self.reported = time.time()
+        self.malformed = 0
+
+    def source(self, title):
+        source = self.sources.get(title)
+        if source is None:
+            if len(self.sources) >= MAX_SOURCES:
+                title = OTHER_SOURCE
+                source = self.sources.get(title)
+            if source is None:
+                source = self.sources[title] = Source(title, self, self.args.workers, self.args.queue_size)
+        return source
+
+    async def host_name(self, address):
+        # Имя хоста для уведомлений, в которых его нет, определяется по адресу
+        # отправителя в отдельном потоке, чтобы обращение к DNS не останавливало
+        # прием уведомлений
+        name = self.hosts.get(address)
+        if name is None:
+            try:
+                info = await asyncio.get_event_loop().run_in_executor(None, socket.gethostbyaddr, address)
+                name = info[0].split(".")[0]
+            except (socket.herror, socket.gaierror, OSError):
+                name = address
+            self.hosts[address] = name
+        return name
+
+    def decode(self, line, peer):
+        """
+        Возвращает источник уведомления и элемент его очереди
+        или None, если уведомление не удалось разобрать
+        """
+        try:
+            notification = notification_codec.decode(line)
+        except Exception:
+            self.malformed += 1
+            logging.warning("malformed notification from %s: %r" % (peer, line[:200]))
+            return None
+        source = self.source(notification.title)
+        source.stats.received += 1
+        # В уведомлениях в прежнем формате дата, время и имя хоста входят в строки текста
+        legacy = not line.startswith("{")
+        return source, (time.time(), peer, notification, legacy)
+
+    def receive_nowait(self, line, peer):
+        """
+        Ставит уведомление, принятое по UDP, в очередь его источника,
+        при заполненной очереди уведомление отбрасывается
+        """
+        decoded = self.decode(line, peer)
+        if decoded is None:
+            return
+        source, item = decoded
+        try:
+            source.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            source.stats.dropped += 1
+
+    async def receive(self, line, peer):
+        """
+        Ставит уведомление, принятое по TCP, в очередь его источника,
+        заполненная очередь приостанавливает чтение соединения
+        """
+        decoded = self.decode(line, peer)
+        if decoded is not None:
+            source, item = decoded
+            await source.queue.put(item)
+
+    async def process(self, source, received, peer, notification, legacy=False):
+        if not notification.host and not legacy:
+            notification.host = await self.host_name(peer)
+        if notification.time:
+            try:
+                event_time = time.mktime(time.strptime(notification.time, notification_codec.TIME_FORMAT))
+                source.stats.lag = max(source.stats.lag, received - event_time)
+            except ValueError:
+                pass
+
+        now = datetime.now()
+        if self.dedup is not None:
+            key = (notification.host, notification.title, tuple(notification.lines))
+            if not self.dedup.check(key, now):
+                source.stats.suppressed += 1
+                return
+            for (host, title, lines), count in self.dedup.summary(now):
+                await self.forward_queue.put(notification_codec.encode(
+                    "low", title, now, host, ["Подавлено повторов уведомления: %d" % count] + list(lines[:1])))
+
+        # Заполненная очередь отправки приостанавливает обработчики,
+        # а через очереди источников - и прием по TCP
+        await self.forward_queue.put(notification_codec.encode(
+            notification.priority, notification.title, notification.time, notification.host, notification.lines))
+        source.stats.dispatched += 1
+        source.stats.delay = max(source.stats.delay, time.time() - received)
+
+    async def forwarder(self):
+        """
+        Передает уведомления в syslog-ng пачками по одному соединению TCP,
+        при разрыве соединения переподключается, не теряя текущую пачку
+        """
+        host, port = self.args.forward.rsplit(":", 1)
+        batch = []
+        while True:
+            try:
+                reader, writer = await asyncio.open_connection(host, int(port))
+            except OSError as e:
+                logging.warning("syslog-ng is not available at %s: %s" % (self.args.forward, e))
+                await asyncio.sleep(RECONNECT_DELAY)
+                continue
+            try:
+                while True:
+                    if not batch:
+                        batch.append(await self.forward_queue.get())
+                        while len(batch) < BATCH_SIZE and not self.forward_queue.empty():
+                            batch.append(self.forward_queue.get_nowait())
+                    writer.write(encode_frames(batch))
+                    await writer.drain()
+                    batch = []
+            except OSError as e:
+                logging.warning("connection to syslog-ng lost: %s" % e)
+                writer.close()
+                await asyncio.sleep(RECONNECT_DELAY)
+
+    def stats(self):
+        """
+        Возвращает статистику по источникам: число принятых, отправленных,
+        подавленных и отброшенных уведомлений, длину очереди, число принятых
+        в секунду и наибольшие задержки с момента предыдущей записи статистики
+        """
+        now = time.time()
+        interval = now - self.reported
+        sources = {}
+        for name, source in self.sources.items():
+            stats = source.stats
+            sources[name] = {"received": stats.received,
+                             "dispatched": stats.dispatched,
+                             "suppressed": stats.suppressed,
+                             "dropped": stats.dropped,
+                             "queued": source.queue.qsize(),
+                             "rate": round((stats.received - stats.reported) / interval, 1) if interval else 0.0,
+                             "max_lag": round(stats.lag, 3),
+                             "max_delay": round(stats.delay, 3)}
+        return {"uptime": round(now - self.started), "malformed": self.malformed,
+                "forward_queued": self.forward_queue.qsize(), "sources": sources}
+
+    async def report(self):
+        while True:
+            await asyncio.sleep(self.args.stats_interval)
+            stats = self.stats()
+            for name, source in sorted(stats["sources"].items()):
+                logging.info("%s: %s" % (name, ", ".join("%s=%s" % item for item in sorted(source.items()))))
+            self.reported = time.time()
+            for source in self.sources.values():
+                source.stats.reported = source.stats.received
+                source.stats.lag = source.stats.delay = 0.0
+            if self.args.stats_file:
+                temp_path = self.args.stats_file + ".tmp"
+                with open(temp_path, "w") as stats_file:
+                    json.dump(stats, stats_file, ensure_ascii=False, indent=1)
+                os.rename(temp_path, self.args.stats_file)
+
+
+class UdpProtocol(asyncio.DatagramProtocol):
+    def __init__(self, collector):
+        self.collector = collector
+
+    def datagram_received(self, data, address):
+        for line in data.decode("utf-8", "replace").splitlines():
+            if line:
+                self.collector.receive_nowait(line, address[0])
+
+
+async def handle_tcp(collector, reader, writer):
+    peer = writer.get_extra_info("peername")[0]
+    decoder = FrameDecoder()
+    try:
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            for frame in decoder.feed(data):
+                # Кадр может содержать несколько уведомлений, по одному в строке
+                for line in frame.decode("utf-8", "replace").splitlines():
+                    if line:
+                        await collector.receive(line, peer)
+    except (OSError, ValueError) as e:
+        logging.warning("connection from %s closed: %s" % (peer, e))
+    finally:
+        writer.close()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Сборщик уведомлений хостов на АРМ-АБИ")
+    arg_parser.add_argument("--listen", default="0.0.0.0")
+    arg_parser.add_argument("--udp-port", type=int, default=UDP_PORT)
+    arg_parser.add_argument("--tcp-port", type=int, default=TCP_PORT)
+    arg_parser.add_argument("--forward", default="127.0.0.1:601", help="адрес источника s_tcp_syslog syslog-ng")
+    arg_parser.add_argument("--workers", type=int, default=WORKERS, help="число обработчиков каждого источника")
+    arg_parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE)
+    arg_parser.add_argument("--dedup-window", type=float, default=DEDUP_WINDOW)
+    arg_parser.add_argument("--stats-interval", type=float, default=STATS_INTERVAL)
+    arg_parser.add_argument("--stats-file", default=STATS_FILE)
+    args = arg_parser.parse_args()
+
+    loop = asyncio.get_event_loop()
+    collector = Collector(args)
+    loop.run_until_complete(loop.create_datagram_endpoint(
+        lambda: UdpProtocol(collector), local_addr=(args.listen, args.udp_port)))
+    loop.run_until_complete(asyncio.start_server(
+        lambda reader, writer: handle_tcp(collector, reader, writer), args.listen, args.tcp_port,
+        backlog=BACKLOG))
+    asyncio.ensure_future(collector.forwarder())
+    asyncio.ensure_future(collector.report())
+    logging.info("notification collector is listening on udp/%d and tcp/%d" % (args.udp_port, args.tcp_port))
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    logging.info("notification collector is stopped: %s" % json.dumps(collector.stats(), ensure_ascii=False))
+
+
+class TestCollector(unittest.TestCase):
+
+    options = argparse.Namespace(forward="127.0.0.1:601", workers=1, queue_size=100, dedup_window=5,
+                                 stats_interval=3600, stats_file=None)
+
+    def run_collector(self, lines, peer="192.168.56.10"):
+        """
+        Передает строки сборщику и возвращает уведомления из очереди отправки и сборщик
+        """
+        async def run():
+            collector = Collector(self.options)
+            # Имя хоста по адресу без обращения к DNS
+            collector.hosts[peer] = "arm-o-1"
+            for line in lines:
+                await collector.receive(line, peer)
+            for source in collector.sources.values():
+                await source.queue.join()
+                for task in source.tasks:
+                    task.cancel()
+            forwarded = []
+            while not collector.forward_queue.empty():
+                forwarded.append(notification_codec.decode(collector.forward_queue.get_nowait()))
+            return forwarded, collector
+        return asyncio.run(run())
+
+    def test_host_filled_only_for_json(self):
+        forwarded, _ = self.run_collector([
+            notification_codec.encode("critical", "Угроза вредоносного ПО", "2025-08-12 14:31:15", None, ["json"]),
+            notification_codec.encode("critical", "Угроза вредоносного ПО", "2025-08-12 14:31:15", "arm-o-2",
+                                      ["legacy"], legacy=True)])
+        self.assertEqual([(notification.host, notification.lines) for notification in forwarded],
+                         [("arm-o-1", ["json"]), (None, ["2025-08-12 14:31:15", "arm-o-2", "legacy"])])
+
+    def test_repeats_suppressed(self):
+        line = notification_codec.encode("low", "Системное событие", "2025-08-12 14:31:15", "arm-o-2", ["event"])
+        forwarded, collector = self.run_collector([line] * 3)
+        self.assertEqual(len(forwarded), 1)
+        self.assertEqual(collector.stats()["sources"]["Системное событие"]["suppressed"], 2)
+
+    def test_sources_bounded(self):
+        forwarded, collector = self.run_collector(
+            [notification_codec.encode("low", "source %d" % i, None, "arm-o-2", ["event"])
+             for i in range(MAX_SOURCES + 10)])
+        self.assertEqual(len(forwarded), MAX_SOURCES + 10)
+        self.assertEqual(len(collector.sources), MAX_SOURCES + 1)
+        self.assertEqual(collector.stats()["sources"][OTHER_SOURCE]["received"], 10)
+        # Уведомления общей очереди сохраняют свои заголовки
+        self.assertEqual(forwarded[-1].title, "source %d" % (MAX_SOURCES + 9))
+
+    def test_malformed_counted(self):
+        forwarded, collector = self.run_collector(["garbage"])
+        self.assertEqual((forwarded, collector.malformed), ([], 1))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
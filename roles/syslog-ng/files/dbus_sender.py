@@ -2,9 +2,26 @@
 
 import dbus
 import dbus.service
-from dbus.mainloop.glib import DBusGMainLoop
+from dbus.mainloop.glib import DBusGMainLoop, threads_init
 import logging
 import os
+import threading
+
+import metrics
+import notification_codec
+from event_store import EventStore, RETENTION_DAYS
+try:
+    from Queue import Queue, Empty, Full
+except ImportError:
+    from queue import Queue, Empty, Full
+from gi.repository import GLib
+try:
+    from syslogng import LogDestination
+    # Результат send, при котором syslog-ng повторяет отправку сообщения позже
+    RETRY = LogDestination.RETRY
+except (ImportError, AttributeError):
+    # В syslog-ng 3.13 повторная отправка выполняется, если send возвращает False
+    RETRY = False
 
 
 appname = os.path.basename(__file__).split(".")[0]
@@ -15,6 +32,154 @@ logging.basicConfig(filename="/var/log/%s.log" % appname,
                     datefmt="%Y-%m-%d %H:%M:%S",
                     level=logging.INFO)
 
+# Уведомления отправляются из потока DispatchThread, а не из потока syslog-ng
+threads_init()
+
+# Интервал времени (сек), в течении которого уведомления с одинаковыми
+# приоритетом и заголовком объединяются в одно, 0 - не объединять
+COALESCE_WINDOW = 2
+# Максимальное число текстов уведомлений, показываемых в объединенном уведомлении
+MAX_BODIES = 5
+# Максимальное число сообщений в очереди на отправку, при заполнении очереди
+# syslog-ng повторяет отправку сообщений позже
+QUEUE_SIZE = 1000
+
+# Метрики точки назначения (см. metrics.py)
+SENDER_METRICS = metrics.REGISTRY.get("dbus_sender", metrics.SenderMetrics)
+
+
+def start_timer(delay, callback, *args):
+    timer = threading.Timer(delay, callback, args)
+    timer.daemon = True
+    timer.start()
+
+
+class NotificationCoalescer(object):
+    """
+    Накапливает уведомления с одинаковыми приоритетом и заголовком в течении
+    window секунд и передает их функции emit(priority, title, bodies) одной группой.
+    Критические уведомления передаются сразу, без накопления
+    """
+    def __init__(self, emit, window=COALESCE_WINDOW, schedule=start_timer):
+        self.emit = emit
+        self.window = window
+        # Функция schedule(delay, callback, *args), вызывающая callback через delay секунд
+        self.schedule = schedule
+        self.groups = {}
+        self.lock = threading.Lock()
+
+    def add(self, priority, title, body):
+        if priority == "critical" or self.window <= 0:
+            self.emit(priority, title, [body])
+            return
+        key = (priority, title)
+        with self.lock:
+            group = self.groups.get(key)
+            if group is not None:
+                group.append(body)
+                return
+            self.groups[key] = [body]
+        self.schedule(self.window, self.flush, key)
+
+    def flush(self, key=None):
+        """
+        Передает накопленную группу уведомлений (или все группы, если key не задан)
+        """
+        with self.lock:
+            if key is None:
+                groups, self.groups = self.groups, {}
+            elif key in self.groups:
+                groups = {key: self.groups.pop(key)}
+            else:
+                groups = {}
+        for (priority, title), bodies in groups.items():
+            self.emit(priority, title, bodies)
+
+
+class DispatchThread(threading.Thread):
+    """
+    Поток с собственным циклом событий GLib, в котором уведомления
+    из ограниченной очереди отправляются в системную шину,
+    чтобы медленная шина не блокировала поток syslog-ng
+    """
+    def __init__(self, service, maxsize=QUEUE_SIZE):
+        super(DispatchThread, self).__init__(name="dbus-dispatch")
+        self.daemon = True
+        self.service = service
+        self.queue = Queue(maxsize)
+        self.context = GLib.MainContext()
+        self.loop = GLib.MainLoop(self.context)
+        # Признак того, что выборка из очереди уже запланирована в цикле событий
+        self.scheduled = threading.Event()
+        # Число отправленных и отклоненных из-за заполнения очереди сообщений
+        self.sent = 0
+        self.dropped = 0
+
+    def run(self):
+        self.context.push_thread_default()
+        try:
+            self.loop.run()
+        finally:
+            self.context.pop_thread_default()
+
+    def submit(self, line):
+        """
+        Ставит сообщение в очередь, возвращает False, если очередь заполнена
+        """
+        try:
+            self.queue.put_nowait(line)
+        except Full:
+            self.dropped += 1
+            return False
+        if not self.scheduled.is_set():
+            self.scheduled.set()
+            self.call(self._drain)
+        return True
+
+    def call(self, callback, *args):
+        """
+        Вызывает callback в потоке отправки
+        """
+        source = GLib.idle_source_new()
+        source.set_callback(lambda *_: callback(*args))
+        source.attach(self.context)
+
+    def schedule(self, delay, callback, *args):
+        """
+        Вызывает callback в потоке отправки через delay секунд
+        """
+        source = GLib.timeout_source_new(int(delay * 1000))
+        source.set_callback(lambda *_: callback(*args))
+        source.attach(self.context)
+
+    def stop(self, timeout=5):
+        """
+        Отправляет оставшиеся в очереди и накопленные уведомления и останавливает поток
+        """
+        self.call(self._stop)
+        self.join(timeout)
+
+    def depth(self):
+        return self.queue.qsize()
+
+    def _drain(self):
+        self.scheduled.clear()
+        while True:
+            try:
+                line = self.queue.get_nowait()
+            except Empty:
+                break
+            self.service.send(line)
+            self.sent += 1
+        # Источник событий удаляется после однократного вызова
+        return False
+
+    def _stop(self):
+        self._drain()
+        self.service.coalescer.flush()
+        self.loop.quit()
+        return False
+
 
 class CustomDbusService(dbus.service.Object):
     '''
@@ -26,6 +191,9 @@ class CustomDbusService(dbus.service.Object):
     '''
     def __init__(self, bus, path):
         dbus.service.Object.__init__(self, bus, path)
+        self.coalescer = NotificationCoalescer(self.notify)
+        # Хранилище уведомлений, если задана опция event-store
+        self.store = None
 
     @dbus.service.signal(dbus_interface="org.kde.BroadcastNotifications", signature="a{sv}")
     def Notify(self, msg):
@@ -38,9 +206,19 @@ class CustomDbusService(dbus.service.Object):
 
     def send(self, line):
         try:
-            priority, title = line.split(";")[:2]
-            body = "\n".join(line.split(";")[2:])
+            # Принимаются уведомления как в формате JSON, так и в прежнем формате
+            # с полями, разделенными символом ;, от хостов с необновленными парсерами.
+            # Сообщение может содержать несколько уведомлений, по одному в строке
+            for notification in notification_codec.decode_all(line):
+                if self.store is not None:
+                    self.store.add(notification)
+                self.coalescer.add(notification.priority, notification.title, notification.text())
+        except Exception as e:
+            logging.exception(e)
+            return False
 
+    def notify(self, priority, title, bodies):
+        try:
             if priority == "critical":
                 icon_name = "dialog-error"
             elif priority == "normal":
@@ -48,6 +226,13 @@ class CustomDbusService(dbus.service.Object):
             else:
                 icon_name = "dialog-information"
 
+            # Несколько уведомлений показываются одним с числом событий в заголовке
+            if len(bodies) > 1:
+                title = "%s (%d)" % (title, len(bodies))
+            body = "\n\n".join(bodies[:MAX_BODIES])
+            if len(bodies) > MAX_BODIES:
+                body += "\n\n... и еще %d" % (len(bodies) - MAX_BODIES)
+
             msg = {"appName": "Системные события",
                    "appIcon": icon_name,
                    "body": body,
@@ -58,7 +243,9 @@ class CustomDbusService(dbus.service.Object):
                   }
             logging.debug('%s sent message "%s"' % (type(self).__name__, str(msg).decode("string-escape")))
             # В Python3.x str(msg).decode("string-escape").encode("latin1").decode("utf-8")
+            started = metrics.timer()
             self.Notify(msg)
+            SENDER_METRICS.signal(metrics.timer() - started)
         except Exception as e:
             logging.exception(e)
             return False
@@ -74,6 +261,23 @@ class DbusSender(object):
 
     def init(self, options):
         logging.info("%s is running..." % type(self).__name__)
+        # Интервал объединения уведомлений и размер очереди задаются
+        # опциями coalesce-window и queue-size в astra-custom.conf
+        options = options or {}
+        if "coalesce-window" in options:
+            self.service.coalescer.window = float(options["coalesce-window"])
+        self.dispatcher = DispatchThread(self.service, int(options.get("queue-size", QUEUE_SIZE)))
+        self.service.coalescer.schedule = self.dispatcher.schedule
+        # Уведомления сохраняются в хранилище в каталоге, заданном опцией event-store
+        # (на АРМ-АБИ), хранение ограничивается опцией retention-days
+        if options.get("event-store"):
+            self.service.store = EventStore(options["event-store"],
+                                            int(options.get("retention-days", RETENTION_DAYS)))
+            self.service.store.start()
+        SENDER_METRICS.dispatcher = self.dispatcher
+        SENDER_METRICS.store = self.service.store
+        metrics.start_exporters(options)
+        self.dispatcher.start()
         return True
 
     def send(self, msg):
@@ -82,14 +286,25 @@ class DbusSender(object):
             # с заданной в настройках периодичностью (по умолчанию 20 мин)
             # для информирования получателя о работающем соединении
             if msg["MESSAGE"]:
+                SENDER_METRICS.received()
                 logging.debug('%s recieved message "%s"' % (type(self).__name__, msg["MESSAGE"]))
-                self.service.send(msg["MESSAGE"])
-                return True
+                if self.dispatcher.submit(msg["MESSAGE"]):
+                    return True
+                logging.warning("%s queue is full (%d messages dropped), retry later"
+                                % (type(self).__name__, self.dispatcher.dropped))
+                return RETRY
             return False
         except Exception as e:
             logging.exception(e)
             return False
 
     def deinit(self):
-        logging.info("%s is stoped..." % type(self).__name__)
+        self.dispatcher.stop()
+        logging.info("%s is stoped (sent: %d, dropped: %d, queued: %d)..."
+                     % (type(self).__name__, self.dispatcher.sent, self.dispatcher.dropped, self.dispatcher.depth()))
+        store = self.service.store
+        if store is not None:
+            store.stop()
+            self.service.store = None
+            logging.info("event store is stoped (stored: %d, dropped: %d)" % (store.stored, store.dropped))
         return True
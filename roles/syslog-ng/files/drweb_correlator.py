@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+
+import time
+import unittest
+from collections import deque, OrderedDict
+from datetime import datetime, timedelta
+
+from events_parser import GRAMMARS
+
+# Максимальное число незавершенных инцидентов, одновременно хранимых в окне
+MAX_INCIDENTS = 1024
+# Максимальное время (сек) ожидания окончательного действия над объектом,
+# отсчитываемое по времени записей drweb.log
+INCIDENT_WINDOW = 5
+# Число инцидентов одной проверки, о которых уведомляется по отдельности,
+# об остальных сообщается в сводке по проверке (0 - без ограничения)
+SCAN_BURST = 10
+# Время (сек) без записей проверки, после которого она считается завершенной
+SCAN_WINDOW = 30
+# Максимальное число одновременно отслеживаемых проверок
+MAX_SCANS = 64
+
+# Действия над зараженным объектом, после окончательного действия инцидент завершен
+ACTIONS = {"Cure failed": "не удалось вылечить",
+           "Cured": "вылечен",
+           "Quarantined": "перемещен в карантин",
+           "Deleted": "удален"}
+FINAL_ACTIONS = frozenset(("Cured", "Quarantined", "Deleted"))
+
+
+class DrwebIncident(object):
+    """
+    Записи drweb.log об одном зараженном объекте: обнаружение угрозы
+    и действия над объектом процесса проверки [FC-pid]
+    """
+    __slots__ = ("scan", "path", "threat", "actions", "opened")
+
+    def __init__(self, scan, path, opened):
+        self.scan = scan
+        self.path = path
+        self.threat = None
+        self.actions = []
+        self.opened = opened
+
+
+class DrwebScan(object):
+    """
+    Итоги проверки одним процессом [FC-pid]
+    """
+    __slots__ = ("pid", "opened", "updated", "detected", "sent", "actions")
+
+    def __init__(self, pid, opened):
+        self.pid = pid
+        self.opened = opened
+        self.updated = opened
+        # Число завершенных инцидентов и число отправленных по отдельности
+        self.detected = 0
+        self.sent = 0
+        # Число объектов по окончательному действию
+        self.actions = {}
+
+    @property
+    def folded(self):
+        return self.detected - self.sent
+
+
+class DrwebCorrelator(object):
+    """
+    Собирает записи drweb.log об угрозе (Threats, Cure failed, Quarantined)
+    в инциденты по идентификатору процесса проверки и пути к объекту
+    в ограниченном окне. Инцидент возвращается после окончательного действия
+    над объектом, при массовом обнаружении угроз одной проверкой об инцидентах
+    сверх burst сообщается сводкой после завершения проверки
+    """
+    def __init__(self, burst=SCAN_BURST, max_incidents=MAX_INCIDENTS, window=INCIDENT_WINDOW,
+                 scan_window=SCAN_WINDOW, max_scans=MAX_SCANS):
+        self.burst = burst
+        self.max_incidents = max_incidents
+        self.window = window
+        self.scan_window = scan_window
+        self.max_scans = max_scans
+        # Незавершенные инциденты по (pid, путь) в порядке поступления
+        self.incidents = OrderedDict()
+        # Проверки по pid в порядке последней записи
+        self.scans = OrderedDict()
+        # Инциденты и сводки, завершенные по истечении окна, при переполнении
+        # отбрасываются самые старые
+        self.ready = deque(maxlen=max_incidents)
+        # Время последней записи и системное время ее получения, по которым
+        # определяется текущее время записей при отсутствии новых записей
+        self.last = None
+
+    def feed(self, line, dt):
+        """
+        Обрабатывает очередную запись drweb.log со временем dt, возвращает
+        завершенный инцидент или None, если уведомлять о нем пока не нужно
+        """
+        fields = GRAMMARS["drweb.line"].match(line)
+        if fields is None:
+            return None
+        pid, kind, text = fields.group("pid", "kind", "text")
+        self.last = (dt, time.time())
+        self._expire(dt)
+        scan = self._scan(pid, dt)
+
+        if kind == "Threats":
+            threat = GRAMMARS["drweb.threat"].match(text)
+            if threat is None:
+                return None
+            path, name = threat.group("path", "threat")
+        elif kind in ACTIONS:
+            action = GRAMMARS["drweb.path"].match(text)
+            if action is None:
+                return None
+            path = action.group("path")
+        else:
+            return None
+
+        key = (pid, path)
+        incident = self.incidents.get(key)
+        if incident is None:
+            incident = self.incidents[key] = DrwebIncident(scan, path, dt)
+            if len(self.incidents) > self.max_incidents:
+                self._complete(self.incidents.popitem(last=False)[1], self.ready)
+        if kind == "Threats":
+            incident.threat = name
+            return None
+        incident.actions.append(kind)
+        if kind not in FINAL_ACTIONS:
+            return None
+        del self.incidents[key]
+        result = []
+        self._complete(incident, result)
+        return result[0] if result else None
+
+    def pop_ready(self):
+        """
+        Возвращает все инциденты и сводки по проверкам, завершенные
+        по истечении окна, начиная с самых старых
+        """
+        ready = []
+        while self.ready:
+            ready.append(self.ready.popleft())
+        return ready
+
+    def flush(self, now=None):
+        """
+        Завершает инциденты и проверки, окна которых истекли без новых записей,
+        и возвращает все завершенные по истечении окна (см. pop_ready).
+        Текущее время записей - время последней записи, увеличенное на время (сек),
+        прошедшее с ее получения до now (по умолчанию time.time())
+        """
+        last = self.last
+        if last is not None:
+            dt, received = last
+            self._expire(dt + timedelta(seconds=max(0, (now or time.time()) - received)))
+        return self.pop_ready()
+
+    def _scan(self, pid, dt):
+        # Проверка переносится в конец, чтобы проверки были упорядочены по последней записи
+        scan = self.scans.pop(pid, None)
+        if scan is None:
+            scan = DrwebScan(pid, dt)
+        scan.updated = dt
+        self.scans[pid] = scan
+        if len(self.scans) > self.max_scans:
+            self._finish(self.scans.popitem(last=False)[1])
+        return scan
+
+    def _complete(self, incident, ready):
+        scan = incident.scan
+        action = incident.actions[-1] if incident.actions else None
+        scan.actions[action] = scan.actions.get(action, 0) + 1
+        scan.detected += 1
+        if self.burst and scan.sent >= self.burst:
+            return
+        scan.sent += 1
+        ready.append(incident)
+
+    def _finish(self, scan):
+        if scan.folded:
+            self.ready.append(scan)
+
+    def _expire(self, dt):
+        # Инциденты и проверки упорядочены по времени, поэтому просроченные в начале
+        while self.incidents:
+            key, incident = next(iter(self.incidents.items()))
+            if (dt - incident.opened).total_seconds() <= self.window:
+                break
+            del self.incidents[key]
+            self._complete(incident, self.ready)
+        while self.scans:
+            pid, scan = next(iter(self.scans.items()))
+            if (dt - scan.updated).total_seconds() <= self.scan_window:
+                break
+            # Проверка завершается после ее незавершенных инцидентов
+            if any(incident.scan is scan for incident in self.incidents.values()):
+                break
+            del self.scans[pid]
+            self._finish(scan)
+
+
+def format_incident(incident):
+    """
+    Возвращает строки уведомления об инциденте
+    """
+    actions = [ACTIONS[action] for action in incident.actions]
+    return ['Обнаружена угроза: "%s"' % incident.path,
+            "Вредоносное ПО: %s" % (incident.threat or "не определено"),
+            "Результат: %s" % (", ".join(actions) if actions else "действие не выполнено")]
+
+
+def format_summary(scan):
+    """
+    Возвращает строки сводки по проверке с массовым обнаружением угроз
+    """
+    lines = ["Проверка FC-%s: обнаружено угроз %d, в отдельных уведомлениях %d"
+             % (scan.pid, scan.detected, scan.sent)]
+    for action, count in sorted(scan.actions.items(), key=lambda item: item[1], reverse=True):
+        lines.append("%s: %d" % (ACTIONS.get(action, "действие не выполнено"), count))
+    return lines
+
+
+class TestDrwebCorrelator(unittest.TestCase):
+
+    start = datetime(2025, 8, 12, 14, 31, 15)
+
+    def line(self, seconds, kind, path, pid=1733):
+        prefix = "%s [FC-%d]" % ((self.start + timedelta(seconds=seconds)).strftime("%Y-%b-%d %H:%M:%S"), pid)
+        if kind == "Threats":
+            return '%s Notice: Threats: LinuxSpider-1548: "%s" - infected with EICAR Test File' % (prefix, path)
+        return '%s Notice: %s: "%s"' % (prefix, kind, path)
+
+    def feed(self, correlator, seconds, kind, path, pid=1733):
+        return correlator.feed(self.line(seconds, kind, path, pid), self.start + timedelta(seconds=seconds))
+
+    def test_incident_completed_by_final_action(self):
+        correlator = DrwebCorrelator()
+        self.assertIsNone(self.feed(correlator, 0, "Threats", "/tmp/eicar"))
+        self.assertIsNone(self.feed(correlator, 0, "Cure failed", "/tmp/eicar"))
+        incident = self.feed(correlator, 1, "Quarantined", "/tmp/eicar")
+        self.assertEqual(format_incident(incident),
+                         ['Обнаружена угроза: "/tmp/eicar"',
+                          "Вредоносное ПО: EICAR Test File",
+                          "Результат: не удалось вылечить, перемещен в карантин"])
+        self.assertEqual(correlator.pop_ready(), [])
+
+    def test_incident_without_final_action_flushed_on_expiry(self):
+        correlator = DrwebCorrelator(window=5)
+        self.feed(correlator, 0, "Threats", "/tmp/eicar")
+        received = correlator.last[1]
+        # Новых записей нет, окно ожидания окончательного действия еще не истекло
+        self.assertEqual(correlator.flush(received + 5), [])
+        ready = correlator.flush(received + 6)
+        self.assertEqual(len(ready), 1)
+        self.assertEqual(format_incident(ready[0])[-1], "Результат: действие не выполнено")
+        self.assertEqual(correlator.flush(received + 7), [])
+
+    def test_folded_incidents_summary_flushed_after_scan(self):
+        correlator = DrwebCorrelator(burst=2, scan_window=30)
+        sent = [self.feed(correlator, 0, "Quarantined", "/tmp/eicar%d" % i) for i in range(5)]
+        self.assertEqual(len([incident for incident in sent if incident is not None]), 2)
+        received = correlator.last[1]
+        self.assertEqual(correlator.flush(received + 30), [])
+        ready = correlator.flush(received + 31)
+        self.assertEqual(len(ready), 1)
+        self.assertTrue(isinstance(ready[0], DrwebScan))
+        self.assertEqual(format_summary(ready[0]),
+                         ["Проверка FC-1733: обнаружено угроз 5, в отдельных уведомлениях 2",
+                          "перемещен в карантин: 5"])
+
+    def test_all_ready_items_returned(self):
+        correlator = DrwebCorrelator(window=5)
+        for i in range(3):
+            self.feed(correlator, 0, "Threats", "/tmp/eicar%d" % i)
+        self.assertIsNone(self.feed(correlator, 10, "Threats", "/tmp/other", pid=1800))
+        self.assertEqual([incident.path for incident in correlator.pop_ready()],
+                         ["/tmp/eicar0", "/tmp/eicar1", "/tmp/eicar2"])
+
+    def test_flush_without_records(self):
+        self.assertEqual(DrwebCorrelator().flush(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
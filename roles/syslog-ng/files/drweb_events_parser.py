@@ -1,26 +1,51 @@
 # -*- coding: utf-8 -*-
 
-import logging
-import re
-from dateutil import parser
+import threading
 
-from events_parser import EventsParser, hostname
+from drweb_correlator import DrwebCorrelator, DrwebScan, INCIDENT_WINDOW, SCAN_BURST, format_incident, format_summary
+from events_parser import EventsParser, TimestampDecoder
 
 class DrwebEventsParser(EventsParser):
-    def parse(self, msg):
-        try:
-            super(DrwebEventsParser, self).parse(msg)
-            # Первые 21 символ сообщения это дата и время
-            dt = parser.parse(self.message[:22], fuzzy=True)
-
-            result = re.search(r'(.*:\s*)(".*")(.*)', self.message)
-
-            title = "Угроза вредоносного ПО"
-            priority = "critical"
-            body = "{0};Обнаружена угроза: {1};{2}".format(dt.strftime("%Y-%m-%d %H:%M:%S"), result.group(2), result.group(3))
-
-            msg["notification"] = ";".join((priority, title, body))
-            return True
-        except Exception as e:
-            logging.exception(e)
+    # Первые 20 символов сообщения это дата и время вида 2025-Aug-12 14:31:15
+    timestamp = TimestampDecoder("%Y-%b-%d %H:%M:%S", 20)
+
+    def init(self, options):
+        if not super(DrwebEventsParser, self).init(options):
             return False
+        # Записи об угрозе, попытке лечения и перемещении в карантин одного объекта
+        # объединяются в один инцидент. Опция scan-burst задает число инцидентов
+        # одной проверки, о которых уведомляется по отдельности (0 - без ограничения),
+        # incident-window - время (сек) ожидания окончательного действия над объектом
+        options = options or {}
+        self.correlator = DrwebCorrelator(int(options.get("scan-burst", SCAN_BURST)),
+                                          window=int(options.get("incident-window", INCIDENT_WINDOW)))
+        self.lock = threading.Lock()
+        return True
+
+    def parse_message(self, message):
+        dt = self.timestamp.decode(message)
+
+        # Окно корреляции общее для всех потоков, поэтому записи
+        # добавляются в него под блокировкой
+        with self.lock:
+            # Инциденты и сводки по проверкам, завершенные по истечении окна,
+            # отправляются вместе со следующим сообщением
+            item = self.correlator.feed(message, dt)
+            items = self.correlator.pop_ready()
+        if item is not None:
+            items.append(item)
+        return [self.notification(item) for item in items]
+
+    def flush(self):
+        # Инциденты без окончательного действия и сводки по завершенным проверкам
+        # отправляются по истечении окна, не дожидаясь следующих записей drweb.log
+        with self.lock:
+            items = self.correlator.flush()
+        return [self.notification(item) for item in items]
+
+    def notification(self, item):
+        title = "Угроза вредоносного ПО"
+        priority = "critical"
+        if isinstance(item, DrwebScan):
+            return priority, title, item.updated, format_summary(item)
+        return priority, title, item.opened, format_incident(item)
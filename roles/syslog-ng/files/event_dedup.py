@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+import unittest
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+# Интервал времени (сек), в течении которого повторяющиеся события отбрасываются
+DEDUP_WINDOW = 5
+# Максимальное число одновременно отслеживаемых ключей,
+# при превышении отбрасываются ключи с самыми давними окнами
+MAX_KEYS = 1024
+
+
+class DedupWindow(object):
+    __slots__ = ("key", "opened", "suppressed")
+
+    def __init__(self, key, opened):
+        self.key = key
+        # Время первого события окна
+        self.opened = opened
+        # Число отброшенных в окне событий
+        self.suppressed = 0
+
+
+class Deduplicator(object):
+    """
+    Подавление повторяющихся событий с ограничением памяти.
+    Первое событие с ключом открывает окно длительностью window секунд,
+    последующие события с тем же ключом в пределах окна отбрасываются
+    и подсчитываются, число отброшенных событий возвращается при закрытии окна.
+    Ключом может быть любой хешируемый объект, например (message_id, host)
+
+    Окна фиксированные: отсчитываются от первого события и не продлеваются
+    повторами, поэтому при непрерывных повторах событие пропускается
+    каждые window секунд (вместе со сводкой по предыдущему окну).
+    Оператор продолжает получать уведомления о длящейся активности,
+    а скользящее окно подавляло бы ее целиком. Кроме того, окна хранятся
+    в порядке открытия и просроченные окна всегда находятся в начале
+    """
+    def __init__(self, window=DEDUP_WINDOW, max_keys=MAX_KEYS):
+        self.window = window
+        self.max_keys = max_keys
+        # Открытые окна в порядке их открытия
+        self.windows = OrderedDict()
+        # Закрытые окна с отброшенными событиями, о которых еще не сообщено
+        self.closed = []
+        # Время последнего события и системное время его получения,
+        # по которым определяется текущее время событий при отсутствии новых событий
+        self.last = None
+        self.lock = threading.Lock()
+
+    def check(self, key, dt):
+        """
+        Возвращает True, если событие с ключом key и временем dt нужно
+        пропустить, и False, если оно является повтором и отброшено
+        """
+        with self.lock:
+            self.last = (dt, time.time())
+            self._expire(dt)
+            window = self.windows.get(key)
+            if window is not None:
+                window.suppressed += 1
+                return False
+            self.windows[key] = DedupWindow(key, dt)
+            if len(self.windows) > self.max_keys:
+                self._close(next(iter(self.windows)))
+            return True
+
+    def summary(self, dt):
+        """
+        Возвращает список пар (ключ, число отброшенных событий)
+        для окон, закрытых к моменту времени dt
+        """
+        with self.lock:
+            self._expire(dt)
+            closed, self.closed = self.closed, []
+        return [(window.key, window.suppressed) for window in closed]
+
+    def current_time(self, now=None):
+        """
+        Возвращает текущее время в шкале времени событий: время последнего
+        события, увеличенное на время (сек), прошедшее с его получения до now
+        (по умолчанию time.time()), или None, если событий не было
+        """
+        last = self.last
+        if last is None:
+            return None
+        dt, received = last
+        return dt + timedelta(seconds=max(0, (now or time.time()) - received))
+
+    def _expire(self, dt):
+        # Окна упорядочены по времени открытия, поэтому просроченные окна в начале
+        while self.windows:
+            key, window = next(iter(self.windows.items()))
+            if (dt - window.opened).total_seconds() < self.window:
+                break
+            self._close(key)
+
+    def _close(self, key):
+        window = self.windows.pop(key)
+        if window.suppressed:
+            self.closed.append(window)
+            # Ограничить число несообщенных окон, оставив самые свежие
+            del self.closed[:-self.max_keys]
+
+
+class TestDeduplicator(unittest.TestCase):
+
+    start = datetime(2025, 8, 12, 14, 31, 15)
+
+    def at(self, seconds):
+        return self.start + timedelta(seconds=seconds)
+
+    def test_repeats_suppressed_within_window(self):
+        dedup = Deduplicator(window=5)
+        self.assertTrue(dedup.check("a", self.at(0)))
+        self.assertFalse(dedup.check("a", self.at(1)))
+        self.assertFalse(dedup.check("a", self.at(2)))
+        self.assertTrue(dedup.check("b", self.at(3)))
+        self.assertEqual(dedup.summary(self.at(4)), [])
+        self.assertTrue(dedup.check("a", self.at(6)))
+        self.assertEqual(dedup.summary(self.at(6)), [("a", 2)])
+        self.assertEqual(dedup.summary(self.at(20)), [])
+
+    def test_fixed_window_not_extended_by_repeats(self):
+        dedup = Deduplicator(window=5)
+        passed = [seconds for seconds in range(12) if dedup.check("a", self.at(seconds))]
+        self.assertEqual(passed, [0, 5, 10])
+        self.assertEqual(dedup.summary(self.at(10)), [("a", 4), ("a", 4)])
+
+    def test_flush_on_expiry_without_new_events(self):
+        dedup = Deduplicator(window=5)
+        dedup.check("a", self.at(0))
+        dedup.check("a", self.at(1))
+        received = dedup.last[1]
+        self.assertEqual(dedup.summary(dedup.current_time(received + 3)), [])
+        dt = dedup.current_time(received + 4)
+        self.assertEqual(dt, self.at(5))
+        self.assertEqual(dedup.summary(dt), [("a", 1)])
+
+    def test_keys_bounded(self):
+        dedup = Deduplicator(window=5, max_keys=2)
+        for key in ("a", "a", "b", "c"):
+            dedup.check(key, self.at(0))
+        self.assertEqual(list(dedup.windows), ["b", "c"])
+        self.assertEqual(dedup.summary(self.at(0)), [("a", 1)])
+
+    def test_no_events(self):
+        self.assertIsNone(Deduplicator().current_time())
+
+
+if __name__ == "__main__":
+    unittest.main()
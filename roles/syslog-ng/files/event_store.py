@@ -0,0 +1,380 @@
+# -*- coding: utf-8 -*-
+"""
+Хранилище уведомлений на АРМ-АБИ, записываемое точкой назначения DbusSender.
+Уведомления записываются в базы SQLite в режиме WAL, по одной базе (сегменту)
+на сутки получения: events-ГГГГММДД.db. Записи только добавляются, пачками
+в одной транзакции из отдельного потока, хранение ограничивается удалением
+сегментов старше заданного числа суток. Таблица индексирована по времени
+события, хосту, источнику (заголовку уведомления) и приоритету.
+
+Выборка уведомлений:
+python -m event_store [-d /var/lib/notifications] [--since 24h] [--until ...]
+    [--host arm-o-2] [--source "Угроза вредоносного ПО"] [--priority critical]
+    [--limit 100] [--count]
+"""
+
+from __future__ import print_function
+
+import argparse
+import glob
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import unittest
+try:
+    from Queue import Queue, Empty, Full
+except ImportError:
+    from queue import Queue, Empty, Full
+
+import notification_codec
+
+STORE_DIR = "/var/lib/notifications"
+# Число суток хранения сегментов, 0 - хранить все
+RETENTION_DAYS = 90
+# Число уведомлений, записываемых одной транзакцией, и наибольшее время (сек)
+# ожидания пачки, после которого накопленные уведомления записываются
+BATCH_SIZE = 500
+FLUSH_INTERVAL = 1
+# Максимальное число уведомлений в очереди на запись,
+# при переполнении уведомления не сохраняются (но отображаются)
+QUEUE_SIZE = 10000
+
+SEGMENT_FORMAT = "events-%Y%m%d.db"
+SEGMENT_RE = re.compile(r'events-(\d{8})\.db$')
+PRIORITIES = ("low", "normal", "critical")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    ts INTEGER NOT NULL,
+    received INTEGER NOT NULL,
+    host TEXT,
+    source TEXT NOT NULL,
+    priority TEXT NOT NULL,
+    body TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_ts ON events (ts);
+CREATE INDEX IF NOT EXISTS events_host ON events (host, ts);
+CREATE INDEX IF NOT EXISTS events_source ON events (source, ts);
+CREATE INDEX IF NOT EXISTS events_priority ON events (priority, ts);
+"""
+
+
+def _text(value):
+    # В Python 2.7 строки передаются в sqlite3 как unicode
+    if isinstance(value, bytes) and str is bytes:
+        return value.decode("utf-8")
+    return value
+
+
+def event_time(notification, received):
+    """
+    Возвращает время события уведомления в секундах или время получения,
+    если время события не задано (уведомления в прежнем формате)
+    """
+    if notification.time:
+        try:
+            return int(time.mktime(time.strptime(notification.time, notification_codec.TIME_FORMAT)))
+        except ValueError:
+            pass
+    return int(received)
+
+
+def connect(path):
+    connection = sqlite3.connect(path, check_same_thread=False)
+    connection.execute("PRAGMA journal_mode=WAL")
+    # В режиме WAL synchronous=NORMAL не нарушает целостность базы при сбое,
+    # могут быть потеряны только последние транзакции
+    connection.execute("PRAGMA synchronous=NORMAL")
+    return connection
+
+
+def segments(directory, since=None):
+    """
+    Возвращает пути сегментов, упорядоченные по дате, начиная с сегмента суток
+    перед since: уведомление записывается в сегмент суток получения,
+    которое не раньше времени события (с учетом расхождения часов хостов)
+    """
+    first = time.strftime("%Y%m%d", time.localtime(since - 86400)) if since else ""
+    result = []
+    for path in sorted(glob.glob(os.path.join(directory, "events-*.db"))):
+        match = SEGMENT_RE.search(path)
+        if match and match.group(1) >= first:
+            result.append(path)
+    return result
+
+
+def segment_end(path):
+    """
+    Возвращает время окончания суток сегмента: время событий уведомлений
+    сегмента не позже времени их получения
+    """
+    day = SEGMENT_RE.search(path).group(1)
+    return time.mktime(time.strptime(day, "%Y%m%d")) + 86400
+
+
+class EventStore(threading.Thread):
+    """
+    Поток записи уведомлений в текущий сегмент хранилища
+    """
+    def __init__(self, directory=STORE_DIR, retention_days=RETENTION_DAYS, maxsize=QUEUE_SIZE):
+        super(EventStore, self).__init__(name="event-store")
+        self.daemon = True
+        self.directory = directory
+        self.retention_days = retention_days
+        self.queue = Queue(maxsize)
+        self.connection = None
+        self.segment = None
+        # Число записанных и не сохраненных из-за заполнения очереди уведомлений
+        self.stored = 0
+        self.dropped = 0
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def add(self, notification, received=None):
+        """
+        Ставит уведомление в очередь на запись, возвращает False, если очередь заполнена
+        """
+        try:
+            self.queue.put_nowait((notification, received or time.time()))
+            return True
+        except Full:
+            self.dropped += 1
+            return False
+
+    def stop(self, timeout=5):
+        """
+        Записывает оставшиеся в очереди уведомления и останавливает поток
+        """
+        self.queue.put(None)
+        self.join(timeout)
+
+    def run(self):
+        stopped = False
+        while not stopped:
+            batch = []
+            deadline = time.time() + FLUSH_INTERVAL
+            while len(batch) < BATCH_SIZE:
+                try:
+                    item = self.queue.get(timeout=max(0, deadline - time.time()))
+                except Empty:
+                    break
+                if item is None:
+                    stopped = True
+                    break
+                batch.append(item)
+            if batch:
+                try:
+                    self._write(batch)
+                except Exception as e:
+                    logging.exception(e)
+        if self.connection is not None:
+            self.connection.close()
+
+    def _write(self, batch):
+        # Сегмент определяется по времени получения последнего уведомления пачки
+        self._rotate(batch[-1][1])
+        rows = [(event_time(notification, received), int(received), _text(notification.host),
+                 _text(notification.title), _text(notification.priority),
+                 _text("\n".join(notification.lines)))
+                for notification, received in batch]
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO events (ts, received, host, source, priority, body) VALUES (?, ?, ?, ?, ?, ?)", rows)
+        self.stored += len(rows)
+
+    def _rotate(self, received):
+        segment = time.strftime(SEGMENT_FORMAT, time.localtime(received))
+        if segment == self.segment:
+            return
+        if self.connection is not None:
+            self.connection.close()
+        self.connection = connect(os.path.join(self.directory, segment))
+        self.connection.executescript(SCHEMA)
+        self.segment = segment
+        self._expire(received)
+
+    def _expire(self, now):
+        if not self.retention_days:
+            return
+        first = time.strftime("%Y%m%d", time.localtime(now - self.retention_days * 86400))
+        for path in glob.glob(os.path.join(self.directory, "events-*.db")):
+            match = SEGMENT_RE.search(path)
+            if match and match.group(1) < first:
+                for name in (path, path + "-wal", path + "-shm"):
+                    if os.path.exists(name):
+                        os.remove(name)
+                logging.info("event store segment %s is expired" % path)
+
+
+def _where(since, until, host, source, priorities):
+    conditions = []
+    params = []
+    if since:
+        conditions.append("ts >= ?")
+        params.append(int(since))
+    if until:
+        conditions.append("ts < ?")
+        params.append(int(until))
+    if host:
+        conditions.append("host = ?")
+        params.append(_text(host))
+    if source:
+        conditions.append("source = ?")
+        params.append(_text(source))
+    if priorities:
+        conditions.append("priority IN (%s)" % ", ".join("?" * len(priorities)))
+        params.extend(priorities)
+    return (" WHERE " + " AND ".join(conditions) if conditions else ""), params
+
+
+def _execute(path, sql, params):
+    connection = sqlite3.connect(path)
+    try:
+        return connection.execute(sql, params).fetchall()
+    except sqlite3.OperationalError as e:
+        logging.warning("event store segment %s is not available: %s" % (path, e))
+        return []
+    finally:
+        connection.close()
+
+
+def query(directory, since=None, until=None, host=None, source=None, priorities=None, limit=None):
+    """
+    Возвращает уведомления кортежами (время события, хост, приоритет, источник, текст),
+    упорядоченные по времени события, начиная с последних
+    """
+    where, params = _where(since, until, host, source, priorities)
+    sql = "SELECT ts, host, priority, source, body FROM events%s ORDER BY ts DESC" % where
+    if limit:
+        sql += " LIMIT %d" % limit
+    # Сегменты просматриваются от последнего, пока в предыдущих сегментах
+    # могут быть уведомления новее уже набранных limit уведомлений
+    rows = []
+    for path in reversed(segments(directory, since)):
+        if limit and len(rows) >= limit and rows[limit - 1][0] >= segment_end(path):
+            break
+        rows.extend(_execute(path, sql, params))
+        rows.sort(key=lambda row: row[0], reverse=True)
+    return rows[:limit] if limit else rows
+
+
+def count(directory, since=None, until=None, host=None, source=None, priorities=None):
+    """
+    Возвращает число уведомлений, удовлетворяющих условиям
+    """
+    where, params = _where(since, until, host, source, priorities)
+    total = 0
+    for path in segments(directory, since):
+        # Недоступный (заблокированный, поврежденный) сегмент пропускается, как и в query
+        rows = _execute(path, "SELECT COUNT(*) FROM events" + where, params)
+        if rows:
+            total += rows[0][0]
+    return total
+
+
+def parse_time(value):
+    """
+    Возвращает время в секундах по относительному значению (30m, 24h, 7d)
+    или по дате и времени (2025-08-12, 2025-08-12 14:31:15)
+    """
+    match = re.match(r'^(\d+)([smhd])$', value)
+    if match:
+        return time.time() - int(match.group(1)) * {"s": 1, "m": 60, "h": 3600, "d": 86400}[match.group(2)]
+    for fmt in (notification_codec.TIME_FORMAT, "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return time.mktime(time.strptime(value, fmt))
+        except ValueError:
+            pass
+    raise argparse.ArgumentTypeError("invalid time: %s" % value)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Выборка уведомлений из хранилища АРМ-АБИ")
+    arg_parser.add_argument("-d", "--directory", default=STORE_DIR)
+    arg_parser.add_argument("--since", type=parse_time, help="начало периода: 24h, 7d или 2025-08-12 14:00")
+    arg_parser.add_argument("--until", type=parse_time)
+    arg_parser.add_argument("--host")
+    arg_parser.add_argument("--source", help="заголовок уведомления")
+    arg_parser.add_argument("--priority", choices=PRIORITIES, action="append")
+    arg_parser.add_argument("--limit", type=int, default=100, help="0 - без ограничения")
+    arg_parser.add_argument("--count", action="store_true", help="вывести только число уведомлений")
+    args = arg_parser.parse_args()
+
+    started = time.time()
+    if args.count:
+        total = count(args.directory, args.since, args.until, args.host, args.source, args.priority)
+        print(total)
+    else:
+        rows = query(args.directory, args.since, args.until, args.host, args.source, args.priority, args.limit)
+        total = len(rows)
+        for ts, host, priority, source, body in rows:
+            line = "%s  %-12s %-8s %s: %s" % (time.strftime(notification_codec.TIME_FORMAT, time.localtime(ts)),
+                                              host or "-", priority, source, body.replace("\n", " | "))
+            print(line.encode("utf-8") if str is bytes else line)
+    print("%d events, %.1f ms" % (total, (time.time() - started) * 1000), file=sys.stderr)
+
+
+class TestEventStore(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="event_store.")
+        self.now = time.mktime(time.strptime("2025-08-12 14:31:15", notification_codec.TIME_FORMAT))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def fill(self, notifications):
+        store = EventStore(self.directory, retention_days=0)
+        store.start()
+        for notification, received in notifications:
+            store.queue.put((notification, received))
+        store.stop(timeout=None)
+        return store
+
+    def notification(self, received, host="arm-o-1", priority="critical", text="event"):
+        return (notification_codec.Notification(priority, "Угроза вредоносного ПО",
+                                                time.strftime(notification_codec.TIME_FORMAT,
+                                                              time.localtime(received)),
+                                                host, [text]), received)
+
+    def test_query_and_count(self):
+        # Пачка записывается в сегмент суток получения ее последнего уведомления
+        self.fill([self.notification(self.now - 86400, text="yesterday")])
+        store = self.fill([self.notification(self.now, host="arm-o-2", priority="low", text="today"),
+                           self.notification(self.now + 1, text="latest")])
+        self.assertEqual(store.stored, 2)
+        self.assertEqual(len(segments(self.directory)), 2)
+        self.assertEqual([row[4] for row in query(self.directory)], ["latest", "today", "yesterday"])
+        self.assertEqual([row[4] for row in query(self.directory, limit=1)], ["latest"])
+        self.assertEqual(count(self.directory, priorities=["critical"]), 2)
+        self.assertEqual(count(self.directory, since=self.now - 60, host="arm-o-2"), 1)
+
+    def test_missing_directory(self):
+        missing = os.path.join(self.directory, "missing")
+        self.assertEqual(query(missing), [])
+        self.assertEqual(count(missing), 0)
+
+    def test_unavailable_segment_skipped(self):
+        self.fill([self.notification(self.now)])
+        # Сегмент без таблицы events (например, поврежденный) пропускается
+        with open(os.path.join(self.directory, time.strftime(SEGMENT_FORMAT, time.localtime(self.now - 86400))),
+                  "w"):
+            pass
+        self.assertEqual(len(segments(self.directory)), 2)
+        self.assertEqual(count(self.directory), 1)
+        self.assertEqual(len(query(self.directory)), 1)
+
+    def test_parse_time(self):
+        self.assertEqual(parse_time("2025-08-12 14:31:15"), self.now)
+        self.assertAlmostEqual(parse_time("24h"), time.time() - 86400, delta=5)
+        self.assertRaises(argparse.ArgumentTypeError, parse_time, "yesterday")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,15 +5,24 @@ from dateutil import parser, tz
 import json
 import logging
 import os
+import random
 import re
 import socket
 import sys
 import subprocess
+import unittest
 
+from event_dedup import Deduplicator, DEDUP_WINDOW
+import metrics
+import notification_codec
 
 hostname = socket.gethostname()
 appname = os.path.basename(__file__).split(".")[0]
 
+# Сообщение источника s_events_tick (см. astra-custom.j2), по которому парсеры
+# отправляют уведомления, не дожидаясь следующего события (см. EventsParser.flush)
+TICK_MESSAGE = "events-parser-tick"
+
 
 logging.basicConfig(filename="/var/log/%s.log" % appname,
                     format="%(asctime)s %(message)s",
@@ -21,28 +30,331 @@ logging.basicConfig(filename="/var/log/%s.log" % appname,
                     level=logging.INFO)
 
 
+def native_str(value):
+    """
+    Возвращает строку в кодировке utf-8 в Python 2.7, т.к. json.loads возвращает unicode,
+    который нельзя объединять с кириллическими str, в Python 3 строка не изменяется
+    """
+    if str is bytes and not isinstance(value, str):
+        return value.encode("utf-8")
+    return value
+
+
+class TimestampDecoder(object):
+    """
+    Декодер даты и времени в начале сообщения фиксированного формата.
+    Сообщения пачки, как правило, имеют одинаковое время с точностью до секунды,
+    поэтому результат последнего декодирования запоминается по префиксу строки
+    """
+    def __init__(self, fmt, width):
+        # Формат даты и времени для datetime.strptime, если None
+        # или строка не соответствует формату - используется dateutil.parser
+        self.fmt = fmt
+        # Длина префикса строки, содержащего дату и время
+        self.width = width
+        # Префикс и результат последнего декодирования хранятся в одном кортеже,
+        # чтобы декодер можно было использовать из нескольких потоков
+        self.last = (None, None)
+
+    def decode(self, text):
+        prefix = text[:self.width]
+        last_prefix, last_dt = self.last
+        if prefix == last_prefix:
+            return last_dt
+        dt = self._parse(prefix)
+        self.last = (prefix, dt)
+        return dt
+
+    def _parse(self, prefix):
+        if self.fmt is not None:
+            try:
+                return datetime.strptime(prefix, self.fmt)
+            except ValueError:
+                pass
+        return parser.parse(prefix, fuzzy=True)
+
+
+class IsoTimestampDecoder(TimestampDecoder):
+    """
+    Декодер даты и времени в формате ISO 8601 со смещением часового пояса,
+    например, 2025-08-12T14:31:15+03:00 (формат $ISODATE в syslog-ng)
+    """
+    def __init__(self):
+        # Строка декодируется целиком, т.к. может содержать доли секунды
+        super(IsoTimestampDecoder, self).__init__("%Y-%m-%dT%H:%M:%S", 32)
+
+    def _parse(self, prefix):
+        offset = prefix[19:]
+        if len(offset) == 6 and offset[0] in "+-" and offset[3] == ":":
+            try:
+                dt = datetime.strptime(prefix[:19], self.fmt)
+                seconds = (int(offset[1:3]) * 60 + int(offset[4:6])) * 60
+                if offset[0] == "-":
+                    seconds = -seconds
+                return dt.replace(tzinfo=tz.tzoffset(None, seconds))
+            except ValueError:
+                pass
+        return parser.parse(prefix)
+
+
+class Grammar(object):
+    """
+    Правило разбора строки источника: подстрока, без которой строка заведомо
+    не соответствует правилу (проверяется до регулярного выражения),
+    и регулярное выражение с именованными группами, скомпилированное
+    при импорте. Выражения привязаны к началу строки и не содержат
+    вложенных повторений, поэтому время разбора линейно от длины строки
+    """
+    __slots__ = ("literal", "regex")
+
+    def __init__(self, literal, pattern=None):
+        self.literal = literal
+        self.regex = re.compile(pattern) if pattern is not None else None
+
+    def accepts(self, line):
+        return self.literal is None or self.literal in line
+
+    def match(self, line):
+        """
+        Возвращает совпадение (значения групп - match.group("name")) или None,
+        для правила без регулярного выражения - True, если строка содержит подстроку
+        """
+        if self.literal is not None and self.literal not in line:
+            return None
+        if self.regex is None:
+            return True
+        return self.regex.match(line)
+
+    def findall(self, line):
+        """
+        Возвращает все непересекающиеся совпадения кортежами групп,
+        для правила без регулярного выражения - пустой список
+        """
+        if self.regex is None or not self.accepts(line):
+            return []
+        return self.regex.findall(line)
+
+
+# Правила разбора строк всех источников
+GRAMMARS = {
+    # 2025/08/12 14:31:15 new : 0; delete : 0; changed : 3; dangling : 0; ... compare : 48213
+    "afick.counts": Grammar(" : ", r'\b(?P<key>[a-z_]+) : (?P<value>\d+)'),
+    # {"PRIORITY":"info","ISODATE":"...","MSG":{"astra-audit":{...}}}
+    "astra": Grammar('"astra-audit"'),
+    # 2025-Aug-12 14:31:15 [FC-1733] Notice: Threats: LinuxSpider-1548: "/tmp/eicar" - infected with EICAR
+    "drweb.line": Grammar("[FC-", r'^\S+ \S+ \[FC-(?P<pid>\d+)\] \w+: (?P<kind>[A-Za-z ]+): (?P<text>.*)$'),
+    # LinuxSpider-1548: "/tmp/eicar" - infected with EICAR Test File (NOT a Virus!)
+    "drweb.threat": Grammar('" - ', r'^[^"]*"(?P<path>.*)" - (?:infected with )?(?P<threat>.*)$'),
+    # Cannot be cured: "/tmp/eicar"
+    "drweb.path": Grammar('"', r'^[^"]*"(?P<path>.*)"'),
+    # 2025-08-12 14:31:15 CEF:0|Rebus|SOV|3.0|100|Обнаружена сетевая атака|5|sourceServiceName=...
+    "rebus.cef": Grammar("CEF:", r'^[^|]*\|[^|]*\|[^|]*\|[^|]*\|[^|]*\|(?P<name>[^|]*)\|(?P<severity>[^|]*)\|(?P<extension>.*)$'),
+}
+
+
 class EventsParser(object):
     """
     Родительский класс для кастомных парсеров логов
     """
+    # Поля, по которым события считаются повторами, если не заданы,
+    # повторы не подавляются. Переопределяется опцией парсера dedup-keys
+    dedup_keys = ()
+    # Поля, передаваемые парсером в is_duplicate, пусто - парсер
+    # не подавляет повторы и опция dedup-keys не допускается
+    dedup_fields = ()
+    # Заголовок уведомления со сводкой по отброшенным повторам
+    summary_title = "Подавление повторов"
+
     def init(self, options):
         logging.info("%s is running..." % type(self).__name__)
+        # Опции задаются в *.conf, например:
+        # python(class("...") options("dedup-keys" "message_id,host" "dedup-window" "5"));
+        options = options or {}
+        if "dedup-keys" in options:
+            self.dedup_keys = tuple(key.strip() for key in options["dedup-keys"].split(",") if key.strip())
+            unsupported = [key for key in self.dedup_keys if key not in self.dedup_fields]
+            if unsupported:
+                logging.error("%s does not support dedup-keys: %s (supported: %s)"
+                              % (type(self).__name__, ", ".join(unsupported), ", ".join(self.dedup_fields) or "none"))
+                return False
+        self.dedup = None
+        if self.dedup_keys:
+            self.dedup = Deduplicator(int(options.get("dedup-window", DEDUP_WINDOW)))
+        # Опция notification-format "legacy" включает прежний формат уведомлений
+        # с полями, разделенными символом ;, для АРМ-АБИ с необновленным dbus_sender
+        self.legacy_format = options.get("notification-format") == "legacy"
+        # Метрики парсера (см. metrics.py), общие для его экземпляров
+        name = type(self).__name__
+        self.metrics = metrics.REGISTRY.get(("parser", name), lambda: metrics.ParserMetrics(name))
+        # Связанный метод хранится в экземпляре, чтобы не искать его при каждом сообщении
+        self.record_metrics = self.metrics.record
+        metrics.start_exporters(options)
         return True
 
     def parse(self, msg):
         """
-        Наследники должны обработать msg["MESSAGE"], сохраненное в  self.message
-        и сформировать msg["notification"], содержащее строку из полей,
-        разделенных символом ; в которой первое поле приоритет,
-        второе - заголовок, последующие - текст уведомления
+        Передает msg["MESSAGE"] в parse_message и формирует msg["notification"]
+        из возвращенных им уведомлений. Состояние разбора сообщения хранится
+        только в локальных переменных, поэтому один экземпляр парсера может
+        вызываться из нескольких потоков syslog-ng одновременно
         """
+        started = metrics.timer()
+        result = metrics.FAILED
+        tick = False
         try:
-            self.message = msg["MESSAGE"]
-            logging.debug('%s recieved message "%s"' % (type(self).__name__, self.message))
+            message = msg["MESSAGE"]
+            logging.debug('%s recieved message "%s"' % (type(self).__name__, message))
+            # Тики источника s_events_tick не являются сообщениями источника
+            # и не учитываются в метриках
+            tick = message == TICK_MESSAGE
+            if tick:
+                notifications = self.flush()
+            else:
+                notifications = self.parse_message(message)
+            if not notifications:
+                result = metrics.FILTERED
+                return False
+            if isinstance(notifications, tuple):
+                notifications = [notifications]
+            self.notify(msg, notifications)
+            result = metrics.PARSED
+            return True
         except Exception as e:
             logging.exception(e)
             return False
+        finally:
+            if not tick:
+                self.record_metrics(result, metrics.timer() - started)
+
+    def parse_message(self, message):
+        """
+        Наследники должны разобрать текст сообщения и вернуть кортеж
+        (приоритет, заголовок, дата и время события, список строк текста) для notify,
+        список таких кортежей (например, событие и события, завершенные
+        по истечении окна корреляции) или None, если уведомление не требуется.
+        Общие для всех сообщений объекты (окно подавления повторов и т.п.)
+        должны защищаться блокировкой
+        """
+        raise NotImplementedError
+
+    def flush(self):
+        """
+        Вызывается по сообщению TICK_MESSAGE, возвращает уведомления, ожидающие
+        отправки без нового события, в том же виде, что и parse_message.
+        По умолчанию - сводку по окнам подавления повторов, закрытым к текущему
+        моменту, иначе о последних отброшенных повторах не сообщалось бы до
+        следующего события. Наследники, накапливающие события, дополняют этот метод
+        """
+        if self.dedup is None:
+            return None
+        dt = self.dedup.current_time()
+        if dt is None:
+            return None
+        summary = self.suppressed_summary(dt)
+        if not summary:
+            return None
+        return "low", self.summary_title, dt, summary
+
+    def notify(self, msg, notifications):
+        """
+        Формирует msg["notification"] из кортежей (приоритет (low, normal, critical),
+        заголовок, дата и время события, строки текста) с именем хоста,
+        несколько уведомлений передаются одним сообщением по одному в строке
+        """
+        msg["notification"] = "\n".join(
+            notification_codec.encode(priority, title, dt, hostname, lines, legacy=self.legacy_format)
+            for priority, title, dt, lines in notifications)
+
+    def is_duplicate(self, dt, fields):
+        """
+        Возвращает True, если событие с полями fields (словарь) является
+        повтором события, полученного в пределах окна подавления
+        """
+        if self.dedup is None:
+            return False
+        key = tuple(fields.get(name, "") for name in self.dedup_keys)
+        return not self.dedup.check(key, dt)
+
+    def suppressed_summary(self, dt):
+        """
+        Возвращает строки сводки по закрытым к моменту dt окнам подавления повторов
+        """
+        if self.dedup is None:
+            return []
+        return ["Подавлено похожих событий: %d (%s)" % (count, ", ".join(key))
+                for key, count in self.dedup.summary(dt)]
+
+    def parse_batch(self, msgs):
+        """
+        Обрабатывает последовательность сообщений, возвращает список
+        результатов parse для каждого сообщения.
+        Используется при повторной обработке сохраненных логов
+        """
+        parse = self.parse
+        return [parse(msg) for msg in msgs]
 
     def deinit(self):
         logging.info("%s is stoped..." % type(self).__name__)
         return True
+
+
+class TestGrammars(unittest.TestCase):
+
+    def test_afick_counts(self):
+        line = "2025/08/12 14:31:15 new : 0; delete : 1; changed : 3; dangling : 0; compare : 48213"
+        self.assertEqual(dict(GRAMMARS["afick.counts"].findall(line)),
+                         {"new": "0", "delete": "1", "changed": "3", "dangling": "0", "compare": "48213"})
+        self.assertEqual(GRAMMARS["afick.counts"].findall("2025/08/12 14:31:15 afick started"), [])
+
+    def test_literal_only_grammar(self):
+        grammar = GRAMMARS["astra"]
+        line = '{"PRIORITY":"info","MSG":{"astra-audit":{"message_id":"42"}}}'
+        self.assertTrue(grammar.accepts(line))
+        self.assertTrue(grammar.match(line))
+        self.assertIsNone(grammar.match('{"PRIORITY":"info","MSG":{"cron":{}}}'))
+        self.assertEqual(grammar.findall(line), [])
+
+    def test_drweb(self):
+        line = GRAMMARS["drweb.line"].match('2025-Aug-12 14:31:15 [FC-1733] Notice: Threats: LinuxSpider-1548:'
+                                           ' "/tmp/eicar" - infected with EICAR Test File (NOT a Virus!)')
+        self.assertEqual(line.group("pid", "kind"), ("1733", "Threats"))
+        threat = GRAMMARS["drweb.threat"].match(line.group("text"))
+        self.assertEqual(threat.group("path", "threat"), ("/tmp/eicar", "EICAR Test File (NOT a Virus!)"))
+        self.assertEqual(GRAMMARS["drweb.path"].match('Cannot be cured: "/tmp/eicar"').group("path"), "/tmp/eicar")
+        self.assertIsNone(GRAMMARS["drweb.line"].match("2025-Aug-12 14:31:15 Dr.Web started"))
+
+    def test_rebus_cef(self):
+        cef = GRAMMARS["rebus.cef"].match("2025-08-12 14:31:15 CEF:0|Rebus|SOV|3.0|100|Attack|5|"
+                                          "sourceServiceName=Agent src=10.0.0.1 msg=a|b")
+        self.assertEqual(cef.group("name", "severity", "extension"),
+                         ("Attack", "5", "sourceServiceName=Agent src=10.0.0.1 msg=a|b"))
+        self.assertIsNone(GRAMMARS["rebus.cef"].match("2025-08-12 14:31:15 plain text"))
+
+
+    def test_long_quoted_path(self):
+        # Время разбора линейно от длины строки (см. benchmarks/grammars.py), строки
+        # длиной 64 КБ разбираются сразу, прежнее выражение Dr.Web на них зависало
+        prefix = "2025-Aug-12 14:31:15 [FC-1733] Notice: Threats: X: "
+        path = "/" + "a" * 65536
+        line = GRAMMARS["drweb.line"].match('%s"%s" - infected with Y' % (prefix, path))
+        self.assertEqual(GRAMMARS["drweb.threat"].match(line.group("text")).group("path", "threat"), (path, "Y"))
+        line = GRAMMARS["drweb.line"].match('%s"%s' % (prefix, path))
+        self.assertIsNone(GRAMMARS["drweb.threat"].match(line.group("text")))
+        self.assertIsNone(GRAMMARS["drweb.path"].match(line.group("text")))
+        line = GRAMMARS["drweb.line"].match(prefix + ": " * 32768)
+        self.assertIsNone(GRAMMARS["drweb.threat"].match(line.group("text")))
+        self.assertEqual(GRAMMARS["afick.counts"].findall("2025/08/12 14:31:15 " + "a" * 65536 + " : x"), [])
+        self.assertIsNone(GRAMMARS["rebus.cef"].match("2025-08-12 14:31:15 CEF:0|a|b|c|d|" + "x" * 65536))
+
+    def test_fuzz(self):
+        # Случайные строки из служебных символов форматов не должны приводить к исключениям
+        generator = random.Random(2)
+        alphabet = ' "|=:;[]-\\/FCabc019'
+        for _ in range(300):
+            line = "".join(generator.choice(alphabet) for _ in range(generator.randint(0, 200)))
+            for grammar in GRAMMARS.values():
+                grammar.match(line)
+                grammar.findall(line)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,316 @@
+# -*- coding: utf-8 -*-
+"""
+Метрики парсеров событий и точки назначения DbusSender в текстовом формате
+Prometheus. Все классы syslog-ng на Python работают в одном интерпретаторе,
+поэтому метрики собираются в общем реестре REGISTRY и выводятся
+периодически в файл (для textfile-коллектора node_exporter)
+и, если задан порт, по HTTP на локальном адресе: curl http://127.0.0.1:9477/metrics
+
+Обновление метрик на пути обработки сообщения - увеличение счетчиков потока
+без блокировки, значения суммируются и форматируются только при выводе
+"""
+
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+# Часы для измерения длительности: в Python 2.7 нет time.perf_counter
+timer = getattr(time, "perf_counter", time.time)
+
+# Файл, в который выводятся метрики, пусто - не выводить
+METRICS_FILE = "/var/lib/syslog-ng/python-metrics.prom"
+# Интервал (сек) вывода метрик в файл
+METRICS_INTERVAL = 15
+# Границы интервалов (сек) гистограмм длительности
+BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+FIRST_BUCKET = BUCKETS[0]
+
+# Описания и типы метрик
+FAMILIES = {
+    "events_parser_messages_total": ("counter", "Messages passed to the parser"),
+    "events_parser_parsed_total": ("counter", "Messages turned into notifications"),
+    "events_parser_filtered_total": ("counter", "Messages that did not produce a notification"),
+    "events_parser_failed_total": ("counter", "Messages that raised an exception"),
+    "events_parser_parse_seconds": ("histogram", "Time spent parsing one message"),
+    "dbus_sender_messages_total": ("counter", "Messages received by the destination"),
+    "dbus_sender_retried_total": ("counter", "Messages returned to syslog-ng because the queue was full"),
+    "dbus_sender_sent_total": ("counter", "Messages taken from the queue by the dispatch thread"),
+    "dbus_sender_signals_total": ("counter", "Notify signals emitted (coalesced notifications)"),
+    "dbus_sender_queue_depth": ("gauge", "Messages waiting in the dispatch queue"),
+    "dbus_sender_signal_seconds": ("histogram", "Time spent emitting one Notify signal"),
+    "dbus_sender_stored_total": ("counter", "Notifications written to the event store"),
+    "dbus_sender_store_dropped_total": ("counter", "Notifications not stored because the store queue was full"),
+}
+
+
+def _format_labels(labels):
+    return "{%s}" % ",".join('%s="%s"' % (name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+                             for name, value in labels) if labels else ""
+
+
+class Counters(object):
+    """
+    Счетчики, увеличиваемые без блокировки: каждый поток syslog-ng увеличивает
+    собственную копию счетчиков, в которую не пишут другие потоки,
+    при выводе копии всех потоков суммируются
+    """
+    def __init__(self, size):
+        self.size = size
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.shards = []
+
+    def shard(self):
+        """
+        Возвращает копию счетчиков текущего потока (список)
+        """
+        try:
+            return self.local.shard
+        except AttributeError:
+            shard = self.local.shard = [0] * self.size
+            with self.lock:
+                self.shards.append(shard)
+            return shard
+
+    def totals(self):
+        with self.lock:
+            shards = list(self.shards)
+        if not shards:
+            return [0] * self.size
+        return [sum(values) for values in zip(*shards)]
+
+
+def histogram_samples(name, labels, counts, total):
+    """
+    Возвращает строки гистограммы по числу значений в интервалах BUCKETS
+    (последний элемент counts - число значений больше последней границы)
+    и сумме значений total
+    """
+    cumulative = 0
+    for bound, count in zip(BUCKETS, counts):
+        cumulative += count
+        yield name + "_bucket", labels + (("le", repr(bound)),), cumulative
+    cumulative += counts[-1]
+    yield name + "_bucket", labels + (("le", "+Inf"),), cumulative
+    yield name + "_sum", labels, total
+    yield name + "_count", labels, cumulative
+
+
+# Расположение счетчиков: число сообщений по результату разбора (разобрано,
+# отфильтровано, ошибка), число значений длительности в интервалах BUCKETS и их сумма
+PARSED, FILTERED, FAILED = 0, 1, 2
+BUCKETS_OFFSET = 3
+SUM_INDEX = BUCKETS_OFFSET + len(BUCKETS) + 1
+
+
+class ParserMetrics(object):
+    """
+    Метрики одного парсера: число сообщений по результату разбора и время разбора
+    """
+    def __init__(self, parser):
+        self.labels = (("parser", parser),)
+        self.counters = Counters(SUM_INDEX + 1)
+        # Хранилище копий счетчиков потоков, чтобы не обращаться к нему через counters
+        self.local = self.counters.local
+
+    def record(self, result, seconds):
+        try:
+            shard = self.local.shard
+        except AttributeError:
+            shard = self.counters.shard()
+        shard[result] += 1
+        # Разбор большинства сообщений короче первой границы, поиск интервала не нужен
+        if seconds <= FIRST_BUCKET:
+            shard[BUCKETS_OFFSET] += 1
+        else:
+            shard[BUCKETS_OFFSET + bisect_left(BUCKETS, seconds)] += 1
+        shard[SUM_INDEX] += seconds
+
+    def results(self):
+        """
+        Возвращает число разобранных, отфильтрованных сообщений и сообщений с ошибкой
+        """
+        return self.counters.totals()[:BUCKETS_OFFSET]
+
+    def samples(self):
+        totals = self.counters.totals()
+        parsed, filtered, failed = totals[:BUCKETS_OFFSET]
+        yield "events_parser_messages_total", self.labels, parsed + filtered + failed
+        yield "events_parser_parsed_total", self.labels, parsed
+        yield "events_parser_filtered_total", self.labels, filtered
+        yield "events_parser_failed_total", self.labels, failed
+        for sample in histogram_samples("events_parser_parse_seconds", self.labels,
+                                        totals[BUCKETS_OFFSET:SUM_INDEX], totals[SUM_INDEX]):
+            yield sample
+
+
+# Расположение счетчиков DbusSender: число принятых сообщений,
+# число сигналов в интервалах длительности BUCKETS и сумма длительностей
+SIGNALS_OFFSET = 1
+SIGNALS_SUM_INDEX = SIGNALS_OFFSET + len(BUCKETS) + 1
+
+
+class SenderMetrics(object):
+    """
+    Метрики точки назначения DbusSender. Число отправленных и отклоненных
+    сообщений и длина очереди берутся из потока отправки при выводе
+    """
+    def __init__(self):
+        self.counters = Counters(SIGNALS_SUM_INDEX + 1)
+        self.dispatcher = None
+        self.store = None
+
+    def received(self):
+        self.counters.shard()[0] += 1
+
+    def signal(self, seconds):
+        shard = self.counters.shard()
+        shard[SIGNALS_OFFSET + bisect_left(BUCKETS, seconds)] += 1
+        shard[SIGNALS_SUM_INDEX] += seconds
+
+    def samples(self):
+        totals = self.counters.totals()
+        yield "dbus_sender_messages_total", (), totals[0]
+        yield "dbus_sender_signals_total", (), sum(totals[SIGNALS_OFFSET:SIGNALS_SUM_INDEX])
+        dispatcher = self.dispatcher
+        if dispatcher is not None:
+            yield "dbus_sender_retried_total", (), dispatcher.dropped
+            yield "dbus_sender_sent_total", (), dispatcher.sent
+            yield "dbus_sender_queue_depth", (), dispatcher.depth()
+        store = self.store
+        if store is not None:
+            yield "dbus_sender_stored_total", (), store.stored
+            yield "dbus_sender_store_dropped_total", (), store.dropped
+        for sample in histogram_samples("dbus_sender_signal_seconds", (),
+                                        totals[SIGNALS_OFFSET:SIGNALS_SUM_INDEX], totals[SIGNALS_SUM_INDEX]):
+            yield sample
+
+
+class Registry(object):
+    """
+    Реестр источников метрик - объектов с методом samples(),
+    возвращающим кортежи (имя, метки, значение)
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sources = {}
+
+    def get(self, key, factory):
+        """
+        Возвращает источник метрик с ключом key, создавая его вызовом factory().
+        Экземпляры одного класса и экземпляры, созданные после перезагрузки
+        конфигурации syslog-ng, используют общий источник, поэтому счетчики не сбрасываются
+        """
+        with self.lock:
+            source = self.sources.get(key)
+            if source is None:
+                source = self.sources[key] = factory()
+        return source
+
+    def render(self):
+        """
+        Возвращает метрики в текстовом формате Prometheus
+        """
+        with self.lock:
+            sources = list(self.sources.values())
+        families = {}
+        for source in sources:
+            for name, labels, value in source.samples():
+                family = name
+                for suffix in ("_bucket", "_sum", "_count"):
+                    if name.endswith(suffix) and name[:-len(suffix)] in FAMILIES:
+                        family = name[:-len(suffix)]
+                families.setdefault(family, []).append("%s%s %s" % (name, _format_labels(labels), value))
+        lines = []
+        for family in sorted(families):
+            kind, description = FAMILIES.get(family, ("untyped", family))
+            lines.append("# HELP %s %s" % (family, description))
+            lines.append("# TYPE %s %s" % (family, kind))
+            lines.extend(families[family])
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class FileExporter(threading.Thread):
+    """
+    Поток, периодически записывающий метрики в файл
+    """
+    def __init__(self, path, interval=METRICS_INTERVAL, registry=REGISTRY):
+        super(FileExporter, self).__init__(name="metrics-file")
+        self.daemon = True
+        self.path = path
+        self.interval = interval
+        self.registry = registry
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.flush()
+
+    def flush(self):
+        try:
+            # Запись во временный файл и переименование, чтобы коллектор
+            # не прочитал недописанный файл
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "w") as metrics_file:
+                metrics_file.write(self.registry.render())
+            os.rename(temp_path, self.path)
+        except (IOError, OSError) as e:
+            logging.warning("metrics file %s is not available: %s" % (self.path, e))
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_exporters = {}
+_exporters_lock = threading.Lock()
+
+
+def start_exporters(options):
+    """
+    Запускает вывод метрик в файл (опции metrics-file и metrics-interval)
+    и по HTTP на 127.0.0.1 (опция metrics-port), если они еще не запущены.
+    Вызывается из init каждого парсера и точки назначения
+    """
+    options = options or {}
+    with _exporters_lock:
+        path = options.get("metrics-file", METRICS_FILE)
+        if path and "file" not in _exporters:
+            exporter = _exporters["file"] = FileExporter(path, float(options.get("metrics-interval",
+                                                                                 METRICS_INTERVAL)))
+            exporter.start()
+        port = int(options.get("metrics-port", 0))
+        if port and "http" not in _exporters:
+            try:
+                server = HTTPServer(("127.0.0.1", port), MetricsHandler)
+            except (IOError, OSError) as e:
+                logging.warning("metrics endpoint on port %d is not available: %s" % (port, e))
+                return
+            thread = threading.Thread(target=server.serve_forever, name="metrics-http")
+            thread.daemon = True
+            thread.start()
+            _exporters["http"] = server
+            logging.info("metrics are available at http://127.0.0.1:%d/metrics" % port)
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+# Версия формата уведомлений, увеличивается при несовместимых изменениях
+VERSION = 1
+# Формат даты и времени события в уведомлении
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Уведомление передается объектом JSON с короткими ключами
+# (одно сообщение syslog-ng может содержать несколько уведомлений, по одному в строке):
+# v - версия формата, p - приоритет (low, normal, critical), t - заголовок,
+# ts - дата и время события, h - имя хоста, b - список строк текста уведомления
+SEPARATORS = (",", ":")
+
+
+def _native(value):
+    # В Python 2.7 json возвращает unicode, который приводится к str в кодировке utf-8
+    if str is bytes and not isinstance(value, str) and value is not None:
+        return value.encode("utf-8")
+    return value
+
+
+class Notification(object):
+    __slots__ = ("priority", "title", "time", "host", "lines")
+
+    def __init__(self, priority, title, time=None, host=None, lines=()):
+        self.priority = priority
+        self.title = title
+        self.time = time
+        self.host = host
+        self.lines = list(lines)
+
+    def text(self):
+        """
+        Возвращает текст уведомления: дату и время, имя хоста и строки текста
+        """
+        return "\n".join([field for field in (self.time, self.host) if field] + self.lines)
+
+
+def encode(priority, title, time, host, lines, legacy=False):
+    """
+    Возвращает строку уведомления в формате JSON, а если legacy=True -
+    в прежнем формате с полями, разделенными символом ;
+    (для АРМ-АБИ, на котором еще не обновлен dbus_sender)
+    """
+    if hasattr(time, "strftime"):
+        time = time.strftime(TIME_FORMAT)
+    if legacy:
+        return ";".join([priority, title] + [field for field in (time, host) if field] + list(lines))
+    line = json.dumps({"v": VERSION, "p": priority, "t": title, "ts": time, "h": host, "b": list(lines)},
+                      ensure_ascii=False, separators=SEPARATORS)
+    return _native(line)
+
+
+def decode(line):
+    """
+    Возвращает уведомление, полученное из строки в формате JSON или в прежнем формате
+    с полями, разделенными символом ;, в котором первое поле приоритет,
+    второе - заголовок, последующие - текст уведомления
+    """
+    if line.startswith("{"):
+        record = json.loads(line)
+        if record.get("v", 0) > VERSION:
+            raise ValueError("unsupported notification format version %s" % record["v"])
+        return Notification(_native(record["p"]),
+                            _native(record["t"]),
+                            _native(record.get("ts")),
+                            _native(record.get("h")),
+                            [_native(field) for field in record.get("b", ())])
+    fields = line.split(";")
+    if len(fields) < 2:
+        raise ValueError("malformed notification: %r" % line)
+    return Notification(fields[0], fields[1], lines=fields[2:])
+
+
+def decode_all(payload):
+    """
+    Возвращает уведомления из сообщения, содержащего одно или несколько
+    уведомлений, по одному в строке
+    """
+    return [decode(line) for line in payload.split("\n") if line.strip()]
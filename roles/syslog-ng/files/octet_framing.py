@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+# Разбиение потока TCP на сообщения по RFC 6587 (octet-counting):
+# каждое сообщение предваряется его длиной в байтах и пробелом, например "11 hello world".
+# В этом формате сообщения передает и принимает драйвер syslog() в syslog-ng
+
+# Максимальная длина сообщения, более длинный кадр считается признаком
+# рассинхронизации потока (соответствует log-msg-size в syslog-ng по умолчанию)
+MAX_FRAME_SIZE = 65536
+
+
+def encode_frame(message):
+    """
+    Возвращает сообщение (str или bytes), предваренное его длиной в байтах
+    """
+    if not isinstance(message, bytes):
+        message = message.encode("utf-8")
+    return str(len(message)).encode("ascii") + b" " + message
+
+
+def encode_frames(messages):
+    """
+    Возвращает пачку сообщений одним блоком байт для отправки одним вызовом
+    """
+    return b"".join(encode_frame(message) for message in messages)
+
+
+class FrameDecoder(object):
+    """
+    Инкрементальный разбор потока байт на сообщения: данные передаются
+    в feed частями произвольной длины, по мере получения которых
+    возвращаются полностью полученные сообщения
+    """
+    def __init__(self, max_frame_size=MAX_FRAME_SIZE):
+        self.max_frame_size = max_frame_size
+        self.buffer = b""
+
+    def feed(self, data):
+        buffer = self.buffer + data if self.buffer else data
+        messages = []
+        pos = 0
+        while True:
+            space = buffer.find(b" ", pos, pos + 8)
+            if space < 0:
+                if len(buffer) - pos >= 8:
+                    raise ValueError("malformed frame header: %r" % buffer[pos:pos + 8])
+                break
+            size = int(buffer[pos:space])
+            if size > self.max_frame_size:
+                raise ValueError("frame size %d exceeds %d" % (size, self.max_frame_size))
+            end = space + 1 + size
+            if end > len(buffer):
+                break
+            messages.append(buffer[space + 1:end])
+            pos = end
+        self.buffer = buffer[pos:]
+        return messages
@@ -2,41 +2,66 @@
 
 import logging
 import re
-from dateutil import parser
 
-from events_parser import EventsParser, hostname
+from events_parser import EventsParser, TimestampDecoder, GRAMMARS, hostname
+
+# Сообщение в формате CEF: 7 полей заголовка, разделенных символом |,
+# и расширение из пар ключ=значение, разделенных пробелами.
+# Значение может содержать пробелы и продолжается до следующего ключа,
+# символ = внутри значения экранируется обратной косой чертой
+EXTENSION_RE = re.compile(r'([A-Za-z0-9_]+)=((?:[^\\=]|\\.)*?)(?= [A-Za-z0-9_]+=|$)')
+
+# Заголовок уведомления, если в сообщении нет поля sourceServiceName
+DEFAULT_TITLE = "Ребус-СОВ"
+
+
+def parse_extension(params):
+    """
+    Возвращает словарь полей расширения CEF, разобранных за один проход
+    """
+    if "\\=" in params:
+        # Редкий случай экранированного символа = в значении
+        return dict(EXTENSION_RE.findall(params))
+    # Между соседними символами = находятся значение предыдущего ключа
+    # и, после последнего пробела, следующий ключ
+    parts = params.split("=")
+    fields = {}
+    key = parts[0]
+    for part in parts[1:-1]:
+        value, _, next_key = part.rpartition(" ")
+        fields[key] = value
+        key = next_key
+    fields[key] = parts[-1]
+    return fields
 
 
 class RebusEventsParser(EventsParser):
-    def parse(self, msg):
-        try:
-            super(RebusEventsParser, self).parse(msg)
-            # Первые 20 символов сообщения это дата и время
-            dt = parser.parse(self.message[:20], fuzzy=True)
-
-            # Текст и параметры сообщения (6 поле - какое-то цифровое значение)
-            event, _, params = self.message.split('|')[5:8]
-
-            # Список в котором элементы соответствуют индексам
-            # первых символов названия переменных
-            indexes = [match.start() for match in re.finditer(r'([a-zA-Z0-9_]*)=', params)]
-            indexes.append(len(params))
-
-            # Добавить в глобальную область видимости переменные
-            # из последнего поля сообщения
-            for i in range(len(indexes)-1):
-                key, value = params[indexes[i]:indexes[i+1]-1].split("=")
-                globals()[key] = value
-
-            # TODO Разобраться в каком поле сообщения задается уровень важности
-            # и преобразовать его в priority
-            priority = "low"
-            title = sourceServiceName
-            body = ";".join((dt.strftime("%Y-%m-%d %H:%M:%S"),
-                             hostname,
-                             event))
-            msg["notification"] = ";".join((priority, title, body))
-            return True
-        except Exception as e:
-            logging.exception(e)
-            return False
+    # Первые 20 символов сообщения это дата и время, формат которых
+    # не зафиксирован, поэтому для разбора используется только dateutil.parser
+    timestamp = TimestampDecoder(None, 20)
+    # Повторы подавляются, если задана опция dedup-keys, например "name,title"
+    dedup_fields = ("name", "title", "host", "priority")
+    summary_title = DEFAULT_TITLE
+
+    def parse_message(self, message):
+        dt = self.timestamp.decode(message)
+
+        # Текст (name) и параметры (extension) сообщения, поле severity - какое-то
+        # цифровое значение, расширение может содержать символ |
+        cef = GRAMMARS["rebus.cef"].match(message)
+        if cef is None:
+            return None
+        event = cef.group("name")
+        fields = parse_extension(cef.group("extension"))
+
+        # TODO Разобраться в каком поле сообщения задается уровень важности
+        # и преобразовать его в priority
+        priority = "low"
+        title = fields.get("sourceServiceName", DEFAULT_TITLE)
+        if self.is_duplicate(dt, {"name": event, "title": title, "host": hostname, "priority": priority}):
+            logging.debug('%s skiped similar message: "%s"' % (type(self).__name__, event))
+            summary = self.suppressed_summary(dt)
+            if not summary:
+                return None
+            return "low", title, dt, summary
+        return priority, title, dt, [event] + self.suppressed_summary(dt)
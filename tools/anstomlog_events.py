@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+Сводка по журналам событий callback-плагина anstomlog (опция event_log):
+запуски, число результатов по статусам, самые долгие задачи и хосты
+с ошибками. Файлы читаются построчно, в памяти хранятся только итоги
+по запускам, задачам и хостам, поэтому архив многих запусков
+(в том числе сжатый gzip) обрабатывается без загрузки целиком
+
+python tools/anstomlog_events.py events.ndjson [archive/*.ndjson.gz ...]
+    [--run RUN] [--since 2025-08-01] [--host HOST] [--top 10]
+"""
+
+from __future__ import print_function
+
+import argparse
+import gzip
+import io
+import json
+import sys
+
+STATUSES = ("ok", "changed", "skipped", "failed", "unreachable")
+
+
+def open_log(path):
+    if path == "-":
+        return sys.stdin
+    if path.endswith(".gz"):
+        return io.TextIOWrapper(gzip.open(path), encoding="utf-8")
+    return io.open(path, encoding="utf-8")
+
+
+def iter_records(paths, stats):
+    for path in paths:
+        with open_log(path) as log:
+            for line in log:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # Незавершенная запись в конце журнала прерванного запуска
+                    stats["malformed"] += 1
+
+
+class Summary(object):
+    def __init__(self):
+        self.statuses = dict.fromkeys(STATUSES, 0)
+        # запуск -> [сценарий, первое событие, последнее событие, хосты, хосты с ошибками]
+        self.runs = {}
+        # задача -> [число результатов, суммарная длительность, максимальная длительность, ошибки]
+        self.tasks = {}
+        # хост -> число ошибок
+        self.failed_hosts = {}
+
+    def add(self, record):
+        status = record.get("status")
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        failed = status in ("failed", "unreachable")
+
+        run = self.runs.get(record["run"])
+        if run is None:
+            run = self.runs[record["run"]] = [record.get("playbook"), record["ts"], record["ts"], set(), set()]
+        run[1] = min(run[1], record["ts"])
+        run[2] = max(run[2], record["ts"])
+        run[3].add(record["host"])
+        if failed:
+            run[4].add(record["host"])
+
+        name = record["task"]
+        if record.get("role"):
+            name = "%s : %s" % (record["role"], name)
+        task = self.tasks.get(name)
+        if task is None:
+            task = self.tasks[name] = [0, 0.0, 0.0, 0]
+        task[0] += 1
+        task[1] += record["duration"]
+        task[2] = max(task[2], record["duration"])
+        if failed:
+            task[3] += 1
+            self.failed_hosts[record["host"]] = self.failed_hosts.get(record["host"], 0) + 1
+
+    def report(self, top):
+        print("Результатов: %d (%s)" % (sum(self.statuses.values()), ", ".join(
+            "%s=%d" % item for item in sorted(self.statuses.items()))))
+
+        print("\nЗапуски:")
+        for run, (playbook, first, last, hosts, failed) in sorted(self.runs.items(), key=lambda item: item[1][1]):
+            print("  %s  %s  %s .. %s  хостов: %d, с ошибками: %d"
+                  % (run, playbook or "-", first[:19], last[:19], len(hosts), len(failed)))
+
+        print("\nСамые долгие задачи (суммарно по хостам):")
+        for name, (count, total, longest, failures) in sorted(
+                self.tasks.items(), key=lambda item: item[1][1], reverse=True)[:top]:
+            print("  %10.1fs  среднее %7.2fs  макс. %7.2fs  ошибок %4d  %s"
+                  % (total, total / count, longest, failures, name))
+
+        if self.failed_hosts:
+            print("\nХосты с ошибками:")
+            for host, count in sorted(self.failed_hosts.items(), key=lambda item: item[1], reverse=True)[:top]:
+                print("  %6d  %s" % (count, host))
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Сводка по журналам событий anstomlog")
+    arg_parser.add_argument("paths", nargs="+", help="файлы журнала (.ndjson, .ndjson.gz или - для stdin)")
+    arg_parser.add_argument("--run", help="только указанный запуск")
+    arg_parser.add_argument("--since", help="только события не ранее указанного времени (ISO 8601)")
+    arg_parser.add_argument("--host", help="только указанный хост")
+    arg_parser.add_argument("--top", type=int, default=10)
+    args = arg_parser.parse_args()
+
+    stats = {"malformed": 0}
+    summary = Summary()
+    for record in iter_records(args.paths, stats):
+        if args.run and record["run"] != args.run:
+            continue
+        if args.since and record["ts"] < args.since:
+            continue
+        if args.host and record["host"] != args.host:
+            continue
+        summary.add(record)
+    summary.report(args.top)
+    if stats["malformed"]:
+        print("\nПропущено поврежденных записей: %d" % stats["malformed"], file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()